@@ -81,6 +81,10 @@ class ApiKeyAuthzMiddleware(BaseAuthzMiddleware):
         # Require API key check on the experiment_result router
         return [self._dep_check_api_key()]
 
+    def dep_gene_lengths_router(self) -> Sequence[Depends]:
+        # Require API key check on the gene_lengths router
+        return [self._dep_check_api_key()]
+
     def dep_authz_normalize(self) -> Sequence[Depends]:
         return [self._dep_check_api_key()]
 
@@ -78,5 +78,14 @@ class BentoAuthzMiddleware(FastApiAuthMiddleware, BaseAuthzMiddleware):
     def dep_authz_expressions_list(self):
         return [self._dep_perm_data_everything(P_QUERY_DATA)]
 
+    # GENE LENGTHS router paths
+
+    def dep_authz_ingest_gene_lengths(self):
+        # Gene lengths are reference data shared by all the experiments of an assembly
+        return [self._dep_perm_data_everything(P_INGEST_DATA)]
+
+    def dep_authz_delete_gene_lengths(self):
+        return [self._dep_perm_data_everything(P_DELETE_DATA)]
+
 
 authz_middleware = BentoAuthzMiddleware.build_from_fastapi_pydantic_config(config, logger)
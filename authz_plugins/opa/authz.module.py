@@ -89,5 +89,11 @@ class OPAAuthzMiddleware(BaseAuthzMiddleware):
     def dep_authz_get_experiment_result(self):
         return [self._dep_check_opa()]
 
+    def dep_authz_ingest_gene_lengths(self):
+        return [self._dep_check_opa()]
+
+    def dep_authz_delete_gene_lengths(self):
+        return [self._dep_check_opa()]
+
 
 authz_middleware = OPAAuthzMiddleware(config, logger)
@@ -41,12 +41,19 @@ async def db_cleanup(db: Database):
     async with db.connect() as conn:
         await conn.execute(
             """
+            DROP VIEW IF EXISTS active_gene_expressions;
+            DROP TABLE IF EXISTS ingestions;
+            DROP TABLE IF EXISTS normalization_factors;
+            DROP TABLE IF EXISTS normalization_runs;
+            DROP TABLE IF EXISTS normalized_expressions;
             DROP TABLE IF EXISTS gene_expressions;
+            DROP TABLE IF EXISTS gene_lengths;
             DROP TABLE IF EXISTS experiment_results;
             
             DROP INDEX IF EXISTS idx_gene_code;
             DROP INDEX IF EXISTS idx_sample_id;
             DROP INDEX IF EXISTS idx_experiment_result_id;
+            DROP INDEX IF EXISTS idx_experiment_sample_id;
             """
         )
     await db.close()
@@ -56,7 +63,7 @@ async def db_cleanup(db: Database):
 async def db_truncate_expressions(db: Database):
     # Cleans gene_expressions table
     async with db.connect() as conn:
-        await conn.execute("TRUNCATE gene_expressions;")
+        await conn.execute("TRUNCATE gene_expressions CASCADE;")
 
 
 @pytest_asyncio.fixture
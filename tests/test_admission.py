@@ -0,0 +1,109 @@
+import asyncio
+import gzip
+from io import BytesIO
+import pytest
+from fastapi import HTTPException, status
+from fastapi.testclient import TestClient
+
+from tests.test_db import TEST_EXPERIMENT_RESULT_ID
+from tests.test_ingest import RCM_FILE_PATH
+from transcriptomics_data_service.admission import (
+    COMPRESSION_RATIO,
+    UPLOAD_MEMORY_FACTOR,
+    MemoryAdmissionController,
+    estimate_upload_memory,
+    get_admission_controller,
+)
+from transcriptomics_data_service.logger import get_logger
+from transcriptomics_data_service.config import get_config
+
+logger = get_logger(get_config())
+
+
+@pytest.mark.asyncio
+async def test_admission_queues_jobs():
+    controller = MemoryAdmissionController(100, max_wait=5, retry_after=1, logger=logger)
+    order = []
+
+    async def job(name: str, n_bytes: int):
+        async with controller.reserve(n_bytes, name):
+            order.append(f"start {name}")
+            await asyncio.sleep(0.05)
+            order.append(f"end {name}")
+
+    # The second job waits for the first one, the third one fits alongside the first one
+    await asyncio.gather(job("A", 60), job("B", 60), job("C", 40))
+    assert order.index("start B") > order.index("end A")
+    assert order.index("start C") < order.index("end A")
+    assert controller.reserved == 0
+
+    # Jobs larger than the budget run alone
+    async with controller.reserve(1000, "large job"):
+        assert controller.reserved == 100
+
+
+@pytest.mark.asyncio
+async def test_admission_rejects_after_max_wait():
+    controller = MemoryAdmissionController(100, max_wait=0.05, retry_after=7, logger=logger)
+    async with controller.reserve(80, "first job"):
+        with pytest.raises(HTTPException) as e:
+            async with controller.reserve(30, "second job"):
+                pass  # pragma: no cover
+    assert e.value.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert e.value.headers == {"Retry-After": "7"}
+    assert controller.reserved == 0
+
+
+@pytest.mark.asyncio
+async def test_admission_disabled():
+    controller = MemoryAdmissionController(None, max_wait=0, retry_after=1, logger=logger)
+    async with controller.reserve(1 << 40, "job"):
+        assert controller.reserved == 0
+
+
+def test_estimate_upload_memory():
+    data = b"gene,S1\nG1,1\n" * 100
+    file = BytesIO(data)
+    assert estimate_upload_memory([file]) == len(data) * UPLOAD_MEMORY_FACTOR
+    assert file.tell() == 0
+
+    compressed = gzip.compress(data)
+    assert estimate_upload_memory([BytesIO(compressed)]) == len(compressed) * COMPRESSION_RATIO * UPLOAD_MEMORY_FACTOR
+
+
+def _full_controller() -> MemoryAdmissionController:
+    controller = MemoryAdmissionController(1 << 20, max_wait=0, retry_after=5, logger=logger)
+    controller.reserved = 1 << 20
+    return controller
+
+
+def _ingest_rcm(client: TestClient, headers, params: dict | None = None):
+    with open(RCM_FILE_PATH, "rb") as file:
+        response = client.post(
+            f"/experiment/{TEST_EXPERIMENT_RESULT_ID}/ingest",
+            params=params,
+            files=[("rcm_file", file)],
+            headers=headers,
+        )
+    return response
+
+
+def test_over_budget(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    assert _ingest_rcm(test_client, authz_headers).status_code == status.HTTP_200_OK
+
+    test_client.app.dependency_overrides[get_admission_controller] = _full_controller
+    try:
+        # Re-ingestions of the same data are skipped without loading it, different parameters are not
+        assert _ingest_rcm(test_client, authz_headers).status_code == status.HTTP_200_OK
+        response = _ingest_rcm(test_client, authz_headers, {"skip_zeros": True})
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response.headers["Retry-After"] == "5"
+
+        response = test_client.post(f"/normalize/{TEST_EXPERIMENT_RESULT_ID}/cpm", headers=authz_headers)
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    finally:
+        test_client.app.dependency_overrides.pop(get_admission_controller)
+
+    # Admitted once memory is available
+    response = test_client.post(f"/normalize/{TEST_EXPERIMENT_RESULT_ID}/cpm", headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
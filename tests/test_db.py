@@ -1,6 +1,6 @@
 import pytest
 from transcriptomics_data_service.db import Database
-from transcriptomics_data_service.models import ExperimentResult, GeneExpression
+from transcriptomics_data_service.models import ExperimentResult, GeneExpression, IngestionStats
 
 TEST_EXPERIMENT_RESULT_ID = "test-experiment-id"
 TEST_EXPERIMENT_RESULT = ExperimentResult(
@@ -67,6 +67,50 @@ async def test_gene_expression(db: Database, db_cleanup):
     assert db_expressions[0] == TEST_GENE_EXPRESSION
 
 
+@pytest.mark.asyncio
+async def test_merge_staged_gene_expressions(db: Database, db_cleanup):
+    zero = TEST_GENE_EXPRESSION.model_copy(update={"raw_count": 0})
+    other = TEST_GENE_EXPRESSION.model_copy(update={"gene_code": "other-gene-code", "tpm_count": 1.5})
+    async with db.transaction_connection() as conn:
+        await db.create_experiment_result(TEST_EXPERIMENT_RESULT, conn)
+        await db.create_or_update_gene_expressions([TEST_GENE_EXPRESSION], conn)
+
+    async with db.transaction_connection() as conn:
+        await db.create_gene_expressions_staging(conn)
+        assert await db.stage_gene_expressions([zero, other], conn) == 2
+        assert await db.merge_staged_gene_expressions(conn, skip_zeros=True, rebuild_indexes=True) == 1
+    await db.analyze_gene_expressions()
+
+    db_expressions, _ = await db.fetch_gene_expressions()
+    assert db_expressions == [other]
+    assert await db.estimate_gene_expressions_rows() == 1
+    async with db.connect() as conn:
+        indexes = await conn.fetch("SELECT indexname FROM pg_indexes WHERE tablename = 'gene_expressions'")
+    assert {"idx_gene_code", "idx_sample_id", "idx_experiment_result_id"} <= {r["indexname"] for r in indexes}
+
+
+@pytest.mark.asyncio
+async def test_diff_staged_gene_expressions(db: Database, db_cleanup):
+    unchanged = TEST_GENE_EXPRESSION.model_copy(update={"gene_code": "unchanged-gene-code"})
+    zero = TEST_GENE_EXPRESSION.model_copy(update={"raw_count": 0})
+    new = TEST_GENE_EXPRESSION.model_copy(update={"gene_code": "new-gene-code"})
+    async with db.transaction_connection() as conn:
+        await db.create_experiment_result(TEST_EXPERIMENT_RESULT, conn)
+        await db.create_or_update_gene_expressions([TEST_GENE_EXPRESSION, unchanged], conn)
+
+    async with db.transaction_connection() as conn:
+        await db.create_gene_expressions_staging(conn)
+        await db.stage_gene_expressions([zero, unchanged, new], conn)
+        stats = await db.diff_staged_gene_expressions(conn, skip_zeros=True)
+    assert stats == IngestionStats(inserted=1, changed=0, unchanged=1, deleted=1)
+
+    async with db.transaction_connection() as conn:
+        await db.create_gene_expressions_staging(conn)
+        await db.stage_gene_expressions([unchanged.model_copy(update={"tpm_count": 1.0})], conn)
+        stats = await db.diff_staged_gene_expressions(conn)
+    assert stats == IngestionStats(inserted=0, changed=1, unchanged=0, deleted=0)
+
+
 # TEST TRANSACTIONS
 @pytest.mark.asyncio
 async def test_transaction(db: Database, db_cleanup):
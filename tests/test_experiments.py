@@ -103,6 +103,35 @@ def test_experiment_samples(test_client, authz_headers, db_with_full_expression:
     assert sample_id in body["samples"]
 
 
+def test_delete_samples(test_client, authz_headers, db_with_full_expression: GeneExpression, db_cleanup):
+    exp_id = db_with_full_expression.experiment_result_id
+    url = f"/experiment/{exp_id}/samples"
+    response = test_client.delete(url, params={"sample_ids": ["unknown"]}, headers=authz_headers)
+    assert response.json()["message"] == "Deleted 0 GeneExpressions"
+
+    response = test_client.delete(
+        url, params={"sample_ids": [db_with_full_expression.sample_id, "unknown"]}, headers=authz_headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["message"] == "Deleted 1 GeneExpressions"
+    response = test_client.post(url, headers=authz_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_delete_samples_404(test_client, authz_headers, db_cleanup):
+    response = test_client.delete(
+        "/experiment/non-existant/samples", params={"sample_ids": ["S1"]}, headers=authz_headers
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_delete_samples_403(test_client, authz_headers_bad):
+    response = test_client.delete(
+        "/experiment/non-existant/samples", params={"sample_ids": ["S1"]}, headers=authz_headers_bad
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
 ###### /experiment/{ID}/features
 def test_experiment_features_not_found(test_client, authz_headers, db_with_experiment, db_cleanup):
     response = test_client.post(
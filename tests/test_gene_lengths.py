@@ -0,0 +1,53 @@
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from tests.test_db import TEST_EXPERIMENT_RESULT
+from tests.test_ingest import RCM_FILE_PATH, TEST_FILES_DIR, _ingest_file
+
+EXP_ID = TEST_EXPERIMENT_RESULT.experiment_result_id
+ASSEMBLY_ID = TEST_EXPERIMENT_RESULT.assembly_id
+GENE_LENGTHS_FILE_PATH = f"{TEST_FILES_DIR}/gene_lengths.csv"
+
+
+def _register_gene_lengths(client: TestClient, headers, data: bytes | None = None):
+    if data is None:
+        with open(GENE_LENGTHS_FILE_PATH, "rb") as file:
+            data = file.read()
+    return client.post(f"/gene-lengths/{ASSEMBLY_ID}", files={"gene_lengths_file": data}, headers=headers)
+
+
+def test_gene_lengths_403(test_client: TestClient, authz_headers_bad):
+    response = _register_gene_lengths(test_client, authz_headers_bad)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_gene_lengths_duplicates(test_client: TestClient, authz_headers, db_cleanup):
+    response = _register_gene_lengths(test_client, authz_headers, b"GeneID,GeneLength\nA,10\nA,20")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_normalize_with_registered_gene_lengths(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    _ingest_file(test_client, file_path=RCM_FILE_PATH, headers=authz_headers)
+
+    # No gene lengths file and none registered for the assembly
+    response = test_client.post(f"/normalize/{EXP_ID}/tpm", headers=authz_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = _register_gene_lengths(test_client, authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = test_client.post(f"/normalize/{EXP_ID}/tpm", headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert "completed" in response.json()["message"]
+
+    # Same gene lengths uploaded as a file: the inputs are unchanged
+    with open(GENE_LENGTHS_FILE_PATH, "rb") as file:
+        response = test_client.post(
+            f"/normalize/{EXP_ID}/tpm", files=[("gene_lengths_file", file)], headers=authz_headers
+        )
+    assert "up to date" in response.json()["message"]
+
+    response = test_client.delete(f"/gene-lengths/{ASSEMBLY_ID}", headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    response = test_client.post(f"/normalize/{EXP_ID}/tpm", headers=authz_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
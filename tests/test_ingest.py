@@ -1,5 +1,12 @@
+import bz2
+import gzip
 import os
+import tarfile
+import zipfile
+from io import BytesIO
 from pathlib import Path
+import pandas as pd
+import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
 
@@ -7,6 +14,9 @@ from tests.conftest import TEST_EXPERIMENT_RESULT
 from transcriptomics_data_service.config import get_config
 from httpx._types import HeaderTypes
 
+from transcriptomics_data_service.db import Database
+from transcriptomics_data_service.ingestion import AnnDataIngestionHandler
+
 from transcriptomics_data_service.logger import get_logger
 from transcriptomics_data_service.models import ExperimentResult, ExpressionQueryBody, NormalizationMethodEnum
 
@@ -17,6 +27,9 @@ logger = get_logger(config)
 TEST_FILES_DIR = os.path.join(os.path.dirname(__file__), "data")
 RCM_FILE_PATH = f"{TEST_FILES_DIR}/rcm_file.csv"
 SINGLE_SAMPLE_FILE_PATH = f"{TEST_FILES_DIR}/single_sample_detailed.csv"
+MTX_FILE_PATH = f"{TEST_FILES_DIR}/matrix.mtx"
+FEATURES_FILE_PATH = f"{TEST_FILES_DIR}/features.tsv"
+BARCODES_FILE_PATH = f"{TEST_FILES_DIR}/barcodes.tsv"
 
 
 def _ingest_file(
@@ -70,6 +83,462 @@ def test_ingest_authorized_duplicate(test_client, authz_headers, db_cleanup, db_
     assert response.status_code == status.HTTP_400_BAD_REQUEST
 
 
+def test_ingest_append_only(test_client, authz_headers, db_cleanup, db_with_experiment, monkeypatch):
+    appended = []
+    append = Database.append_gene_expressions
+
+    async def spy_append(self, expressions, conn):
+        appended.append({e.sample_id for e in expressions})
+        return await append(self, expressions, conn)
+
+    monkeypatch.setattr(Database, "append_gene_expressions", spy_append)
+
+    def ingest_sample(sample_id: str, data: bytes):
+        response = test_client.post(
+            f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/single",
+            files=[("data", data)],
+            data=dict(sample_id=sample_id, feature_col="feature", raw_count_col="count", file_type="csv"),
+            headers=authz_headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    # New sample: appended
+    ingest_sample("S1", b"feature,count\nG1,1\nG2,2\n")
+    # Re-ingestion: merged with the stored rows
+    ingest_sample("S1", b"feature,count\nG1,10\nG3,3\n")
+    # Duplicated features cannot be appended, and are merged instead
+    ingest_sample("S2", b"feature,count\nG1,1\nG1,5\n")
+    assert appended == [{"S1"}, {"S2"}]
+
+    body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id]}
+    response = test_client.post("/expressions", headers=authz_headers, json=body)
+    counts = {(e["gene_code"], e["sample_id"]): e["count"] for e in response.json()["expressions"]}
+    assert counts == {("G1", "S1"): 10, ("G2", "S1"): 2, ("G3", "S1"): 3, ("G1", "S2"): 5}
+
+
+def test_ingest_skip_zeros(test_client, authz_headers, db_cleanup, db_with_experiment):
+    url = f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest"
+    with open(RCM_FILE_PATH, "rb") as file:
+        response = test_client.post(url, params={"skip_zeros": True}, files=[("rcm_file", file)], headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    # Only raw counts can be sparse
+    with open(RCM_FILE_PATH, "rb") as file:
+        response = test_client.post(
+            url, params={"skip_zeros": True, "count_type": "tpm"}, files=[("rcm_file", file)], headers=authz_headers
+        )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_ingest_idempotent(test_client, authz_headers, db_cleanup, db_with_experiment, monkeypatch):
+    writes = []
+    append = Database.append_gene_expressions
+
+    async def spy_append(self, expressions, conn):
+        writes.append(len(expressions))
+        return await append(self, expressions, conn)
+
+    monkeypatch.setattr(Database, "append_gene_expressions", spy_append)
+
+    def ingest_sample(sample_id: str, data: bytes, idempotency_key: str | None = None):
+        headers = {**authz_headers, "Idempotency-Key": idempotency_key} if idempotency_key else authz_headers
+        return test_client.post(
+            f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/single",
+            files=[("data", data)],
+            data=dict(sample_id=sample_id, feature_col="feature", raw_count_col="count", file_type="csv"),
+            headers=headers,
+        )
+
+    data = b"feature,count\nG1,1\nG2,2\n"
+    assert ingest_sample("S1", data).json()["message"] == "Ingested 2 GeneExpressions successfully"
+    # Re-submission of the last ingestion
+    assert ingest_sample("S1", data).json()["message"] == "Ingested 2 GeneExpressions successfully"
+    assert writes == [2]
+    # Same content for another sample
+    assert ingest_sample("S2", data).status_code == status.HTTP_200_OK
+    assert writes == [2, 2]
+
+    # Client retries
+    assert ingest_sample("S3", data, "key-1").status_code == status.HTTP_200_OK
+    assert ingest_sample("S4", b"feature,count\nG1,1\n", "key-2").status_code == status.HTTP_200_OK
+    assert ingest_sample("S3", data, "key-1").json()["message"] == "Ingested 2 GeneExpressions successfully"
+    assert writes == [2, 2, 2, 1]
+    assert ingest_sample("S4", data, "key-1").status_code == status.HTTP_409_CONFLICT
+
+    # Not the last ingestion anymore, ingested again
+    assert ingest_sample("S3", data).status_code == status.HTTP_200_OK
+    assert writes == [2, 2, 2, 1]
+    assert ingest_sample("S1", data).status_code == status.HTTP_200_OK
+    assert len(writes) == 4
+
+
+@pytest.mark.parametrize("bulk_load", [False, True])
+def test_ingest_replace(test_client, authz_headers, db_cleanup, db_with_experiment, bulk_load):
+    def ingest_sample(sample_id: str, data: bytes, replace: bool = False):
+        response = test_client.post(
+            f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/single",
+            params={"replace": replace},
+            files=[("data", data)],
+            data=dict(sample_id=sample_id, feature_col="feature", raw_count_col="count", file_type="csv"),
+            headers=authz_headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    def stored_counts():
+        body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id]}
+        response = test_client.post("/expressions", headers=authz_headers, json=body)
+        return {(e["gene_code"], e["sample_id"]): e["count"] for e in response.json()["expressions"]}
+
+    data = b"feature,count\nG1,1\nG2,2\n"
+    ingest_sample("S1", data)
+    ingest_sample("S2", data)
+    ingest_sample("S1", b"feature,count\nG3,3\n", replace=True)
+    assert stored_counts() == {("G1", "S2"): 1, ("G2", "S2"): 2, ("G3", "S1"): 3}
+
+    # Replacing samples of a matrix
+    rcm = b"GeneID,S1,S3\nG1,5,6\n"
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest",
+        params={"replace": True, "bulk_load": bulk_load},
+        files=[("rcm_file", rcm)],
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert stored_counts() == {("G1", "S2"): 1, ("G2", "S2"): 2, ("G1", "S1"): 5, ("G1", "S3"): 6}
+
+    # Deleted data is not considered ingested anymore
+    test_client.delete(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/samples",
+        params={"sample_ids": ["S1", "S3"]},
+        headers=authz_headers,
+    )
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest",
+        files=[("rcm_file", rcm)],
+        headers=authz_headers,
+    )
+    assert stored_counts()[("G1", "S3")] == 6
+
+
+def test_ingest_bulk_load(test_client, authz_headers, db_cleanup, db_with_experiment):
+    url = f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest"
+    with open(RCM_FILE_PATH, "rb") as file:
+        rcm = b"".join(file.readlines()[:20])
+    for skip_zeros in (False, True):
+        response = test_client.post(
+            url,
+            params={"bulk_load": True, "skip_zeros": skip_zeros},
+            files=[("rcm_file", rcm)],
+            headers=authz_headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id], "genes": ["ACR"]}
+    response = test_client.post("/expressions", headers=authz_headers, json=body)
+    counts = {e["sample_id"]: e["count"] for e in response.json()["expressions"]}
+    assert counts["HG03259-1"] == 5
+    # Zero counts are implicit in the sparse experiment
+    assert len(counts) == len(rcm.splitlines()[0].split(b",")) - 1
+
+
+def test_ingest_diff(test_client, authz_headers, db_cleanup, db_with_experiment):
+    url = f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest"
+    with open(RCM_FILE_PATH, "rb") as file:
+        lines = file.readlines()
+    rcm = b"".join(lines[:20])
+    response = test_client.post(url, files=[("rcm_file", rcm)], headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert "stats" not in response.json()
+
+    # One changed count and one new gene
+    corrected = b"".join([lines[0], lines[1].replace(b"GPR84,640", b"GPR84,641"), *lines[2:21]])
+    response = test_client.post(url, params={"diff": True}, files=[("rcm_file", corrected)], headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["stats"] == {"inserted": 9, "changed": 1, "unchanged": 170, "deleted": 0}
+
+    body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id], "genes": ["GPR84"]}
+    response = test_client.post("/expressions", headers=authz_headers, json=body)
+    counts = {e["sample_id"]: e["count"] for e in response.json()["expressions"]}
+    assert counts["HG02272-1"] == 641
+
+
+@pytest.mark.asyncio
+async def test_ingest_snapshot(test_client, authz_headers, db: Database, db_cleanup, db_with_experiment):
+    url = f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest"
+    response = test_client.post(url, files=[("rcm_file", b"GeneID,S1,S2\nG1,1,2\nG2,3,4\n")], headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert "version" not in response.json()
+    response = test_client.post(f"/normalize/{TEST_EXPERIMENT_RESULT.experiment_result_id}/cpm", headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    # The reload replaces all the data of the experiment, including its normalized counts
+    rcm = b"GeneID,S2,S3\nG1,5,6\n"
+    response = test_client.post(url, params={"snapshot": True}, files=[("rcm_file", rcm)], headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["version"] == 1
+
+    body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id]}
+    response = test_client.post("/expressions", headers=authz_headers, json=body)
+    assert {(e["gene_code"], e["sample_id"]): e["count"] for e in response.json()["expressions"]} == {
+        ("G1", "S2"): 5,
+        ("G1", "S3"): 6,
+    }
+    response = test_client.post("/expressions", headers=authz_headers, json={**body, "method": "cpm"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    # The previous version was deleted in the background
+    async with db.connect() as conn:
+        versions = await conn.fetch("SELECT DISTINCT version FROM gene_expressions")
+    assert [r["version"] for r in versions] == [1]
+
+    # The same snapshot is not loaded again
+    response = test_client.post(url, params={"snapshot": True}, files=[("rcm_file", rcm)], headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert "version" not in response.json()
+
+    response = test_client.post(
+        url, params={"snapshot": True, "diff": True}, files=[("rcm_file", b"GeneID,S2\nG1,7\n")], headers=authz_headers
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def _ingest_mtx(client: TestClient, headers: HeaderTypes, matrix: bytes, features_path: str = FEATURES_FILE_PATH):
+    with open(features_path, "rb") as features, open(BARCODES_FILE_PATH, "rb") as barcodes:
+        return client.post(
+            f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/mtx",
+            files=[("matrix_file", matrix), ("features_file", features), ("samples_file", barcodes)],
+            headers=headers,
+        )
+
+
+def test_ingest_mtx(test_client, authz_headers, db_cleanup, db_with_experiment):
+    with open(MTX_FILE_PATH, "rb") as file:
+        matrix = gzip.compress(file.read())
+    response = _ingest_mtx(test_client, authz_headers, matrix)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["message"] == "Ingested 32 GeneExpressions successfully"
+
+    # Missing triplets are implicit zero counts
+    body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id], "genes": ["ACR"]}
+    response = test_client.post("/expressions", headers=authz_headers, json=body)
+    counts = {e["sample_id"]: e["count"] for e in response.json()["expressions"]}
+    assert len(counts) == 9
+    assert counts["NA20758-1"] == 0
+    assert counts["HG03259-1"] == 5
+
+
+def test_ingest_mtx_shape_mismatch(test_client, authz_headers, db_cleanup, db_with_experiment):
+    with open(MTX_FILE_PATH, "rb") as file:
+        matrix = file.read()
+    # The barcodes file does not match the matrix's columns
+    response = _ingest_mtx(test_client, authz_headers, matrix, features_path=BARCODES_FILE_PATH)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = _ingest_mtx(test_client, authz_headers, matrix.replace(b"coordinate", b"array"))
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def _columnar_rcm(file_format: str) -> bytes:
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    df = pd.read_csv(RCM_FILE_PATH, index_col=0, nrows=50)
+    buffer = BytesIO()
+    if file_format == "parquet":
+        # Small row groups, streamed in several batches
+        pq.write_table(pa.Table.from_pandas(df), buffer, row_group_size=20)
+    else:
+        # Without pandas metadata, the features are in the first column
+        table = pa.Table.from_pandas(df.reset_index(), preserve_index=False).replace_schema_metadata(None)
+        open_writer = pa.ipc.new_file if file_format == "arrow" else pa.ipc.new_stream
+        with open_writer(buffer, table.schema) as writer:
+            writer.write_table(table, max_chunksize=20)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow", "arrow_stream"])
+def test_ingest_columnar(test_client, authz_headers, db_cleanup, db_with_experiment, file_format):
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/columnar",
+        files=[("rcm_file", _columnar_rcm(file_format))],
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["message"] == "Ingested 450 GeneExpressions successfully"
+
+    body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id], "genes": ["ACR"]}
+    response = test_client.post("/expressions", headers=authz_headers, json=body)
+    counts = {e["sample_id"]: e["count"] for e in response.json()["expressions"]}
+    assert counts == {
+        "HG02272-1": 1,
+        "HG03259-1": 5,
+        "NA20334-2": 3,
+        "HG01914-1": 4,
+        "HG03074-0": 4,
+        "HG02339-0": 3,
+        "NA20758-1": 0,
+        "NA18531-1": 1,
+        "NA20520-0": 1,
+    }
+
+
+def test_ingest_columnar_invalid(test_client, authz_headers, db_cleanup, db_with_experiment):
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/columnar",
+        files=[("rcm_file", _columnar_rcm("parquet")[4:])],
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_ingest_columnar_without_pyarrow(test_client, authz_headers, db_cleanup, db_with_experiment, monkeypatch):
+    monkeypatch.setattr("transcriptomics_data_service.ingestion.pa", None)
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/columnar",
+        files=[("rcm_file", b"PAR1")],
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
+
+
+def _ingest_uri(client: TestClient, headers: HeaderTypes, uri: str, **config):
+    client.app.dependency_overrides[get_config] = lambda: get_config().model_copy(update=config)
+    try:
+        return client.post(
+            f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/uri",
+            params={"uri": uri},
+            headers=headers,
+        )
+    finally:
+        client.app.dependency_overrides.pop(get_config)
+
+
+def test_ingest_uri_local(test_client, authz_headers, db_cleanup, db_with_experiment, tmp_path):
+    rcm = pd.read_csv(RCM_FILE_PATH, index_col=0, nrows=10)
+    (tmp_path / "rcms").mkdir()
+    with gzip.open(tmp_path / "rcms" / "rcm.csv.gz", "wt") as file:
+        rcm.to_csv(file)
+    root = str(tmp_path / "rcms")
+
+    for uri in ["rcm.csv.gz", str(tmp_path / "rcms" / "rcm.csv.gz"), f"file://{tmp_path}/rcms/rcm.csv.gz"]:
+        response = _ingest_uri(test_client, authz_headers, uri, ingestion_local_root=root)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["message"] == f"Ingested {rcm.size} GeneExpressions successfully"
+
+    # Outside of the allow-listed root, including through symbolic links
+    (tmp_path / "rcms" / "link.csv").symlink_to(RCM_FILE_PATH)
+    for uri in ["../rcm.csv", RCM_FILE_PATH, "link.csv"]:
+        response = _ingest_uri(test_client, authz_headers, uri, ingestion_local_root=root)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    response = _ingest_uri(test_client, authz_headers, "missing.csv", ingestion_local_root=root)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = _ingest_uri(test_client, authz_headers, "rcm.csv.gz")
+    assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
+    response = _ingest_uri(test_client, authz_headers, "http://example.org/rcm.csv", ingestion_local_root=root)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_ingest_uri_object_store(test_client, authz_headers, db_cleanup, db_with_experiment, monkeypatch):
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    rcm = pd.read_csv(RCM_FILE_PATH, index_col=0, nrows=10)
+    with moto.mock_aws():
+        # In-process stand-in of an S3-compatible store
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="rcms")
+        s3.put_object(Bucket="rcms", Key="experiments/rcm.csv", Body=rcm.to_csv().encode("utf-8"))
+
+        response = _ingest_uri(test_client, authz_headers, "s3://rcms/experiments/rcm.csv")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["message"] == f"Ingested {rcm.size} GeneExpressions successfully"
+
+        response = _ingest_uri(test_client, authz_headers, "s3://rcms/experiments/missing.csv")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+H5AD_SAMPLES = ["S1", "S2", "S3"]
+H5AD_GENES = ["GENE_A", "GENE_B", "GENE_C", "GENE_D"]
+H5AD_COUNTS = [[1, 0, 3, 0], [0, 0, 7, 2], [5, 6, 0, 1]]
+
+
+def _h5ad_file(sparse_format: str | None) -> bytes:
+    h5py = pytest.importorskip("h5py")
+    import numpy as np
+
+    def _write_matrix(group, name: str, matrix):
+        matrix = np.asarray(matrix, dtype="float64")
+        if sparse_format is None:
+            group.create_dataset(name, data=matrix)
+            return
+        # CSR matrices are compressed by row (obs), CSC matrices by column (var)
+        major = matrix if sparse_format == "csr" else matrix.T
+        sparse = group.create_group(name)
+        sparse.attrs["encoding-type"] = f"{sparse_format}_matrix"
+        sparse.attrs["shape"] = matrix.shape
+        sparse.create_dataset("data", data=major[major != 0])
+        sparse.create_dataset("indices", data=np.nonzero(major)[1])
+        sparse.create_dataset("indptr", data=np.concatenate([[0], np.cumsum((major != 0).sum(axis=1))]))
+
+    buffer = BytesIO()
+    with h5py.File(buffer, "w") as f:
+        for name, index in (("obs", H5AD_SAMPLES), ("var", H5AD_GENES)):
+            group = f.create_group(name)
+            group.attrs["_index"] = "_index"
+            group.create_dataset("_index", data=index, dtype=h5py.string_dtype())
+        _write_matrix(f, "X", H5AD_COUNTS)
+        _write_matrix(f.create_group("layers"), "normalized", [[c * 10 for c in row] for row in H5AD_COUNTS])
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("sparse_format", [None, "csr", "csc"])
+def test_ingest_h5ad(test_client, authz_headers, db_cleanup, db_with_experiment, sparse_format, monkeypatch):
+    # Chunks of 2 samples
+    monkeypatch.setattr(AnnDataIngestionHandler, "batch_size", 8)
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/h5ad",
+        files=[("h5ad_file", _h5ad_file(sparse_format))],
+        data={"tpm_count_layer": "normalized"},
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["message"] == "Ingested 12 GeneExpressions successfully"
+
+    for method, scale in (("raw", 1), ("tpm", 10)):
+        body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id], "method": method}
+        response = test_client.post("/expressions", headers=authz_headers, json=body)
+        counts = {(e["gene_code"], e["sample_id"]): e["count"] for e in response.json()["expressions"]}
+        assert counts == {
+            (gene, sample): H5AD_COUNTS[i][j] * scale
+            for i, sample in enumerate(H5AD_SAMPLES)
+            for j, gene in enumerate(H5AD_GENES)
+        }
+
+
+def test_ingest_h5ad_invalid_layer(test_client, authz_headers, db_cleanup, db_with_experiment):
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/h5ad",
+        files=[("h5ad_file", _h5ad_file("csr"))],
+        data={"tpm_count_layer": "missing"},
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    # Only raw counts can be sparse
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/h5ad",
+        params={"skip_zeros": True},
+        files=[("h5ad_file", _h5ad_file("csr"))],
+        data={"tpm_count_layer": "normalized"},
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 def test_ingest_404(test_client, authz_headers, db_cleanup):
     # db_with_experiment fixture not included, targeted experiment doesn't exist
     response = _ingest_file(
@@ -119,12 +588,7 @@ def test_normalize(test_client: TestClient, authz_headers, db_cleanup, db_with_e
                 files=[("gene_lengths_file", file)],
                 headers=authz_headers,
             )
-
-            if method is NormalizationMethodEnum.fpkm:
-                # TODO: expect 200 once implemented
-                assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
-            else:
-                assert response.status_code == status.HTTP_200_OK
+            assert response.status_code == status.HTTP_200_OK
 
 
 def test_ingest_single_sample(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
@@ -147,6 +611,121 @@ def test_ingest_single_sample(test_client: TestClient, authz_headers, db_cleanup
     assert response.status_code == status.HTTP_200_OK
 
 
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data)
+    if compression == "bz2":
+        return bz2.compress(data)
+    return pytest.importorskip("zstandard").ZstdCompressor().compress(data)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bz2", "zstd"])
+def test_ingest_compressed(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment, compression):
+    with open(RCM_FILE_PATH, "rb") as file:
+        rcm = b"".join(file.readlines()[:20])
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest",
+        files=[("rcm_file", _compress(rcm, compression))],
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    with open(SINGLE_SAMPLE_FILE_PATH, "rb") as file:
+        single_sample = file.read()
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/single",
+        files=[("data", _compress(single_sample, compression))],
+        data=dict(sample_id="my-sample-id", feature_col="feature", raw_count_col="count", file_type="csv"),
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["message"] == "Ingested 5 GeneExpressions successfully"
+
+    body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id], "genes": ["ACR", "ENSG00000000003"]}
+    response = test_client.post("/expressions", headers=authz_headers, json=body)
+    counts = {(e["gene_code"], e["sample_id"]): e["count"] for e in response.json()["expressions"]}
+    assert counts[("ACR", "HG03259-1")] == 5
+    assert counts[("ENSG00000000003", "my-sample-id")] == 1234
+
+
+def _batch_counts(test_client: TestClient, authz_headers) -> dict[tuple[str, str], float]:
+    body = {"experiments": [TEST_EXPERIMENT_RESULT.experiment_result_id], "genes": ["ENSG00000000003"]}
+    response = test_client.post("/expressions", headers=authz_headers, json=body)
+    return {(e["gene_code"], e["sample_id"]): e["count"] for e in response.json()["expressions"]}
+
+
+def test_ingest_batch(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    with open(SINGLE_SAMPLE_FILE_PATH, "rb") as file:
+        single_sample = file.read()
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/batch",
+        files=[
+            ("files", ("S1.csv", single_sample)),
+            ("files", ("S2.csv.gz", gzip.compress(single_sample.replace(b"1234", b"42")))),
+            ("files", ("S3.csv", b"feature,other\nA,1\n")),
+        ],
+        data=dict(feature_col="feature", raw_count_col="count", tpm_count_col="tpm", file_type="csv"),
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    samples = response.json()["samples"]
+    assert samples["S1"] == {"status": "ingested", "gene_expressions": 5}
+    assert samples["S2"] == {"status": "ingested", "gene_expressions": 5}
+    assert samples["S3"]["status"] == "failed"
+    assert _batch_counts(test_client, authz_headers) == {("ENSG00000000003", "S1"): 1234, ("ENSG00000000003", "S2"): 42}
+
+
+@pytest.mark.parametrize("archive_format", ["zip", "tar.gz"])
+def test_ingest_batch_archive(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment, archive_format):
+    with open(SINGLE_SAMPLE_FILE_PATH, "rb") as file:
+        single_sample = file.read()
+    # Salmon style outputs, identified by their directory
+    members = {"S1/quant.csv": single_sample, "S2/quant.csv": single_sample, "__MACOSX/S1/._quant.csv": b"\x00"}
+    archive = BytesIO()
+    if archive_format == "zip":
+        with zipfile.ZipFile(archive, "w") as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+    else:
+        with tarfile.open(fileobj=archive, mode="w:gz") as tf:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tf.addfile(info, BytesIO(data))
+
+    response = test_client.post(
+        f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/batch",
+        files=[("archive", archive.getvalue())],
+        data=dict(feature_col="feature", raw_count_col="count", file_type="csv"),
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.json()["samples"]) == {"S1", "S2"}
+    assert _batch_counts(test_client, authz_headers) == {
+        ("ENSG00000000003", "S1"): 1234,
+        ("ENSG00000000003", "S2"): 1234,
+    }
+
+
+def test_ingest_batch_invalid(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    url = f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/batch"
+    form = dict(feature_col="feature", raw_count_col="count", file_type="csv")
+    # Neither files nor archive
+    response = test_client.post(url, data=form, headers=authz_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    # Duplicated sample IDs
+    files = [("files", ("S1.csv", b"feature,count\nA,1\n")), ("files", ("S1.tsv", b"feature,count\nA,1\n"))]
+    response = test_client.post(url, files=files, data=form, headers=authz_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    # No valid file
+    response = test_client.post(url, files=[("files", ("S1.csv", b"bad"))], data=form, headers=authz_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "S1" in response.json()["detail"]["errors"]
+    # Not an archive
+    response = test_client.post(url, files=[("archive", b"not an archive")], data=form, headers=authz_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 def test_ingest_single_sample_bad_mapping(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
     response = _ingest_file(
         test_client,
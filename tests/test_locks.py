@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from tests.test_db import TEST_EXPERIMENT_RESULT_ID
+from tests.test_ingest import RCM_FILE_PATH
+from transcriptomics_data_service.config import get_config
+from transcriptomics_data_service.db import Database
+from transcriptomics_data_service.exceptions import ExperimentLockedException
+
+
+@pytest.mark.asyncio
+async def test_experiment_lock(db: Database, db_cleanup):
+    async with db.experiment_lock("E1"):
+        for timeout in [0, 0.1]:
+            with pytest.raises(ExperimentLockedException):
+                async with db.experiment_lock("E1", timeout):
+                    pass  # pragma: no cover
+        # Other experiments are not locked
+        async with db.experiment_lock("E2", 0):
+            pass
+
+    # Released
+    async with db.experiment_lock("E1", 0):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_experiment_lock_waits(db: Database, db_cleanup):
+    order = []
+
+    async def job(name: str):
+        async with db.experiment_lock("E1"):
+            order.append(f"start {name}")
+            await asyncio.sleep(0.1)
+            order.append(f"end {name}")
+
+    await asyncio.gather(job("A"), job("B"))
+    assert order in (
+        ["start A", "end A", "start B", "end B"],
+        ["start B", "end B", "start A", "end A"],
+    )
+
+
+@pytest.mark.asyncio
+async def test_locked_experiment_requests(
+    test_client: TestClient, authz_headers, db: Database, db_cleanup, db_with_experiment
+):
+    test_client.app.dependency_overrides[get_config] = lambda: get_config().model_copy(
+        update={"experiment_lock_timeout_s": 0}
+    )
+    try:
+        async with db.experiment_lock(TEST_EXPERIMENT_RESULT_ID):
+            with open(RCM_FILE_PATH, "rb") as file:
+                response = test_client.post(
+                    f"/experiment/{TEST_EXPERIMENT_RESULT_ID}/ingest", files=[("rcm_file", file)], headers=authz_headers
+                )
+            assert response.status_code == status.HTTP_409_CONFLICT
+
+            response = test_client.post(f"/normalize/{TEST_EXPERIMENT_RESULT_ID}/cpm", headers=authz_headers)
+            assert response.status_code == status.HTTP_409_CONFLICT
+
+            response = test_client.delete(f"/experiment/{TEST_EXPERIMENT_RESULT_ID}", headers=authz_headers)
+            assert response.status_code == status.HTTP_409_CONFLICT
+
+            # Requests to other experiments are not locked
+            response = test_client.post("/normalize/other-experiment/cpm", headers=authz_headers)
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+    finally:
+        test_client.app.dependency_overrides.pop(get_config)
+
+    assert (await db.read_experiment_result(TEST_EXPERIMENT_RESULT_ID)) is not None
@@ -0,0 +1,468 @@
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from tests.test_db import TEST_EXPERIMENT_RESULT
+from tests.test_ingest import RCM_FILE_PATH, TEST_FILES_DIR, _ingest_file
+from transcriptomics_data_service.config import Config, get_config
+from transcriptomics_data_service.models import NormalizationMethodEnum, NormalizationRun
+
+EXP_ID = TEST_EXPERIMENT_RESULT.experiment_result_id
+GENE_LENGTHS_FILE_PATH = f"{TEST_FILES_DIR}/gene_lengths.csv"
+
+
+GENES = [f"GENE_{i}" for i in range(10)]
+
+
+def _normalize(client: TestClient, headers, method: NormalizationMethodEnum, with_gene_lengths: bool = True):
+    if not with_gene_lengths:
+        return client.post(f"/normalize/{EXP_ID}/{method.value}", headers=headers)
+    with open(GENE_LENGTHS_FILE_PATH, "rb") as file:
+        return client.post(
+            f"/normalize/{EXP_ID}/{method.value}",
+            files=[("gene_lengths_file", file)],
+            headers=headers,
+        )
+
+
+def _ingest_rcm(
+    client: TestClient, headers, samples: dict[str, list[float]], count_type: str = "raw", skip_zeros: bool = False
+):
+    lines = [",".join(["GeneID", *samples.keys()])]
+    for i, gene in enumerate(GENES):
+        lines.append(",".join([gene, *(str(counts[i]) for counts in samples.values())]))
+    response = client.post(
+        f"/experiment/{EXP_ID}/ingest",
+        params={"count_type": count_type, "skip_zeros": skip_zeros},
+        files={"rcm_file": "\n".join(lines).encode("utf-8")},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
+def _get_run(client: TestClient, headers, method: NormalizationMethodEnum) -> NormalizationRun:
+    response = client.get(f"/experiment/{EXP_ID}/normalization/{method.value}", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    return NormalizationRun(**response.json())
+
+
+def test_normalization_factors_404(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    response = test_client.get(f"/experiment/{EXP_ID}/normalization/tmm", headers=authz_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_normalization_factors_persisted(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    _ingest_file(test_client, file_path=RCM_FILE_PATH, headers=authz_headers)
+
+    for method in (NormalizationMethodEnum.tmm, NormalizationMethodEnum.getmm):
+        response = _normalize(test_client, authz_headers, method)
+        assert response.status_code == status.HTTP_200_OK
+
+        response = test_client.get(f"/experiment/{EXP_ID}/normalization/{method.value}", headers=authz_headers)
+        assert response.status_code == status.HTTP_200_OK
+        run = NormalizationRun(**response.json())
+        assert run.method is method
+        assert len(run.factors) == 9
+        assert run.reference_sample_id in [f.sample_id for f in run.factors]
+        assert all(f.norm_factor > 0 and f.library_size > 0 for f in run.factors)
+
+
+def test_normalization_unchanged_inputs_skipped(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    _ingest_file(test_client, file_path=RCM_FILE_PATH, headers=authz_headers)
+
+    response = _normalize(test_client, authz_headers, NormalizationMethodEnum.tmm, with_gene_lengths=False)
+    assert response.status_code == status.HTTP_200_OK
+    assert "completed" in response.json()["message"]
+
+    response = _normalize(test_client, authz_headers, NormalizationMethodEnum.tmm, with_gene_lengths=False)
+    assert response.status_code == status.HTTP_200_OK
+    assert "up to date" in response.json()["message"]
+
+
+def test_normalization_changed_inputs_recomputed(
+    test_client: TestClient, authz_headers, db_cleanup, db_with_experiment
+):
+    # Library sizes 100, 200, 300: S2 is the reference sample
+    _ingest_rcm(test_client, authz_headers, {"S1": [10] * 10, "S2": [20, 10, 30] * 3 + [20], "S3": [30] * 10})
+    response = _normalize(test_client, authz_headers, NormalizationMethodEnum.tmm, with_gene_lengths=False)
+    assert "completed" in response.json()["message"]
+    run = _get_run(test_client, authz_headers, NormalizationMethodEnum.tmm)
+    assert run.reference_sample_id == "S2"
+
+    # S1 re-ingested with a library size of 250: S1 becomes the reference sample
+    _ingest_rcm(test_client, authz_headers, {"S1": [25, 20, 30] * 3 + [25]})
+    response = _normalize(test_client, authz_headers, NormalizationMethodEnum.tmm, with_gene_lengths=False)
+    assert "completed" in response.json()["message"]
+    new_run = _get_run(test_client, authz_headers, NormalizationMethodEnum.tmm)
+    assert new_run.reference_sample_id == "S1"
+    assert new_run.input_checksum != run.input_checksum
+    assert new_run.factors != run.factors
+
+    # A new sample is also picked up
+    _ingest_rcm(test_client, authz_headers, {"S4": [40] * 10})
+    response = _normalize(test_client, authz_headers, NormalizationMethodEnum.tmm, with_gene_lengths=False)
+    assert "completed" in response.json()["message"]
+    assert len(_get_run(test_client, authz_headers, NormalizationMethodEnum.tmm).factors) == 4
+
+
+def test_normalization_changed_gene_lengths_recomputed(
+    test_client: TestClient, authz_headers, db_cleanup, db_with_experiment
+):
+    _ingest_rcm(test_client, authz_headers, {"S1": [10] * 10, "S2": [20] * 10})
+    messages = []
+    for lengths in ([1000] * 10, [1000, 2000] * 5, [1000, 2000] * 5):
+        gene_lengths = "\n".join(["GeneID,GeneLength", *(f"{g},{n}" for g, n in zip(GENES, lengths))])
+        response = test_client.post(
+            f"/normalize/{EXP_ID}/tpm",
+            files={"gene_lengths_file": gene_lengths.encode("utf-8")},
+            headers=authz_headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        messages.append(response.json()["message"])
+    # Only the last request, with unchanged gene lengths, is skipped
+    assert ["completed" in m for m in messages] == [True, True, False]
+    assert "up to date" in messages[-1]
+
+
+def test_normalization_invalidated_by_normalized_ingestion(
+    test_client: TestClient, authz_headers, db_cleanup, db_with_experiment
+):
+    _ingest_rcm(test_client, authz_headers, {"S1": [10] * 10, "S2": [20] * 10, "S3": [30] * 10})
+    _normalize(test_client, authz_headers, NormalizationMethodEnum.tmm, with_gene_lengths=False)
+    _get_run(test_client, authz_headers, NormalizationMethodEnum.tmm)
+
+    # Pre-normalized TMM values overwrite the computed ones, raw counts are unchanged
+    _ingest_rcm(test_client, authz_headers, {"S1": [1] * 10}, count_type="tmm")
+    response = test_client.get(f"/experiment/{EXP_ID}/normalization/tmm", headers=authz_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = _normalize(test_client, authz_headers, NormalizationMethodEnum.tmm, with_gene_lengths=False)
+    assert "completed" in response.json()["message"]
+
+
+def _get_counts(client: TestClient, headers, method: str, sample_id: str) -> list[float]:
+    response = client.post(
+        "/expressions", headers=headers, json={"method": method, "sample_ids": [sample_id], "experiments": [EXP_ID]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    return [e["count"] for e in response.json()["expressions"]]
+
+
+def _normalize_incremental(client: TestClient, headers, method: NormalizationMethodEnum):
+    response = client.post(f"/normalize/{EXP_ID}/{method.value}", params={"incremental": True}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()["message"]
+
+
+def test_normalization_incremental_tmm(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    # Library sizes 100, 200, 300: S2 is the reference sample
+    _ingest_rcm(test_client, authz_headers, {"S1": [10] * 10, "S2": [20, 10, 30] * 3 + [20], "S3": [30] * 10})
+    assert "completed successfully" in _normalize_incremental(test_client, authz_headers, NormalizationMethodEnum.tmm)
+    s1_counts = _get_counts(test_client, authz_headers, "tmm", "S1")
+    run = _get_run(test_client, authz_headers, NormalizationMethodEnum.tmm)
+
+    # S4 (library size of 200) keeps S2 as the reference sample, only S4 is normalized
+    _ingest_rcm(test_client, authz_headers, {"S4": [20, 30, 10] * 3 + [20]})
+    message = _normalize_incremental(test_client, authz_headers, NormalizationMethodEnum.tmm)
+    assert "for 1 new or changed sample(s)" in message
+    assert _get_counts(test_client, authz_headers, "tmm", "S1") == s1_counts
+    assert len(_get_counts(test_client, authz_headers, "tmm", "S4")) == 10
+
+    new_run = _get_run(test_client, authz_headers, NormalizationMethodEnum.tmm)
+    assert new_run.reference_sample_id == "S2"
+    assert new_run.library_scale == run.library_scale
+    assert [f for f in new_run.factors if f.sample_id != "S4"] == run.factors
+
+    # S5, S6 and S7 (library sizes of 400) move the median to S3: every sample is normalized again
+    _ingest_rcm(test_client, authz_headers, {"S5": [40] * 10, "S6": [40] * 10, "S7": [40] * 10})
+    message = _normalize_incremental(test_client, authz_headers, NormalizationMethodEnum.tmm)
+    assert message == "TMM normalization completed successfully"
+    assert _get_run(test_client, authz_headers, NormalizationMethodEnum.tmm).reference_sample_id == "S3"
+
+
+def test_normalization_incremental_tpm(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    gene_lengths = "\n".join(["GeneID,GeneLength", *(f"{g},1000" for g in GENES)]).encode("utf-8")
+
+    def _normalize_tpm():
+        response = test_client.post(
+            f"/normalize/{EXP_ID}/tpm",
+            params={"incremental": True},
+            files={"gene_lengths_file": gene_lengths},
+            headers=authz_headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()["message"]
+
+    _ingest_rcm(test_client, authz_headers, {"S1": [10] * 10, "S2": [20] * 10})
+    _normalize_tpm()
+    _ingest_rcm(test_client, authz_headers, {"S2": [20, 40] * 5, "S3": [30] * 10})
+    assert "for 2 new or changed sample(s)" in _normalize_tpm()
+    assert _get_counts(test_client, authz_headers, "tpm", "S3") == pytest.approx([1e5] * 10)
+
+
+def test_normalization_multiple_methods(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    _ingest_rcm(test_client, authz_headers, {"S1": [10] * 10, "S2": [20, 10, 30] * 3 + [20], "S3": [30] * 10})
+    gene_lengths = "\n".join(["GeneID,GeneLength", *(f"{g},{n}" for g, n in zip(GENES, [1000, 2000] * 5))])
+    methods = [NormalizationMethodEnum.tpm, NormalizationMethodEnum.tmm, NormalizationMethodEnum.getmm]
+
+    single_counts = {}
+    for method in methods:
+        response = test_client.post(
+            f"/normalize/{EXP_ID}/{method.value}",
+            files={"gene_lengths_file": gene_lengths.encode("utf-8")},
+            headers=authz_headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        single_counts[method] = _get_counts(test_client, authz_headers, method.value, "S1")
+
+    # Overwriting the normalized values invalidates the runs
+    for method in methods:
+        _ingest_rcm(test_client, authz_headers, {"S1": [1] * 10}, count_type=method.value)
+
+    response = test_client.post(
+        f"/normalize/{EXP_ID}",
+        params={"methods": [m.value for m in methods]},
+        files={"gene_lengths_file": gene_lengths.encode("utf-8")},
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["methods"] == {m.value: f"{m.upper()} normalization completed successfully" for m in methods}
+    for method in methods:
+        assert _get_counts(test_client, authz_headers, method.value, "S1") == pytest.approx(single_counts[method])
+        assert len(_get_run(test_client, authz_headers, method).factors) == 3
+
+    # Unchanged inputs are skipped for each method
+    response = test_client.post(
+        f"/normalize/{EXP_ID}",
+        params={"methods": [m.value for m in methods]},
+        files={"gene_lengths_file": gene_lengths.encode("utf-8")},
+        headers=authz_headers,
+    )
+    assert all("up to date" in message for message in response.json()["methods"].values())
+
+
+def test_normalization_additional_methods(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    _ingest_rcm(test_client, authz_headers, {"S1": [10] * 10, "S2": [20, 10, 30] * 3 + [20], "S3": [30] * 10})
+    gene_lengths = "\n".join(["GeneID,GeneLength", *(f"{g},1000" for g in GENES)])
+    methods = [
+        NormalizationMethodEnum.cpm,
+        NormalizationMethodEnum.fpkm,
+        NormalizationMethodEnum.uq,
+        NormalizationMethodEnum.deseq2,
+    ]
+
+    response = test_client.post(
+        f"/normalize/{EXP_ID}",
+        params={"methods": [m.value for m in methods]},
+        files={"gene_lengths_file": gene_lengths.encode("utf-8")},
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    # Library size of 100, and genes of 1 kb: CPM and FPKM values are equal
+    assert _get_counts(test_client, authz_headers, "cpm", "S1") == pytest.approx([1e5] * 10)
+    assert _get_counts(test_client, authz_headers, "fpkm", "S1") == pytest.approx([1e5] * 10)
+
+    # Upper quartiles of 10, 27.5 and 30, scaled to their mean
+    uq_run = _get_run(test_client, authz_headers, NormalizationMethodEnum.uq)
+    assert [f.norm_factor for f in uq_run.factors] == pytest.approx([10, 27.5, 30])
+    assert uq_run.library_scale == pytest.approx(22.5)
+    assert _get_counts(test_client, authz_headers, "uq", "S1") == pytest.approx([22.5] * 10)
+
+    # S1 and S3 only differ by their depth
+    deseq2_run = _get_run(test_client, authz_headers, NormalizationMethodEnum.deseq2)
+    deseq2_factors = {f.sample_id: f.norm_factor for f in deseq2_run.factors}
+    assert deseq2_factors["S3"] == pytest.approx(3 * deseq2_factors["S1"])
+    s1_counts = _get_counts(test_client, authz_headers, "deseq2", "S1")
+    assert [c * deseq2_factors["S1"] for c in s1_counts] == pytest.approx([10] * 10)
+
+
+def test_normalization_blocked(test_client: TestClient, authz_headers, config: Config, db_cleanup, db_with_experiment):
+    samples = {
+        "S1": [10, 0, 5, 8, 12, 3, 7, 9, 4, 0],
+        "S2": [20, 10, 30, 20, 10, 30, 20, 10, 30, 0],
+        "S3": [30, 3, 1, 25, 40, 8, 2, 30, 12, 0],
+        "S4": [5, 50, 20, 15, 8, 0, 11, 6, 9, 0],
+        "S5": [0] * 10,
+    }
+    _ingest_rcm(test_client, authz_headers, samples)
+    gene_lengths = "\n".join(["GeneID,GeneLength", *(f"{g},{n}" for g, n in zip(GENES, [1000, 2000, 500] * 3 + [0]))])
+    methods = list(NormalizationMethodEnum)
+
+    def _normalize_all(blocked: bool):
+        response = test_client.post(
+            f"/normalize/{EXP_ID}",
+            params={"methods": [m.value for m in methods], "blocked": blocked},
+            files={"gene_lengths_file": gene_lengths.encode("utf-8")},
+            headers=authz_headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()["methods"]
+
+    _normalize_all(blocked=False)
+    # S5 has no counts and is not normalized
+    counts = {
+        (m, s): _get_counts(test_client, authz_headers, m.value, s) for m in methods for s in ["S1", "S2", "S3", "S4"]
+    }
+    runs = {m: _get_run(test_client, authz_headers, m) for m in methods}
+
+    # Overwriting the normalized values invalidates the runs
+    for method in methods:
+        _ingest_rcm(test_client, authz_headers, {s: [-1] * 10 for s in samples}, count_type=method.value)
+
+    # 10 genes and at most 20 values per block: blocks of 2 samples
+    test_client.app.dependency_overrides[get_config] = lambda: config.model_copy(
+        update={"normalization_max_block_values": 20}
+    )
+    try:
+        assert all("completed" in message for message in _normalize_all(blocked=True).values())
+        assert all("up to date" in message for message in _normalize_all(blocked=True).values())
+    finally:
+        test_client.app.dependency_overrides.pop(get_config)
+
+    for (method, sample_id), expected in counts.items():
+        # GENE_9 has no counts and is not normalized
+        blocked_counts = [c for c in _get_counts(test_client, authz_headers, method.value, sample_id) if c != -1]
+        assert blocked_counts == pytest.approx(expected)
+    for method, run in runs.items():
+        blocked_run = _get_run(test_client, authz_headers, method)
+        assert blocked_run.input_checksum == run.input_checksum
+        assert blocked_run.reference_sample_id == run.reference_sample_id
+        assert [f.sample_id for f in blocked_run.factors] == [f.sample_id for f in run.factors]
+        assert [f.norm_factor for f in blocked_run.factors] == pytest.approx([f.norm_factor for f in run.factors])
+        assert [f.library_size for f in blocked_run.factors] == pytest.approx([f.library_size for f in run.factors])
+
+    # Unchanged inputs are also detected by a regular normalization
+    assert all("up to date" in message for message in _normalize_all(blocked=False).values())
+
+
+def test_normalization_blocked_incremental(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    response = test_client.post(
+        f"/normalize/{EXP_ID}/tmm", params={"blocked": True, "incremental": True}, headers=authz_headers
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_normalization_tpm_in_database(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    samples = {"S1": [10, 0, 5, 8, 12, 3, 7, 9, 4, 0], "S2": [20, 10, 30, 20, 10, 30, 20, 10, 30, 0]}
+    _ingest_rcm(test_client, authz_headers, samples)
+
+    # Gene lengths must be registered for the experiment's assembly
+    response = test_client.post(f"/normalize/{EXP_ID}/tpm", params={"in_database": True}, headers=authz_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    gene_lengths = "\n".join(["GeneID,GeneLength", *(f"{g},{n}" for g, n in zip(GENES, [1000, 2000, 500] * 3 + [0]))])
+    response = test_client.post(
+        f"/gene-lengths/{TEST_EXPERIMENT_RESULT.assembly_id}",
+        files={"gene_lengths_file": gene_lengths.encode("utf-8")},
+        headers=authz_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    response = test_client.post(f"/normalize/{EXP_ID}/tpm", headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    expected = {s: _get_counts(test_client, authz_headers, "tpm", s) for s in samples}
+    run = _get_run(test_client, authz_headers, NormalizationMethodEnum.tpm)
+
+    # Overwriting the TPM values invalidates the run
+    _ingest_rcm(test_client, authz_headers, {s: [-1] * 10 for s in samples}, count_type="tpm")
+
+    response = test_client.post(f"/normalize/{EXP_ID}/tpm", params={"in_database": True}, headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert "completed" in response.json()["message"]
+    for sample_id, counts in expected.items():
+        # GENE_9 has no counts and is not normalized
+        in_database_counts = [c for c in _get_counts(test_client, authz_headers, "tpm", sample_id) if c != -1]
+        assert in_database_counts == pytest.approx(counts)
+
+    in_database_run = _get_run(test_client, authz_headers, NormalizationMethodEnum.tpm)
+    assert [(f.sample_id, f.library_size) for f in in_database_run.factors] == [
+        (f.sample_id, f.library_size) for f in run.factors
+    ]
+
+    response = test_client.post(f"/normalize/{EXP_ID}/tpm", params={"in_database": True}, headers=authz_headers)
+    assert "up to date" in response.json()["message"]
+
+
+def test_normalization_cpm_in_database(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    samples = {"S1": [10] * 10, "S2": [20, 10, 30, 20, 10, 30, 20, 10, 30, 0]}
+    _ingest_rcm(test_client, authz_headers, samples)
+
+    # CPM does not require gene lengths
+    response = test_client.post(f"/normalize/{EXP_ID}/cpm", params={"in_database": True}, headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert _get_counts(test_client, authz_headers, "cpm", "S1") == pytest.approx([1e5] * 10)
+    in_database_counts = {s: _get_counts(test_client, authz_headers, "cpm", s) for s in samples}
+
+    _ingest_rcm(test_client, authz_headers, {s: [-1] * 10 for s in samples}, count_type="cpm")
+    response = test_client.post(f"/normalize/{EXP_ID}/cpm", headers=authz_headers)
+    assert response.status_code == status.HTTP_200_OK
+    for sample_id, counts in in_database_counts.items():
+        assert _get_counts(test_client, authz_headers, "cpm", sample_id) == pytest.approx(counts)
+
+
+def test_normalization_in_database_unsupported(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    response = test_client.post(f"/normalize/{EXP_ID}/tmm", params={"in_database": True}, headers=authz_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_normalization_sparse(test_client: TestClient, authz_headers, config: Config, db_cleanup, db_with_experiment):
+    samples = {
+        "S1": [10, 0, 5, 0, 12, 0, 7, 0, 4, 0],
+        "S2": [0, 10, 30, 0, 0, 30, 20, 0, 30, 0],
+        "S3": [30, 3, 0, 25, 40, 0, 0, 30, 12, 0],
+    }
+    gene_lengths = "\n".join(["GeneID,GeneLength", *(f"{g},{n}" for g, n in zip(GENES, [1000, 2000, 500] * 3 + [0]))])
+    methods = list(NormalizationMethodEnum)
+
+    def _normalize_all(blocked: bool = False):
+        response = test_client.post(
+            f"/normalize/{EXP_ID}",
+            params={"methods": [m.value for m in methods], "blocked": blocked},
+            files={"gene_lengths_file": gene_lengths.encode("utf-8")},
+            headers=authz_headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    def _all_counts():
+        return {(m, s): _get_counts(test_client, authz_headers, m, s) for m in ["raw", *methods] for s in samples}
+
+    def _reset_experiment(skip_zeros: bool):
+        assert test_client.delete(f"/experiment/{EXP_ID}", headers=authz_headers).status_code == status.HTTP_200_OK
+        response = test_client.post("/experiment", json=TEST_EXPERIMENT_RESULT.model_dump(), headers=authz_headers)
+        assert response.status_code == status.HTTP_200_OK
+        _ingest_rcm(test_client, authz_headers, samples, skip_zeros=skip_zeros)
+
+    _ingest_rcm(test_client, authz_headers, samples)
+    _normalize_all()
+    # GENE_9 has no counts: it is not part of the sparse experiment
+    dense_counts = {key: counts[:9] if key[0] == "raw" else counts for key, counts in _all_counts().items()}
+
+    _reset_experiment(skip_zeros=True)
+    response = test_client.get(f"/experiment/{EXP_ID}", headers=authz_headers)
+    assert response.json()["sparse"]
+    response = test_client.post(
+        "/expressions", headers=authz_headers, json={"experiments": [EXP_ID], "sample_ids": ["S1"]}
+    )
+    assert response.json()["total_records"] == 9
+
+    # Implicit zeros are only normalized once a normalization ran
+    assert _get_counts(test_client, authz_headers, "raw", "S1") == dense_counts[("raw", "S1")]
+    response = test_client.post("/expressions", headers=authz_headers, json={"method": "tmm", "experiments": [EXP_ID]})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    _normalize_all()
+    for key, counts in _all_counts().items():
+        assert counts == pytest.approx(dense_counts[key])
+
+    _reset_experiment(skip_zeros=True)
+    # 9 genes and at most 18 values per block: blocks of 2 samples
+    test_client.app.dependency_overrides[get_config] = lambda: config.model_copy(
+        update={"normalization_max_block_values": 18}
+    )
+    try:
+        _normalize_all(blocked=True)
+    finally:
+        test_client.app.dependency_overrides.pop(get_config)
+    for key, counts in _all_counts().items():
+        assert counts == pytest.approx(dense_counts[key])
@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from tests.test_db import TEST_EXPERIMENT_RESULT, TEST_EXPERIMENT_RESULT_ID
+from transcriptomics_data_service.config import get_config
+from transcriptomics_data_service.db import Database
+from transcriptomics_data_service.exceptions import TakuanDBException
+from transcriptomics_data_service.models import GeneExpression, NormalizationMethodEnum
+from transcriptomics_data_service.write_queue import GeneExpressionWriteQueue, merge_expressions
+
+
+def _expressions(sample_id: str, experiment_result_id: str = TEST_EXPERIMENT_RESULT_ID) -> list[GeneExpression]:
+    return [
+        GeneExpression(experiment_result_id=experiment_result_id, gene_code=gene, sample_id=sample_id, raw_count=i)
+        for i, gene in enumerate(["G1", "G2", "G3"])
+    ]
+
+
+async def _stored_samples(db: Database) -> set[str]:
+    return {e.sample_id async for e in db._select_expressions(TEST_EXPERIMENT_RESULT_ID)}
+
+
+def test_merge_expressions():
+    merged = merge_expressions(
+        [
+            GeneExpression(experiment_result_id="E", gene_code="G", sample_id="S", raw_count=1, tpm_count=2),
+            GeneExpression(experiment_result_id="E", gene_code="G", sample_id="S", raw_count=3),
+        ]
+    )
+    assert merged == [GeneExpression(experiment_result_id="E", gene_code="G", sample_id="S", raw_count=3, tpm_count=2)]
+
+
+@pytest.mark.asyncio
+async def test_write_queue_coalesces(db: Database, db_cleanup, db_with_experiment, monkeypatch):
+    n_copies = 0
+    copy = db.copy_or_update_gene_expressions
+
+    async def counting_copy(*args):
+        nonlocal n_copies
+        n_copies += 1
+        return await copy(*args)
+
+    monkeypatch.setattr(db, "copy_or_update_gene_expressions", counting_copy)
+    queue = GeneExpressionWriteQueue(db, db.logger, max_rows=1000, flush_latency=0.05)
+    results = await asyncio.gather(
+        *(queue.submit(TEST_EXPERIMENT_RESULT_ID, _expressions(s), [NormalizationMethodEnum.tpm]) for s in "ABC")
+    )
+    assert results == [3, 3, 3]
+    assert n_copies == 1
+    assert await _stored_samples(db) == {"A", "B", "C"}
+
+    # Reaching max_rows flushes without waiting for the latency
+    queue = GeneExpressionWriteQueue(db, db.logger, max_rows=3, flush_latency=3600)
+    assert await asyncio.wait_for(queue.submit(TEST_EXPERIMENT_RESULT_ID, _expressions("D"), []), 5) == 3
+    assert n_copies == 2
+
+
+@pytest.mark.asyncio
+async def test_write_queue_isolates_failures(db: Database, db_cleanup, db_with_experiment):
+    queue = GeneExpressionWriteQueue(db, db.logger, max_rows=1000, flush_latency=0.05)
+    results = await asyncio.gather(
+        queue.submit(TEST_EXPERIMENT_RESULT_ID, _expressions("A"), []),
+        # Unknown experiment, violates the foreign key
+        queue.submit("unknown-experiment", _expressions("B", "unknown-experiment"), []),
+        queue.submit(TEST_EXPERIMENT_RESULT_ID, _expressions("C"), []),
+        return_exceptions=True,
+    )
+    assert results[0] == 3 and results[2] == 3
+    assert isinstance(results[1], TakuanDBException)
+    assert await _stored_samples(db) == {"A", "C"}
+
+
+def test_ingest_single_write_queue(test_client: TestClient, authz_headers, db_cleanup, db_with_experiment):
+    test_client.app.dependency_overrides[get_config] = lambda: get_config().model_copy(
+        update={"ingestion_write_queue_enabled": True}
+    )
+    try:
+        response = test_client.post(
+            f"/experiment/{TEST_EXPERIMENT_RESULT.experiment_result_id}/ingest/single",
+            files=[("data", b"feature,count\nG1,1\nG2,2\n")],
+            data=dict(sample_id="S1", feature_col="feature", raw_count_col="count", file_type="csv"),
+            headers=authz_headers,
+        )
+    finally:
+        test_client.app.dependency_overrides.pop(get_config)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["message"] == "Ingested 2 GeneExpressions successfully"
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import Depends, HTTPException, status
+from functools import lru_cache
+from typing import Annotated, AsyncIterator, BinaryIO
+
+from .config import ConfigDependency
+from .logger import LoggerDependency
+
+__all__ = [
+    "MemoryAdmissionController",
+    "estimate_upload_memory",
+    "estimate_normalization_memory",
+    "get_admission_controller",
+    "AdmissionDependency",
+]
+
+# Estimated peak memory per byte of uncompressed upload: parsed data frame and GeneExpression objects
+UPLOAD_MEMORY_FACTOR = 100
+# Estimated expansion of compressed uploads (gzip, bzip2, zstd) once decompressed
+COMPRESSION_RATIO = 5
+COMPRESSION_MAGICS = (b"\x1f\x8b", b"BZh", b"\x28\xb5\x2f\xfd")
+# Estimated peak memory per count loaded by normalizations: fetched records, pivoted and normalized frames
+NORMALIZATION_BYTES_PER_COUNT = 200
+
+
+class MemoryAdmissionController:
+    """
+    Reserves the estimated memory of large jobs (ingestions, normalizations) against a global budget.
+
+    Jobs wait for enough memory to be released by running jobs, for at most max_wait seconds,
+    after which they are rejected with a 429 and a Retry-After header.
+    Jobs estimated larger than the whole budget are admitted once no other job is running.
+    The budget is shared by the jobs of a server process, it is disabled if None.
+    """
+
+    def __init__(self, budget: int | None, max_wait: float, retry_after: int, logger: logging.Logger):
+        self.budget = budget
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.logger = logger
+        self.reserved = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget is not None
+
+    @asynccontextmanager
+    async def reserve(self, n_bytes: int, job: str) -> AsyncIterator[None]:
+        """
+        Reserves n_bytes of the budget while the job runs.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        n_bytes = min(n_bytes, self.budget)
+        async with self._condition:
+            if self.reserved + n_bytes > self.budget:
+                self.logger.info(f"Queuing {job}: {n_bytes} bytes requested, {self.reserved} bytes reserved")
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self.reserved + n_bytes <= self.budget), self.max_wait
+                    )
+                except TimeoutError:
+                    raise HTTPException(
+                        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                        detail=f"Not enough memory available for the {job}, retry later.",
+                        headers={"Retry-After": str(self.retry_after)},
+                    )
+            self.reserved += n_bytes
+
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.reserved -= n_bytes
+                self._condition.notify_all()
+
+
+def estimate_upload_memory(files: list[BinaryIO]) -> int:
+    """
+    Estimates the peak memory of parsing uploaded files from their size, compressed files are detected
+    from their magic bytes. The files are rewound.
+    """
+    n_bytes = 0
+    for file in files:
+        magic = file.read(max(len(m) for m in COMPRESSION_MAGICS))
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        if any(magic.startswith(m) for m in COMPRESSION_MAGICS):
+            size *= COMPRESSION_RATIO
+        n_bytes += size * UPLOAD_MEMORY_FACTOR
+    return n_bytes
+
+
+def estimate_normalization_memory(n_counts: int) -> int:
+    """
+    Estimates the peak memory of normalizing n_counts counts loaded at once.
+    """
+    return n_counts * NORMALIZATION_BYTES_PER_COUNT
+
+
+@lru_cache()
+def get_admission_controller(config: ConfigDependency, logger: LoggerDependency) -> MemoryAdmissionController:
+    budget = config.admission_memory_budget_mb * (1 << 20) if config.admission_memory_budget_mb else None
+    return MemoryAdmissionController(
+        budget,
+        max_wait=config.admission_max_wait_s,
+        retry_after=config.admission_retry_after_s,
+        logger=logger,
+    )
+
+
+AdmissionDependency = Annotated[MemoryAdmissionController, Depends(get_admission_controller)]
@@ -71,6 +71,13 @@ class BaseAuthzMiddleware:
         """
         return None
 
+    def dep_gene_lengths_router(self) -> None | Sequence[Depends]:
+        """
+        Specify dependencies to be added to the gene_lengths_router.
+        This dependency will apply on all the router's paths.
+        """
+        return None
+
     ###### Endpoint specific dependency creators for authorization logic
 
     ###### INGEST router paths
@@ -99,3 +106,11 @@ class BaseAuthzMiddleware:
 
     def dep_authz_list_experiment_results(self) -> None | Sequence[Depends]:
         return None
+
+    ###### GENE LENGTHS router paths
+
+    def dep_authz_ingest_gene_lengths(self) -> None | Sequence[Depends]:
+        return None
+
+    def dep_authz_delete_gene_lengths(self) -> None | Sequence[Depends]:
+        return None
@@ -36,6 +36,36 @@ class Config(BaseSettings):
 
     cors_origins: tuple[str, ...] = ()
 
+    # Maximum number of counts (genes x samples) held in memory at once by blocked normalizations
+    normalization_max_block_values: int = 10_000_000
+
+    # Number of worker processes parsing the files of batch sample ingestions (-1 for all CPUs)
+    ingestion_n_jobs: int = -1
+
+    # Coalesce concurrent single sample ingestions into bulk transactions, written every
+    # ingestion_write_queue_flush_ms or once ingestion_write_queue_max_rows expressions are pending
+    ingestion_write_queue_enabled: bool = False
+    ingestion_write_queue_max_rows: int = 100_000
+    ingestion_write_queue_flush_ms: int = 50
+
+    # Number of parallel workers building each index after bulk loads
+    bulk_load_index_workers: int = 2
+
+    # Memory budget in MiB shared by the ingestions and normalizations of a server process, disabled if 0.
+    # Jobs exceeding the budget wait up to admission_max_wait_s, then are rejected with a 429
+    admission_memory_budget_mb: int = 0
+    admission_max_wait_s: float = 30
+    admission_retry_after_s: int = 30
+
+    # Maximum wait in seconds for the lock of an experiment written by another job, before a 409.
+    # Waits indefinitely if unset, does not wait if 0
+    experiment_lock_timeout_s: float | None = None
+
+    # Allow-listed root of the server-local files that can be ingested by path, disabled if unset
+    ingestion_local_root: str | None = None
+    # Endpoint of the S3-compatible object store for s3:// ingestions, defaults to AWS
+    object_store_endpoint_url: str | None = None
+
     # Enable/disable your authorization plugin
     authz_enabled: bool = False
 
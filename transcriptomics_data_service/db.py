@@ -11,14 +11,18 @@ from pathlib import Path
 
 
 from .config import Config, ConfigDependency
-from .exceptions import TakuanDBException
+from .exceptions import ExperimentLockedException, TakuanDBException
 from .logger import LoggerDependency
 from .models import (
     CountTypesEnum,
     ExperimentResult,
     GeneExpression,
     GeneExpressionData,
+    Ingestion,
+    IngestionStats,
+    NormalizationFactor,
     NormalizationMethodEnum,
+    NormalizationRun,
     PaginatedRequest,
 )
 
@@ -27,11 +31,62 @@ SCHEMA_PATH = SQL_PATH / "schema.sql"
 
 # Migrations to apply, in order
 MIGRATIONS = [
-    SQL_PATH / "migrate_v1_0_0.sql"  # from v1.0.0-rc
+    SQL_PATH / "migrate_v1_0_0.sql",  # from v1.0.0-rc
+    SQL_PATH / "migrate_v1_1_0.sql",  # from v1.0.0
 ]
 
 DEFAULT_PAGINATION: PaginatedRequest = PaginatedRequest(page=1, page_size=100)
 
+GENE_EXPRESSIONS_COLUMNS = [
+    "gene_code",
+    "sample_id",
+    "experiment_result_id",
+    "raw_count",
+    "tpm_count",
+    "tmm_count",
+    "getmm_count",
+    "fpkm_count",
+    "cpm_count",
+    "uq_count",
+    "deseq2_count",
+]
+
+# Secondary indexes of gene_expressions (index name: column), see schema.sql
+GENE_EXPRESSIONS_SECONDARY_INDEXES = {
+    "idx_gene_code": "gene_code",
+    "idx_sample_id": "sample_id",
+    "idx_experiment_result_id": "experiment_result_id",
+    "idx_experiment_sample_id": "experiment_result_id, sample_id",
+}
+
+# Version of the gene expressions read by queries, and written unless loading a snapshot, see migrate_v1_1_0.sql.
+# Readers select from the active_gene_expressions view instead of filtering on it.
+ACTIVE_VERSION = "(SELECT active_version FROM experiment_results WHERE experiment_result_id = {}::varchar)"
+
+# Ingested counts are merged with the stored ones, missing counts (NULL) do not overwrite stored values
+GENE_EXPRESSIONS_UPSERT_CONFLICT = """
+    ON CONFLICT (gene_code, sample_id, experiment_result_id, version)
+    DO UPDATE SET
+        raw_count = COALESCE(EXCLUDED.raw_count, ge.raw_count),
+        tpm_count = COALESCE(EXCLUDED.tpm_count, ge.tpm_count),
+        tmm_count = COALESCE(EXCLUDED.tmm_count, ge.tmm_count),
+        getmm_count = COALESCE(EXCLUDED.getmm_count, ge.getmm_count),
+        fpkm_count = COALESCE(EXCLUDED.fpkm_count, ge.fpkm_count),
+        cpm_count = COALESCE(EXCLUDED.cpm_count, ge.cpm_count),
+        uq_count = COALESCE(EXCLUDED.uq_count, ge.uq_count),
+        deseq2_count = COALESCE(EXCLUDED.deseq2_count, ge.deseq2_count)
+"""
+
+# Computed normalized values replace the stored ones, unchanged values are not written again
+NORMALIZED_EXPRESSIONS_UPSERT_CONFLICT = """
+    ON CONFLICT (experiment_result_id, version, gene_code, sample_id, method)
+    DO UPDATE SET value = EXCLUDED.value
+    WHERE ne.value IS DISTINCT FROM EXCLUDED.value
+"""
+
+# First key of the experiments' advisory locks, the second one is the hash of the experiment ID
+EXPERIMENT_LOCK_NAMESPACE = 0x54414B55
+
 
 def get_db_uri(config: Config) -> str:
     return f"postgres://{config.db_user}:{config.db_password}@{config.db_host}:{config.db_port}/{config.db_name}"
@@ -68,8 +123,8 @@ class Database(PgAsyncDatabase):
     ##########################
     async def create_experiment_result(self, exp: ExperimentResult, transaction_conn: asyncpg.Connection | None = None):
         query = """
-        INSERT INTO experiment_results (experiment_result_id, assembly_id, assembly_name, extra_properties)
-        VALUES ($1, $2, $3, $4)
+        INSERT INTO experiment_results (experiment_result_id, assembly_id, assembly_name, extra_properties, sparse)
+        VALUES ($1, $2, $3, $4, $5)
         """
         execute_args = (
             query,
@@ -77,6 +132,7 @@ class Database(PgAsyncDatabase):
             exp.assembly_id,
             exp.assembly_name,
             json.dumps(exp.extra_properties),
+            exp.sparse,
         )
         if transaction_conn is not None:
             # execute within transaction if a transaction_conn is passed
@@ -105,6 +161,7 @@ class Database(PgAsyncDatabase):
             assembly_name=res["assembly_name"],
             assembly_id=res["assembly_id"],
             extra_properties=extra_props,
+            sparse=res["sparse"],
         )
 
     async def update_experiment_result(self, exp: ExperimentResult):
@@ -117,6 +174,12 @@ class Database(PgAsyncDatabase):
             )
         )
 
+    async def mark_experiment_result_sparse(self, exp_id: str, transaction_conn: asyncpg.Connection | None = None):
+        conn: asyncpg.Connection
+        async with self.connect(transaction_conn) as conn:
+            await conn.execute("UPDATE experiment_results SET sparse = TRUE WHERE experiment_result_id = $1", exp_id)
+        self.logger.info(f"Marked experiment_result {exp_id} as sparse")
+
     async def delete_experiment_result(self, exp_id: str):
         await self._execute(*("DELETE FROM experiment_results WHERE experiment_result_id = $1", exp_id))
         self.logger.info(f"Deleted experiment_result row {exp_id}")
@@ -128,6 +191,7 @@ class Database(PgAsyncDatabase):
             assembly_id=record["assembly_id"],
             assembly_name=record["assembly_name"],
             extra_properties=extra_props,
+            sparse=record["sparse"],
         )
 
     ############################
@@ -175,19 +239,21 @@ class Database(PgAsyncDatabase):
         """
         count_query = """
             SELECT COUNT(DISTINCT sample_id)
-            FROM gene_expressions
+            FROM active_gene_expressions
             WHERE experiment_result_id = $1
         """
         base_query = """
             SELECT DISTINCT sample_id
-            FROM gene_expressions
+            FROM active_gene_expressions
             WHERE experiment_result_id = $1
             ORDER BY sample_id
         """
         async with self.connect() as conn:
-            total_records = await conn.fetchval(count_query, experiment_result_id)
-            query, params = self._paginated_query(base_query, [experiment_result_id], pagination)
-            rows = await conn.fetch(query, *params)
+            # The count and the page are read from the same snapshot
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                total_records = await conn.fetchval(count_query, experiment_result_id)
+                query, params = self._paginated_query(base_query, [experiment_result_id], pagination)
+                rows = await conn.fetch(query, *params)
         items = [r["sample_id"] for r in rows]
         return items, total_records
 
@@ -199,20 +265,22 @@ class Database(PgAsyncDatabase):
         """
         count_query = """
             SELECT COUNT(DISTINCT gene_code)
-            FROM gene_expressions
+            FROM active_gene_expressions
             WHERE experiment_result_id = $1
         """
         base_query = """
             SELECT DISTINCT gene_code
-            FROM gene_expressions
+            FROM active_gene_expressions
             WHERE experiment_result_id = $1
             ORDER BY gene_code
         """
 
         async with self.connect() as conn:
-            total_records = await conn.fetchval(count_query, experiment_result_id)
-            query, params = self._paginated_query(base_query, [experiment_result_id], pagination)
-            rows = await conn.fetch(query, *params)
+            # The count and the page are read from the same snapshot
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                total_records = await conn.fetchval(count_query, experiment_result_id)
+                query, params = self._paginated_query(base_query, [experiment_result_id], pagination)
+                rows = await conn.fetch(query, *params)
 
         items = [r["gene_code"] for r in rows]
         return items, total_records
@@ -227,9 +295,247 @@ class Database(PgAsyncDatabase):
         Creates rows on gene_expression as part of an Atomic transaction
         Rows on gene_expressions can only be created as part of an RCM ingestion.
         Ingestion is all-or-nothing, hence the transaction.
+        Rows are written in the active version of their experiment.
+        """
+        records = self._gene_expression_records(expressions)
+
+        query = (
+            f"""
+            INSERT INTO gene_expressions as ge (
+                gene_code, sample_id, experiment_result_id, raw_count, tpm_count, tmm_count, getmm_count, fpkm_count,
+                cpm_count, uq_count, deseq2_count, version
+            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, {ACTIVE_VERSION.format("$3")})
+        """
+            + GENE_EXPRESSIONS_UPSERT_CONFLICT
+        )
+        try:
+            await transaction_conn.executemany(query, records)
+        except asyncpg.PostgresError as e:
+            self.logger.error(e)
+            raise TakuanDBException("Failed to insert gene expression records.")
+        self.logger.info(f"Inserted {len(records)} gene expression records.")
+        return len(records)
+
+    async def append_gene_expressions(
+        self, expressions: list[GeneExpression], transaction_conn: asyncpg.Connection
+    ) -> int:
+        """
+        Appends rows on gene_expressions with COPY, as part of a transaction.
+        Faster than create_or_update_gene_expressions, but fails if any row already exists.
+        Rows are written in the active version of their experiment.
+        """
+        versions = await self.read_active_versions({e.experiment_result_id for e in expressions}, transaction_conn)
+        records = [(*r, versions.get(r[2])) for r in self._gene_expression_records(expressions)]
+        try:
+            await transaction_conn.copy_records_to_table(
+                "gene_expressions", records=records, columns=[*GENE_EXPRESSIONS_COLUMNS, "version"]
+            )
+        except asyncpg.PostgresError as e:
+            self.logger.error(e)
+            raise TakuanDBException("Failed to append gene expression records.")
+        self.logger.info(f"Appended {len(records)} gene expression records.")
+        return len(records)
+
+    async def fetch_stored_sample_ids(
+        self, experiment_result_id: str, sample_ids: set[str], transaction_conn: asyncpg.Connection | None = None
+    ) -> set[str]:
+        """
+        Returns which of the given samples have gene expressions stored for an experiment.
         """
-        # Prepare data for bulk insertion
-        records = [
+        query = """
+            SELECT DISTINCT sample_id FROM active_gene_expressions
+            WHERE experiment_result_id = $1 AND sample_id = ANY($2::text[])
+        """
+        conn: asyncpg.Connection
+        async with self.connect(transaction_conn) as conn:
+            rows = await conn.fetch(query, experiment_result_id, list(sample_ids))
+        return {r["sample_id"] for r in rows}
+
+    async def copy_or_update_gene_expressions(
+        self, expressions: list[GeneExpression], transaction_conn: asyncpg.Connection, version: int | None = None
+    ) -> int:
+        """
+        Bulk version of create_or_update_gene_expressions, as part of a transaction.
+        Rows are loaded with COPY in a staging table, then merged in gene_expressions with a single statement,
+        the expressions must therefore have unique (gene_code, sample_id, experiment_result_id) keys.
+        Rows are written in the given version, the active version of their experiment by default.
+        """
+        await self.create_gene_expressions_staging(transaction_conn)
+        await self.stage_gene_expressions(expressions, transaction_conn)
+        return await self.merge_staged_gene_expressions(transaction_conn, version=version)
+
+    async def create_gene_expressions_staging(self, transaction_conn: asyncpg.Connection):
+        """
+        Creates an empty staging table for gene expressions, without indexes, dropped when the transaction ends.
+        Temporary tables are not WAL logged.
+        """
+        await transaction_conn.execute(
+            """
+            CREATE TEMPORARY TABLE IF NOT EXISTS gene_expressions_staging
+                (LIKE gene_expressions INCLUDING DEFAULTS) ON COMMIT DROP;
+            TRUNCATE gene_expressions_staging;
+            """
+        )
+
+    async def stage_gene_expressions(
+        self, expressions: list[GeneExpression], transaction_conn: asyncpg.Connection
+    ) -> int:
+        """
+        Loads gene expressions in the staging table with COPY.
+        """
+        records = self._gene_expression_records(expressions)
+        try:
+            await transaction_conn.copy_records_to_table(
+                "gene_expressions_staging", records=records, columns=GENE_EXPRESSIONS_COLUMNS
+            )
+        except asyncpg.PostgresError as e:
+            self.logger.error(e)
+            raise TakuanDBException("Failed to copy gene expression records.")
+        return len(records)
+
+    async def merge_staged_gene_expressions(
+        self,
+        transaction_conn: asyncpg.Connection,
+        skip_zeros: bool = False,
+        rebuild_indexes: bool = False,
+        version: int | None = None,
+    ) -> int:
+        """
+        Merges the staged gene expressions in gene_expressions with a single statement, returns the number of rows
+        written. With skip_zeros, the staged zero raw counts are deleted instead.
+        With rebuild_indexes, the secondary indexes are dropped during the merge and built again afterwards,
+        which is faster for loads larger than the stored rows but locks gene_expressions until the transaction ends.
+        Rows are written in the given version, the active version of their experiment by default.
+        """
+        columns = ", ".join(GENE_EXPRESSIONS_COLUMNS)
+        staged_columns = ", ".join(f"s.{c}" for c in GENE_EXPRESSIONS_COLUMNS)
+        try:
+            if rebuild_indexes:
+                await transaction_conn.execute(
+                    "".join(f"DROP INDEX IF EXISTS {index};" for index in GENE_EXPRESSIONS_SECONDARY_INDEXES)
+                )
+            # Inserting in primary key order keeps the index pages writes local.
+            # Rows of unknown experiments get a NULL version, and fail like their foreign key would.
+            result = await transaction_conn.execute(
+                f"""
+                INSERT INTO gene_expressions as ge ({columns}, version)
+                SELECT {staged_columns}, COALESCE($1::integer, er.active_version)
+                FROM gene_expressions_staging s
+                LEFT JOIN experiment_results er ON er.experiment_result_id = s.experiment_result_id
+                {"WHERE s.raw_count IS DISTINCT FROM 0" if skip_zeros else ""}
+                ORDER BY s.gene_code, s.sample_id, s.experiment_result_id
+                """
+                + GENE_EXPRESSIONS_UPSERT_CONFLICT,
+                version,
+            )
+            if skip_zeros:
+                # Zeros replacing stored counts become implicit as well
+                await transaction_conn.execute(
+                    """
+                    DELETE FROM gene_expressions ge USING gene_expressions_staging s, experiment_results er
+                    WHERE s.raw_count = 0 AND ge.gene_code = s.gene_code AND ge.sample_id = s.sample_id
+                        AND ge.experiment_result_id = s.experiment_result_id
+                        AND er.experiment_result_id = ge.experiment_result_id
+                        AND ge.version = COALESCE($1::integer, er.active_version)
+                    """,
+                    version,
+                )
+            if rebuild_indexes:
+                # Secondary indexes are built by parallel workers
+                await transaction_conn.execute(
+                    f"SET LOCAL max_parallel_maintenance_workers = {int(self._config.bulk_load_index_workers)};"
+                    + "".join(
+                        f"CREATE INDEX IF NOT EXISTS {index} ON gene_expressions({column});"
+                        for index, column in GENE_EXPRESSIONS_SECONDARY_INDEXES.items()
+                    )
+                )
+        except asyncpg.PostgresError as e:
+            self.logger.error(e)
+            raise TakuanDBException("Failed to merge staged gene expression records.")
+        n_written = int(result.split()[-1])
+        self.logger.info(f"Merged {n_written} staged gene expression records.")
+        return n_written
+
+    async def diff_staged_gene_expressions(
+        self, transaction_conn: asyncpg.Connection, skip_zeros: bool = False
+    ) -> IngestionStats:
+        """
+        Merges the staged gene expressions in gene_expressions, only writing the rows with new or changed counts:
+        stored rows with identical counts are left untouched, and do not create new row versions.
+        With skip_zeros, the stored rows with a staged zero raw count are deleted instead.
+        """
+        columns = ", ".join(GENE_EXPRESSIONS_COLUMNS)
+        staged_columns = ", ".join(f"s.{c}" for c in GENE_EXPRESSIONS_COLUMNS)
+        changed = " OR ".join(
+            f"(EXCLUDED.{c} IS NOT NULL AND EXCLUDED.{c} IS DISTINCT FROM ge.{c})" for c in GENE_EXPRESSIONS_COLUMNS[3:]
+        )
+        staged_filter = "WHERE s.raw_count IS DISTINCT FROM 0" if skip_zeros else ""
+        try:
+            # xmax is 0 for inserted rows, and set for updated ones
+            rec = await transaction_conn.fetchrow(
+                f"""
+                WITH written AS (
+                    INSERT INTO gene_expressions as ge ({columns}, version)
+                    SELECT {staged_columns}, er.active_version
+                    FROM gene_expressions_staging s
+                    LEFT JOIN experiment_results er ON er.experiment_result_id = s.experiment_result_id
+                    {staged_filter}
+                    ORDER BY s.gene_code, s.sample_id, s.experiment_result_id
+                    {GENE_EXPRESSIONS_UPSERT_CONFLICT}
+                    WHERE {changed}
+                    RETURNING xmax = 0 AS inserted
+                )
+                SELECT
+                    (SELECT count(*) FROM gene_expressions_staging s {staged_filter}) AS staged,
+                    count(*) FILTER (WHERE inserted) AS inserted,
+                    count(*) FILTER (WHERE NOT inserted) AS changed
+                FROM written
+                """
+            )
+            deleted = 0
+            if skip_zeros:
+                result = await transaction_conn.execute(
+                    """
+                    DELETE FROM gene_expressions ge USING gene_expressions_staging s, experiment_results er
+                    WHERE s.raw_count = 0 AND ge.gene_code = s.gene_code AND ge.sample_id = s.sample_id
+                        AND ge.experiment_result_id = s.experiment_result_id
+                        AND er.experiment_result_id = ge.experiment_result_id AND ge.version = er.active_version
+                    """
+                )
+                deleted = int(result.split()[-1])
+        except asyncpg.PostgresError as e:
+            self.logger.error(e)
+            raise TakuanDBException("Failed to merge staged gene expression records.")
+        stats = IngestionStats(
+            inserted=rec["inserted"],
+            changed=rec["changed"],
+            unchanged=rec["staged"] - rec["inserted"] - rec["changed"],
+            deleted=deleted,
+        )
+        self.logger.info(f"Merged staged gene expression records: {stats}")
+        return stats
+
+    async def estimate_gene_expressions_rows(self, transaction_conn: asyncpg.Connection | None = None) -> int:
+        """
+        Returns the planner's estimate of the number of rows in gene_expressions, 0 if never analyzed.
+        """
+        conn: asyncpg.Connection
+        async with self.connect(transaction_conn) as conn:
+            estimate = await conn.fetchval("SELECT reltuples FROM pg_class WHERE oid = 'gene_expressions'::regclass")
+        return max(int(estimate), 0)
+
+    async def analyze_gene_expressions(self):
+        """
+        Updates the planner statistics of gene_expressions, after large loads.
+        """
+        conn: asyncpg.Connection
+        async with self.connect() as conn:
+            await conn.execute("ANALYZE gene_expressions")
+
+    @staticmethod
+    def _gene_expression_records(expressions: list[GeneExpression]) -> list[tuple]:
+        # Ordered as GENE_EXPRESSIONS_COLUMNS
+        return [
             (
                 expr.gene_code,
                 expr.sample_id,
@@ -239,34 +545,137 @@ class Database(PgAsyncDatabase):
                 expr.tmm_count,
                 expr.getmm_count,
                 expr.fpkm_count,
+                expr.cpm_count,
+                expr.uq_count,
+                expr.deseq2_count,
             )
             for expr in expressions
         ]
 
-        query = """
-            INSERT INTO gene_expressions as ge (
-                gene_code, sample_id, experiment_result_id, raw_count, tpm_count, tmm_count, getmm_count, fpkm_count
-            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-            ON CONFLICT (gene_code, sample_id, experiment_result_id)
-            DO UPDATE SET
-                raw_count = COALESCE(EXCLUDED.raw_count, ge.raw_count),
-                tpm_count = COALESCE(EXCLUDED.tpm_count, ge.tpm_count),
-                tmm_count = COALESCE(EXCLUDED.tmm_count, ge.tmm_count),
-                getmm_count = COALESCE(EXCLUDED.getmm_count, ge.getmm_count),
-                fpkm_count = COALESCE(EXCLUDED.fpkm_count, ge.fpkm_count)
-            """
-        try:
-            await transaction_conn.executemany(query, records)
-        except asyncpg.PostgresError as e:
-            self.logger.error(e)
-            raise TakuanDBException("Failed to insert gene expression records.")
-        self.logger.info(f"Inserted {len(records)} gene expression records.")
-        return len(records)
+    async def delete_gene_expressions(
+        self, experiment_result_id: str, keys: list[tuple[str, str]], transaction_conn: asyncpg.Connection
+    ) -> int:
+        """
+        Deletes the (gene_code, sample_id) rows of an experiment on gene_expressions, as part of a transaction.
+        """
+        if not keys:
+            return 0
+        query = f"""
+            DELETE FROM gene_expressions ge
+            USING unnest($2::text[], $3::text[]) AS k(gene_code, sample_id)
+            WHERE ge.experiment_result_id = $1 AND ge.gene_code = k.gene_code AND ge.sample_id = k.sample_id
+                AND ge.version = {ACTIVE_VERSION.format("$1")}
+        """
+        genes, samples = zip(*keys)
+        result = await transaction_conn.execute(query, experiment_result_id, list(genes), list(samples))
+        n_deleted = int(result.split()[-1])
+        self.logger.info(f"Deleted {n_deleted} gene expression records.")
+        return n_deleted
+
+    async def delete_samples(
+        self, experiment_result_id: str, sample_ids: set[str], transaction_conn: asyncpg.Connection | None = None
+    ) -> int:
+        """
+        Deletes the gene expressions of samples of an experiment, returns the number of rows deleted.
+        The experiment's normalization runs and recorded ingestions no longer describe its data, and are deleted.
+        """
+        conn: asyncpg.Connection
+        async with self.transaction_connection(transaction_conn) as conn:
+            try:
+                result = await conn.execute(
+                    f"""
+                    DELETE FROM gene_expressions
+                    WHERE experiment_result_id = $1 AND sample_id = ANY($2::text[])
+                        AND version = {ACTIVE_VERSION.format("$1")}
+                    """,
+                    experiment_result_id,
+                    list(sample_ids),
+                )
+                n_deleted = int(result.split()[-1])
+                if n_deleted:
+                    await conn.execute(
+                        "DELETE FROM normalization_runs WHERE experiment_result_id = $1", experiment_result_id
+                    )
+                    await conn.execute("DELETE FROM ingestions WHERE experiment_result_id = $1", experiment_result_id)
+            except asyncpg.PostgresError as e:
+                self.logger.error(e)
+                raise TakuanDBException("Failed to delete samples.")
+        self.logger.info(f"Deleted {n_deleted} gene expression records of {len(sample_ids)} samples.")
+        return n_deleted
+
+    async def read_active_versions(
+        self, experiment_result_ids: set[str], transaction_conn: asyncpg.Connection | None = None
+    ) -> dict[str, int]:
+        """
+        Returns the active version of the gene expressions of experiments.
+        """
+        conn: asyncpg.Connection
+        async with self.connect(transaction_conn) as conn:
+            rows = await conn.fetch(
+                "SELECT experiment_result_id, active_version FROM experiment_results "
+                + "WHERE experiment_result_id = ANY($1::text[])",
+                list(experiment_result_ids),
+            )
+        return {r["experiment_result_id"]: r["active_version"] for r in rows}
+
+    async def next_gene_expressions_version(self, experiment_result_id: str) -> int:
+        """
+        Returns a new version number for a snapshot of an experiment's gene expressions, greater than any stored
+        version, including the versions of aborted snapshots not yet deleted.
+        """
+        conn: asyncpg.Connection
+        async with self.connect() as conn:
+            return await conn.fetchval(
+                f"""
+                SELECT GREATEST(MAX(version), {ACTIVE_VERSION.format("$1")}) + 1
+                FROM gene_expressions WHERE experiment_result_id = $1
+                """,
+                experiment_result_id,
+            )
+
+    async def activate_gene_expressions_version(
+        self, experiment_result_id: str, version: int, transaction_conn: asyncpg.Connection | None = None
+    ):
+        """
+        Makes a snapshot of an experiment's gene expressions the version read by queries, atomically.
+        The experiment's normalization runs and recorded ingestions described the previous version, and are deleted.
+        The rows of the previous versions are left for delete_inactive_gene_expressions.
+        """
+        conn: asyncpg.Connection
+        async with self.transaction_connection(transaction_conn) as conn:
+            await conn.execute(
+                "UPDATE experiment_results SET active_version = $2 WHERE experiment_result_id = $1",
+                experiment_result_id,
+                version,
+            )
+            await conn.execute("DELETE FROM normalization_runs WHERE experiment_result_id = $1", experiment_result_id)
+            await conn.execute("DELETE FROM ingestions WHERE experiment_result_id = $1", experiment_result_id)
+        self.logger.info(f"Activated version {version} of experiment {experiment_result_id}.")
+
+    async def delete_inactive_gene_expressions(self, experiment_result_id: str, version: int | None = None) -> int:
+        """
+        Deletes the gene expressions of an experiment's previous versions, or of an aborted snapshot version.
+        Queries started before the activation of the current version still read the deleted rows.
+        """
+        if version is None:
+            condition = f"version < {ACTIVE_VERSION.format('$1')}"
+            params = [experiment_result_id]
+        else:
+            condition = f"version = $2 AND version <> {ACTIVE_VERSION.format('$1')}"
+            params = [experiment_result_id, version]
+        conn: asyncpg.Connection
+        async with self.connect() as conn:
+            result = await conn.execute(
+                f"DELETE FROM gene_expressions WHERE experiment_result_id = $1 AND {condition}", *params
+            )
+        n_deleted = int(result.split()[-1])
+        self.logger.info(f"Deleted {n_deleted} inactive gene expression records of {experiment_result_id}.")
+        return n_deleted
 
     async def _select_expressions(self, exp_id: str | None) -> AsyncIterator[GeneExpression]:
         conn: asyncpg.Connection
         where_clause = "WHERE experiment_result_id = $1" if exp_id is not None else ""
-        query = f"SELECT * FROM gene_expressions {where_clause}"
+        query = f"SELECT * FROM active_gene_expressions {where_clause}"
         async with self.connect() as conn:
             res = await conn.fetch(query, *(exp_id,) if exp_id is not None else ())
         for r in map(lambda g: self._deserialize_gene_expression(g), res):
@@ -282,39 +691,76 @@ class Database(PgAsyncDatabase):
             tmm_count=rec["tmm_count"] if rec["tmm_count"] else None,
             getmm_count=rec["getmm_count"] if rec["getmm_count"] else None,
             fpkm_count=rec["fpkm_count"] if rec["fpkm_count"] else None,
+            cpm_count=rec["cpm_count"] if rec["cpm_count"] else None,
+            uq_count=rec["uq_count"] if rec["uq_count"] else None,
+            deseq2_count=rec["deseq2_count"] if rec["deseq2_count"] else None,
         )
 
     ############################
     # Normalization Methods
     ############################
 
-    async def update_normalized_expressions(self, expressions: List[GeneExpression], method: NormalizationMethodEnum):
+    async def fetch_raw_counts(
+        self,
+        experiment_result_id: str,
+        sample_ids: List[str] | None = None,
+        transaction_conn: asyncpg.Connection | None = None,
+    ) -> List[asyncpg.Record]:
+        """
+        Returns the (gene_code, sample_id, raw_count) records of an experiment, for normalization.
+        sample_ids restricts the records to a block of samples.
         """
-        Update the normalized expressions in the database using batch updates.
+        query = """
+            SELECT gene_code, sample_id, raw_count
+            FROM active_gene_expressions
+            WHERE experiment_result_id = $1 AND raw_count IS NOT NULL
         """
-        column = f"{method.value}_count"
-        if not column:
-            raise ValueError(f"Unsupported normalization method: {method}")
+        params = [experiment_result_id]
+        if sample_ids is not None:
+            query += " AND sample_id = ANY($2)"
+            params.append(sample_ids)
         conn: asyncpg.Connection
-        async with self.transaction_connection() as conn:
-            # Prepare data for bulk update
-            records = [
-                (
-                    getattr(expr, column),
-                    expr.experiment_result_id,
-                    expr.gene_code,
-                    expr.sample_id,
-                )
-                for expr in expressions
-            ]
+        async with self.connect(transaction_conn) as conn:
+            return await conn.fetch(query, *params)
+
+    async def fetch_raw_counts_shape(self, experiment_result_id: str) -> tuple[List[str], int]:
+        """
+        Returns the sample IDs and the number of genes of an experiment's raw counts, without loading them.
+        """
+        conn: asyncpg.Connection
+        async with self.connect() as conn:
+            samples = await conn.fetch(
+                "SELECT DISTINCT sample_id FROM active_gene_expressions WHERE experiment_result_id = $1 ORDER BY sample_id",
+                experiment_result_id,
+            )
+            n_genes = await conn.fetchval(
+                "SELECT COUNT(DISTINCT gene_code) FROM active_gene_expressions WHERE experiment_result_id = $1",
+                experiment_result_id,
+            )
+        return [r["sample_id"] for r in samples], n_genes
 
+    async def update_normalized_values(
+        self,
+        experiment_result_id: str,
+        methods: List[NormalizationMethodEnum],
+        records: List[tuple],
+        transaction_conn: asyncpg.Connection | None = None,
+    ):
+        """
+        Update the normalized values of one or more methods in the database, with a single bulk upsert.
+        Records are (gene_code, sample_id, *values) tuples holding a value for each method, in order.
+        None values leave the stored values untouched, as do records without a stored gene expression.
+        Values are written to the narrow normalized_expressions table, leaving the gene_expressions rows untouched.
+        """
+        columns = [f"{method.value}_count" for method in methods]
+        conn: asyncpg.Connection
+        async with self.transaction_connection(transaction_conn) as conn:
             await conn.execute(
-                """
+                f"""
                 CREATE TEMPORARY TABLE temp_updates (
-                    value DOUBLE PRECISION,
-                    experiment_result_id VARCHAR(255),
                     gene_code VARCHAR(255),
-                    sample_id VARCHAR(255)
+                    sample_id VARCHAR(255),
+                    {", ".join(f"{column} DOUBLE PRECISION" for column in columns)}
                 ) ON COMMIT DROP
                 """
             )
@@ -322,30 +768,409 @@ class Database(PgAsyncDatabase):
             await conn.copy_records_to_table(
                 "temp_updates",
                 records=records,
-                columns=["value", "experiment_result_id", "gene_code", "sample_id"],
+                columns=["gene_code", "sample_id", *columns],
             )
 
-            # Update the main table
+            # One row per method and value
+            method_values = ", ".join(f"('{method.value}', t.{method.value}_count)" for method in methods)
             await conn.execute(
                 f"""
-                UPDATE gene_expressions
-                SET {column} = temp_updates.value
-                FROM temp_updates
-                WHERE gene_expressions.experiment_result_id = temp_updates.experiment_result_id
-                    AND gene_expressions.gene_code = temp_updates.gene_code
-                    AND gene_expressions.sample_id = temp_updates.sample_id
+                INSERT INTO normalized_expressions AS ne (
+                    experiment_result_id, version, gene_code, sample_id, method, value
+                )
+                SELECT ge.experiment_result_id, ge.version, ge.gene_code, ge.sample_id, v.method, v.value
+                FROM temp_updates t
+                JOIN gene_expressions ge ON ge.experiment_result_id = $1
+                    AND ge.version = {ACTIVE_VERSION.format("$1")}
+                    AND ge.gene_code = t.gene_code
+                    AND ge.sample_id = t.sample_id
+                CROSS JOIN LATERAL (VALUES {method_values}) AS v(method, value)
+                WHERE v.value IS NOT NULL
                 """
+                + NORMALIZED_EXPRESSIONS_UPSERT_CONFLICT,
+                experiment_result_id,
             )
-        self.logger.info(f"Updated normalized values for method '{method}'.")
+            # Dropped right away, for several updates to share a transaction
+            await conn.execute("DROP TABLE temp_updates")
+        self.logger.info(f"Updated normalized values for methods {', '.join(m.value for m in methods)}.")
 
-    @asynccontextmanager
-    async def transaction_connection(self):
+    ############################
+    # CRUD: normalization_runs
+    ############################
+
+    async def read_normalization_run(
+        self, experiment_result_id: str, method: NormalizationMethodEnum
+    ) -> NormalizationRun | None:
+        conn: asyncpg.Connection
+        async with self.connect() as conn:
+            run = await conn.fetchrow(
+                "SELECT * FROM normalization_runs WHERE experiment_result_id = $1 AND method = $2",
+                experiment_result_id,
+                method.value,
+            )
+            if run is None:
+                return None
+            factors = await conn.fetch(
+                """
+                SELECT sample_id, library_size, norm_factor, input_checksum
+                FROM normalization_factors
+                WHERE experiment_result_id = $1 AND method = $2
+                ORDER BY sample_id
+                """,
+                experiment_result_id,
+                method.value,
+            )
+        return NormalizationRun(
+            experiment_result_id=run["experiment_result_id"],
+            method=run["method"],
+            reference_sample_id=run["reference_sample_id"],
+            input_checksum=run["input_checksum"],
+            library_scale=run["library_scale"],
+            factors=[
+                NormalizationFactor(
+                    sample_id=f["sample_id"],
+                    library_size=f["library_size"],
+                    norm_factor=f["norm_factor"],
+                    input_checksum=f["input_checksum"],
+                )
+                for f in factors
+            ],
+        )
+
+    async def create_or_update_normalization_run(
+        self, run: NormalizationRun, transaction_conn: asyncpg.Connection | None = None
+    ):
+        """
+        Replaces the stored normalization run (and its per-sample factors) of an experiment for a method.
+        """
+        conn: asyncpg.Connection
+        async with self.transaction_connection(transaction_conn) as conn:
+            # Factors are deleted through ON DELETE CASCADE
+            await conn.execute(
+                "DELETE FROM normalization_runs WHERE experiment_result_id = $1 AND method = $2",
+                run.experiment_result_id,
+                run.method.value,
+            )
+            await conn.execute(
+                """
+                INSERT INTO normalization_runs (
+                    experiment_result_id, method, reference_sample_id, input_checksum, library_scale
+                ) VALUES ($1, $2, $3, $4, $5)
+                """,
+                run.experiment_result_id,
+                run.method.value,
+                run.reference_sample_id,
+                run.input_checksum,
+                run.library_scale,
+            )
+            await conn.copy_records_to_table(
+                "normalization_factors",
+                records=[
+                    (
+                        run.experiment_result_id,
+                        run.method.value,
+                        f.sample_id,
+                        f.library_size,
+                        f.norm_factor,
+                        f.input_checksum,
+                    )
+                    for f in run.factors
+                ],
+                columns=[
+                    "experiment_result_id",
+                    "method",
+                    "sample_id",
+                    "library_size",
+                    "norm_factor",
+                    "input_checksum",
+                ],
+            )
+        self.logger.info(f"Stored {run.method.value} normalization run for experiment {run.experiment_result_id}")
+
+    async def delete_normalization_runs(
+        self,
+        experiment_result_id: str,
+        methods: List[NormalizationMethodEnum],
+        transaction_conn: asyncpg.Connection | None = None,
+    ):
+        """
+        Deletes the stored normalization runs of an experiment for the given methods, along with the normalized
+        values they computed. Used when the normalized values they produced get overwritten by an ingestion.
+        """
+        if not methods:
+            return
+        conn: asyncpg.Connection
+        async with self.transaction_connection(transaction_conn) as conn:
+            for table in ("normalization_runs", "normalized_expressions"):
+                await conn.execute(
+                    f"DELETE FROM {table} WHERE experiment_result_id = $1 AND method = ANY($2::text[])",
+                    experiment_result_id,
+                    [m.value for m in methods],
+                )
+
+    ############################
+    # CRUD: ingestions
+    ############################
+    async def create_ingestion(self, ingestion: Ingestion, transaction_conn: asyncpg.Connection | None = None):
+        conn: asyncpg.Connection
+        async with self.connect(transaction_conn) as conn:
+            try:
+                await conn.execute(
+                    """
+                    INSERT INTO ingestions (experiment_result_id, content_hash, idempotency_key, n_created)
+                    VALUES ($1, $2, $3, $4)
+                    """,
+                    ingestion.experiment_result_id,
+                    ingestion.content_hash,
+                    ingestion.idempotency_key,
+                    ingestion.n_created,
+                )
+            except asyncpg.PostgresError as e:
+                self.logger.error(e)
+                raise TakuanDBException("Failed to record the ingestion.")
+
+    async def read_ingestion(self, experiment_result_id: str, idempotency_key: str) -> Ingestion | None:
+        conn: asyncpg.Connection
+        async with self.connect() as conn:
+            rec = await conn.fetchrow(
+                "SELECT * FROM ingestions WHERE experiment_result_id = $1 AND idempotency_key = $2",
+                experiment_result_id,
+                idempotency_key,
+            )
+        return self._deserialize_ingestion(rec) if rec else None
+
+    async def read_last_ingestion(self, experiment_result_id: str) -> Ingestion | None:
+        conn: asyncpg.Connection
+        async with self.connect() as conn:
+            rec = await conn.fetchrow(
+                "SELECT * FROM ingestions WHERE experiment_result_id = $1 ORDER BY ingestion_id DESC LIMIT 1",
+                experiment_result_id,
+            )
+        return self._deserialize_ingestion(rec) if rec else None
+
+    def _deserialize_ingestion(self, rec: asyncpg.Record) -> Ingestion:
+        return Ingestion(
+            experiment_result_id=rec["experiment_result_id"],
+            content_hash=rec["content_hash"],
+            idempotency_key=rec["idempotency_key"],
+            n_created=rec["n_created"],
+        )
+
+    ############################
+    # CRUD: gene_lengths
+    ############################
+
+    async def replace_gene_lengths(self, assembly_id: str, gene_lengths: dict[str, float]) -> int:
+        """
+        Replaces all the registered gene lengths of an assembly, returning the number of gene lengths stored.
+        """
+        conn: asyncpg.Connection
+        async with self.transaction_connection() as conn:
+            await conn.execute("DELETE FROM gene_lengths WHERE assembly_id = $1", assembly_id)
+            await conn.copy_records_to_table(
+                "gene_lengths",
+                records=[(assembly_id, gene_code, length) for gene_code, length in gene_lengths.items()],
+                columns=["assembly_id", "gene_code", "gene_length"],
+            )
+        self.logger.info(f"Registered {len(gene_lengths)} gene lengths for assembly {assembly_id}")
+        return len(gene_lengths)
+
+    async def delete_gene_lengths(self, assembly_id: str):
+        await self._execute(*("DELETE FROM gene_lengths WHERE assembly_id = $1", assembly_id))
+        self.logger.info(f"Deleted gene lengths of assembly {assembly_id}")
+
+    async def fetch_experiment_gene_lengths(self, experiment_result_id: str) -> dict[str, float]:
+        """
+        Returns the registered gene lengths of an experiment's assembly, for the features of the experiment only.
+        """
+        query = """
+            SELECT gl.gene_code, gl.gene_length
+            FROM gene_lengths gl
+            JOIN experiment_results er ON er.assembly_id = gl.assembly_id
+            WHERE er.experiment_result_id = $1
+                AND EXISTS (
+                    SELECT 1 FROM active_gene_expressions ge
+                    WHERE ge.experiment_result_id = $1 AND ge.gene_code = gl.gene_code
+                )
+        """
         conn: asyncpg.Connection
         async with self.connect() as conn:
+            rows = await conn.fetch(query, experiment_result_id)
+        return {r["gene_code"]: r["gene_length"] for r in rows}
+
+    async def fetch_normalization_inputs(
+        self, experiment_result_id: str, with_lengths: bool, transaction_conn: asyncpg.Connection | None = None
+    ) -> List[asyncpg.Record]:
+        """
+        Returns the library size and a checksum of the raw counts of each sample of an experiment, computed
+        in the database. With with_lengths, only the genes with a registered length for the experiment's assembly
+        are counted, and their lengths are part of the checksum.
+        """
+        if with_lengths:
+            checksum_input = "ge.gene_code || ':' || ge.raw_count || ':' || gl.gene_length"
+            lengths_join = "JOIN gene_lengths gl ON gl.assembly_id = er.assembly_id AND gl.gene_code = ge.gene_code"
+        else:
+            checksum_input = "ge.gene_code || ':' || ge.raw_count"
+            lengths_join = ""
+        query = f"""
+            SELECT
+                ge.sample_id,
+                SUM(ge.raw_count) AS library_size,
+                encode(
+                    sha256(convert_to(string_agg({checksum_input}, ',' ORDER BY ge.gene_code), 'UTF8')),
+                    'hex'
+                ) AS input_checksum
+            FROM active_gene_expressions ge
+            JOIN experiment_results er ON er.experiment_result_id = ge.experiment_result_id
+            {lengths_join}
+            WHERE ge.experiment_result_id = $1 AND ge.raw_count IS NOT NULL
+            GROUP BY ge.sample_id
+        """
+        conn: asyncpg.Connection
+        async with self.connect(transaction_conn) as conn:
+            return await conn.fetch(query, experiment_result_id)
+
+    async def normalize_in_database(
+        self,
+        experiment_result_id: str,
+        method: NormalizationMethodEnum,
+        transaction_conn: asyncpg.Connection | None = None,
+    ) -> int:
+        """
+        Compute the TPM, FPKM or CPM values of an experiment in the database with a single upsert,
+        from its raw counts and, for TPM and FPKM, the registered gene lengths of its assembly.
+        Genes and samples with zero total counts are left untouched.
+        Returns the number of written normalized values.
+        """
+        if method is NormalizationMethodEnum.cpm:
+            source = """
+                SELECT ge.gene_code, ge.sample_id, ge.version, ge.raw_count, ge.raw_count AS value
+                FROM gene_expressions ge
+                JOIN experiment_results er
+                    ON er.experiment_result_id = ge.experiment_result_id AND er.active_version = ge.version
+                WHERE ge.experiment_result_id = $1 AND ge.raw_count IS NOT NULL
+            """
+        else:
+            source = """
+                SELECT
+                    ge.gene_code, ge.sample_id, ge.version, ge.raw_count, ge.raw_count * 1e3 / gl.gene_length AS value
+                FROM gene_expressions ge
+                JOIN experiment_results er
+                    ON er.experiment_result_id = ge.experiment_result_id AND er.active_version = ge.version
+                JOIN gene_lengths gl ON gl.assembly_id = er.assembly_id AND gl.gene_code = ge.gene_code
+                WHERE ge.experiment_result_id = $1 AND ge.raw_count IS NOT NULL AND gl.gene_length > 0
+            """
+        # TPM scales the reads per kilobase by their sample total, FPKM and CPM by the library size
+        scale_column = "value" if method is NormalizationMethodEnum.tpm else "raw_count"
+        query = f"""
+            WITH source AS ({source}), totals AS (
+                SELECT
+                    gene_code,
+                    sample_id,
+                    version,
+                    value,
+                    SUM({scale_column}) OVER (PARTITION BY sample_id) AS sample_total,
+                    SUM(raw_count) OVER (PARTITION BY gene_code) AS gene_total
+                FROM source
+            )
+            INSERT INTO normalized_expressions AS ne (experiment_result_id, version, gene_code, sample_id, method, value)
+            SELECT $1, version, gene_code, sample_id, '{method.value}', value * 1e6 / sample_total
+            FROM totals
+            WHERE sample_total > 0 AND gene_total > 0
+        """ + NORMALIZED_EXPRESSIONS_UPSERT_CONFLICT
+        conn: asyncpg.Connection
+        async with self.transaction_connection(transaction_conn) as conn:
+            result = await conn.execute(query, experiment_result_id)
+        self.logger.info(f"Computed {method.upper()} values in the database for experiment {experiment_result_id}.")
+        return int(result.split()[-1])
+
+    ##########################
+    # Experiment locks
+    ##########################
+    @asynccontextmanager
+    async def experiment_lock(self, experiment_result_id: str, timeout: float | None = None) -> AsyncIterator[None]:
+        """
+        Holds the advisory lock of an experiment, serializing the jobs writing to it (ingestions, normalizations,
+        deletions) across server processes. Jobs writing to different experiments do not wait for each other.
+        The lock is held by a dedicated connection, so that the job can use pooled connections meanwhile.
+        Waits for the lock for at most timeout seconds (indefinitely if None, not at all if 0),
+        raises an ExperimentLockedException if it could not be acquired.
+        """
+        conn = await asyncpg.connect(get_db_uri(self._config))
+        try:
+            if timeout == 0:
+                acquired = await conn.fetchval(
+                    "SELECT pg_try_advisory_lock($1, hashtext($2))", EXPERIMENT_LOCK_NAMESPACE, experiment_result_id
+                )
+            else:
+                if timeout is not None:
+                    await conn.execute(f"SET lock_timeout = {max(int(timeout * 1000), 1)}")
+                try:
+                    await conn.execute(
+                        "SELECT pg_advisory_lock($1, hashtext($2))", EXPERIMENT_LOCK_NAMESPACE, experiment_result_id
+                    )
+                    acquired = True
+                except asyncpg.LockNotAvailableError:
+                    acquired = False
+            if not acquired:
+                raise ExperimentLockedException(f"Experiment {experiment_result_id} is locked by another job")
+            yield
+        finally:
+            # Ending the session releases its advisory locks
+            await conn.close()
+
+    async def lock_experiments(self, experiment_result_ids: list[str], transaction_conn: asyncpg.Connection):
+        """
+        Acquires the advisory locks of experiments until the end of the transaction, see experiment_lock.
+        The locks are acquired in order, so that concurrent transactions cannot deadlock.
+        """
+        for experiment_result_id in sorted(set(experiment_result_ids)):
+            await transaction_conn.execute(
+                "SELECT pg_advisory_xact_lock($1, hashtext($2))", EXPERIMENT_LOCK_NAMESPACE, experiment_result_id
+            )
+
+    @asynccontextmanager
+    async def transaction_connection(self, existing_conn: asyncpg.Connection | None = None):
+        conn: asyncpg.Connection
+        async with self.connect(existing_conn) as conn:
             async with conn.transaction():
                 # operations must be made using this connection for the transaction to apply
                 yield conn
 
+    @staticmethod
+    def _implicit_zeros_query(columns: str) -> str:
+        """
+        Returns a query of the stored gene expressions, along with the zero raw counts of the sparse experiments
+        given as the first parameter. Implicit zeros are only normalized by methods with a normalization run.
+        """
+        normalized_counts = ", ".join(
+            f"CASE WHEN '{method.value}' = ANY(runs.methods) THEN 0.0 END AS {method.value}_count"
+            for method in NormalizationMethodEnum
+        )
+        return f"""
+            SELECT {columns} FROM active_gene_expressions
+            UNION ALL
+            SELECT genes.gene_code, samples.sample_id, genes.experiment_result_id, 0.0 AS raw_count, {normalized_counts}
+            FROM (
+                SELECT DISTINCT experiment_result_id, gene_code FROM active_gene_expressions
+                WHERE experiment_result_id = ANY($1::text[])
+            ) genes
+            JOIN (
+                SELECT DISTINCT experiment_result_id, sample_id FROM active_gene_expressions
+                WHERE experiment_result_id = ANY($1::text[])
+            ) samples ON samples.experiment_result_id = genes.experiment_result_id
+            LEFT JOIN (
+                SELECT experiment_result_id, array_agg(method) AS methods FROM normalization_runs
+                GROUP BY experiment_result_id
+            ) runs ON runs.experiment_result_id = genes.experiment_result_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM active_gene_expressions ge
+                WHERE ge.experiment_result_id = genes.experiment_result_id
+                    AND ge.gene_code = genes.gene_code
+                    AND ge.sample_id = samples.sample_id
+            )
+        """
+
     async def fetch_gene_expressions(
         self,
         genes: List[str] | None = None,
@@ -360,17 +1185,33 @@ class Database(PgAsyncDatabase):
         Returns a tuple of (expressions list, total_records count).
         """
         conn: asyncpg.Connection
-        async with self.connect() as conn:
+        # The count and the page are read from the same snapshot, even if an experiment version is activated meanwhile
+        async with self.connect() as conn, conn.transaction(isolation="repeatable_read", readonly=True):
             # Query builder
-            base_query = """
-                SELECT gene_code, sample_id, experiment_result_id, raw_count, tpm_count, tmm_count, getmm_count, fpkm_count
-                FROM gene_expressions
-                """
-            count_query = "SELECT COUNT(*) FROM gene_expressions"
-            conditions = []
+            columns = (
+                "gene_code, sample_id, experiment_result_id, raw_count, tpm_count, tmm_count, getmm_count, fpkm_count, "
+                + "cpm_count, uq_count, deseq2_count"
+            )
+            source = "active_gene_expressions"
             params = []
             param_counter = 1
 
+            # Zero raw counts of sparse experiments are not stored, add them back
+            sparse_query = "SELECT experiment_result_id FROM experiment_results WHERE sparse"
+            sparse_params = []
+            if experiments:
+                sparse_query += " AND experiment_result_id = ANY($1::text[])"
+                sparse_params.append(experiments)
+            sparse_experiments = [r["experiment_result_id"] for r in await conn.fetch(sparse_query, *sparse_params)]
+            if sparse_experiments:
+                source = f"({self._implicit_zeros_query(columns)}) AS expressions"
+                params.append(sparse_experiments)
+                param_counter += 1
+
+            base_query = f"SELECT {columns} FROM {source}"
+            count_query = f"SELECT COUNT(*) FROM {source}"
+            conditions = []
+
             if genes:
                 conditions.append(f"gene_code = ANY(${param_counter}::text[])")
                 params.append(genes)
@@ -1,6 +1,7 @@
 __all__ = [
     "TakuanException",
     "TakuanDBException",
+    "ExperimentLockedException",
 ]
 
 
@@ -10,3 +11,7 @@ class TakuanException(Exception):
 
 class TakuanDBException(TakuanException):
     pass
+
+
+class ExperimentLockedException(TakuanDBException):
+    pass
@@ -1,17 +1,167 @@
-from io import StringIO
+import asyncpg
+import bz2
+import gzip
+import hashlib
+import json
+import os
+import tarfile
+import zipfile
+from contextlib import contextmanager
+from io import BytesIO, StringIO, TextIOWrapper
 from logging import Logger
-from typing import Literal
+from pathlib import PurePosixPath
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Iterator, Literal
+from urllib.parse import unquote, urlparse
 from fastapi import HTTPException, status
+from joblib import Parallel, delayed
+import numpy as np
 import pandas as pd
 from pydantic import ValidationError
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    # Optional dependency, required for Parquet and Arrow ingestion only
+    pa = None
+
+try:
+    import h5py
+except ImportError:  # pragma: no cover
+    # Optional dependency, required for AnnData (.h5ad) ingestion only
+    h5py = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    # Optional dependency, required for zstd compressed uploads only
+    zstandard = None
+
+try:
+    import boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:  # pragma: no cover
+    # Optional dependency, required for object store ingestion only
+    boto3 = None
+
 from transcriptomics_data_service.db import DatabaseDependency
 from transcriptomics_data_service.exceptions import TakuanDBException
 from transcriptomics_data_service.models import (
     CountTypesEnum,
     GeneExpression,
     GeneExpressionMapper,
+    Ingestion,
+    IngestionStats,
+    NormalizationMethodEnum,
 )
+from transcriptomics_data_service.write_queue import GeneExpressionWriteQueue
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+BZIP2_MAGIC = b"BZh"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+PARQUET_MAGIC = b"PAR1"
+ARROW_FILE_MAGIC = b"ARROW1"
+HASH_CHUNK_SIZE = 1 << 20
+# Object store downloads are kept in memory up to this size, then spilled to disk
+OBJECT_SPOOL_MAX_SIZE = 64 << 20
+
+
+def _decompressed(file: BinaryIO) -> BinaryIO:
+    """
+    Returns a file object decompressing a gzip, bzip2 or zstd compressed file as it is read,
+    detected from its magic bytes, or the file itself if not compressed.
+    """
+    magic = file.read(len(ZSTD_MAGIC))
+    file.seek(0)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=file, mode="rb")
+    if magic.startswith(BZIP2_MAGIC):
+        return bz2.BZ2File(file, mode="rb")
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Zstandard compressed uploads require the optional zstandard package.",
+            )
+        return zstandard.ZstdDecompressor().stream_reader(file)
+    return file
+
+
+def _content_hash(files: list[BinaryIO], params: dict) -> str:
+    """
+    Returns a SHA-256 hash of the ingestion parameters and of the files' content, read in chunks.
+    The files are rewound for parsing.
+    """
+    content_hash = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for file in files:
+        file_hash = hashlib.sha256()
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            file_hash.update(chunk)
+        file.seek(0)
+        content_hash.update(file_hash.digest())
+    return content_hash.hexdigest()
+
+
+@contextmanager
+def open_ingestion_source(uri: str, local_root: str | None, endpoint_url: str | None = None) -> Iterator[BinaryIO]:
+    """
+    Opens a file stored server-side for ingestion, instead of uploading it:
+        - A path (or file:// URI) under the allow-listed local root, relative paths are resolved from the root.
+          The file is streamed from disk.
+        - An s3://bucket/key URI of an S3-compatible object store, downloaded in a spooled temporary file since
+          the handlers need seekable files.
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme == "s3":
+        if boto3 is None:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Object store ingestion requires the optional boto3 package.",
+            )
+        client = boto3.client("s3", endpoint_url=endpoint_url)
+        with SpooledTemporaryFile(max_size=OBJECT_SPOOL_MAX_SIZE) as file:
+            try:
+                client.download_fileobj(parsed.netloc, unquote(parsed.path.lstrip("/")), file)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NoSuchBucket"):
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Object {uri} not found.")
+                raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Could not read {uri}: {e}")
+            except BotoCoreError as e:
+                raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Could not read {uri}: {e}")
+            file.seek(0)
+            yield file
+
+    elif parsed.scheme in ("", "file"):
+        if local_root is None:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Local path ingestion is disabled, no allow-listed root is configured.",
+            )
+        root = os.path.realpath(local_root)
+        # Symbolic links are resolved before checking the path, so they cannot escape the root either
+        path = os.path.realpath(os.path.join(root, unquote(parsed.path) if parsed.scheme else uri))
+        if os.path.commonpath([root, path]) != root:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail=f"Path {uri} is outside of the allow-listed root."
+            )
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"File {uri} not found.")
+        with open(path, "rb") as file:
+            yield file
+
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported URI scheme: {parsed.scheme}")
+
+
+def _text_stream(data: bytes | BinaryIO) -> TextIOWrapper:
+    """
+    Returns a text stream of the decompressed content of a file or bytes.
+    """
+    if isinstance(data, bytes):
+        data = BytesIO(data)
+    return TextIOWrapper(_decompressed(data), encoding="utf-8")
 
 
 class BaseIngestionHandler:
@@ -20,15 +170,24 @@ class BaseIngestionHandler:
 
     Uses the template design pattern, an ingestion follows these steps:
         - Init handler
+        - Optionally, skip data that was already ingested (previous_ingestion)
         - Read file data into a data frame (load_dataframe)
             - Must be implemented in children classes
         - Convert the data frame to a list of GeneExpression (dataframe_to_expressions)
             - Must be implemented in children classes
+            - Streamed formats yield batches of GeneExpression instead (expression_batches)
         - Ingest in the database
     """
 
     df: pd.DataFrame | None
     logger: Logger
+    # Identify the ingested data, see previous_ingestion
+    content_hash: str | None = None
+    idempotency_key: str | None = None
+    # Statistics of diff ingestions
+    diff_stats: IngestionStats | None = None
+    # Version written by snapshot ingestions
+    snapshot_version: int | None = None
 
     def __init__(self, experiment_result_id: str, db: DatabaseDependency, logger: Logger):
         self.experiment_result_id = experiment_result_id
@@ -48,10 +207,80 @@ class BaseIngestionHandler:
         """
         raise NotImplementedError()
 
-    async def ingest(self, count_type: CountTypesEnum = CountTypesEnum.raw.value) -> int | None:
+    def expression_batches(self, count_type: CountTypesEnum) -> Iterator[list[GeneExpression]]:
+        """
+        Yields the GeneExpressions to ingest in batches, written in a single transaction.
+        Defaults to a single batch of all the data frame's expressions.
+        """
+        yield self.dataframe_to_expressions(count_type)
+
+    async def previous_ingestion(
+        self, files: list[BinaryIO], idempotency_key: str | None = None, **params
+    ) -> Ingestion | None:
+        """
+        Hashes the uploaded files with the handler's format and the ingestion parameters, then returns the
+        previous ingestion of the same data if this one can be skipped:
+            - The ingestion made with the same idempotency key, for client retries
+            - The last ingestion of the experiment, if it had the same content
+        The ingestion is recorded once written.
+        """
+        self.content_hash = _content_hash(files, {"format": type(self).__name__, **params})
+        self.idempotency_key = idempotency_key
+        if idempotency_key is not None:
+            previous = await self.db.read_ingestion(self.experiment_result_id, idempotency_key)
+            if previous is not None:
+                if previous.content_hash != self.content_hash:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="The idempotency key was already used by an ingestion of different data.",
+                    )
+                self.logger.info(f"Ingestion with idempotency key {idempotency_key} was already done, skipping.")
+                return previous
+
+        previous = await self.db.read_last_ingestion(self.experiment_result_id)
+        if previous is None or previous.content_hash != self.content_hash:
+            return None
+        self.logger.info(f"Data was already ingested by the last ingestion of {self.experiment_result_id}, skipping.")
+        if idempotency_key is not None:
+            # Retries with this key are answered by the previous ingestion as well
+            await self.db.create_ingestion(previous.model_copy(update={"idempotency_key": idempotency_key}))
+        return previous
+
+    async def _record_ingestion(self, n_created: int, conn: asyncpg.Connection | None = None):
+        if self.content_hash is None:
+            return
+        ingestion = Ingestion(
+            experiment_result_id=self.experiment_result_id,
+            content_hash=self.content_hash,
+            idempotency_key=self.idempotency_key,
+            n_created=n_created,
+        )
+        await self.db.create_ingestion(ingestion, conn)
+
+    async def ingest(
+        self,
+        count_type: CountTypesEnum = CountTypesEnum.raw.value,
+        skip_zeros: bool = False,
+        write_queue: GeneExpressionWriteQueue | None = None,
+        bulk_load: bool = False,
+        diff: bool = False,
+        replace: bool = False,
+        snapshot: bool = False,
+    ) -> int | None:
         """
         Writes the GeneExpressions to the database, returning the number of rows created.
+        With skip_zeros, zero raw counts are not stored and the experiment is marked as sparse.
+        With a write_queue, the write is coalesced with other concurrent ingestions.
+        With bulk_load, the expressions are staged and merged at once, see _staged_load.
+        With diff, only the new and changed expressions are written, statistics are set in diff_stats.
+        With replace, the stored expressions of the ingested samples are deleted first.
+        With snapshot, the expressions replace all the experiment's data as a new version, see _snapshot_load.
         """
+        if skip_zeros and self._written_count_types(count_type) != [CountTypesEnum.raw]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only raw counts can be ingested without their zeros.",
+            )
 
         # Check that the experiment exists
         experiment = await self.db.read_experiment_result(self.experiment_result_id)
@@ -61,11 +290,69 @@ class BaseIngestionHandler:
                 detail="No experiment result found for provided ID",
             )
 
-        # Parse expressions
-        expressions = self.dataframe_to_expressions(count_type)
+        if snapshot:
+            if bulk_load or diff or replace:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Snapshot ingestion replaces all the data, and cannot be combined with bulk_load, diff "
+                    + "or replace.",
+                )
+            return await self._snapshot_load(count_type, skip_zeros)
+
+        if write_queue is not None and not skip_zeros and not replace:
+            expressions = [e for batch in self.expression_batches(count_type) for e in batch]
+            try:
+                n_created = await write_queue.submit(
+                    self.experiment_result_id, expressions, self._overwritten_normalizations(count_type)
+                )
+                await self._record_ingestion(n_created)
+                return n_created
+            except TakuanDBException:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Database error while ingesting data for experiment {self.experiment_result_id}, no data was ingested.",
+                )
+
+        if bulk_load or diff:
+            return await self._staged_load(count_type, skip_zeros, bulk_load, diff, replace)
+
+        n_created = 0
+        # Samples without stored rows before the ingestion, and samples with stored rows
+        new_samples: set[str] = set()
+        existing_samples: set[str] = set()
         async with self.db.transaction_connection() as conn:
             try:
-                n_created = await self.db.create_or_update_gene_expressions(expressions, conn)
+                if skip_zeros:
+                    await self.db.mark_experiment_result_sparse(self.experiment_result_id, conn)
+                # Parse and write expressions batch by batch
+                for expressions in self.expression_batches(count_type):
+                    samples = {e.sample_id for e in expressions}
+                    if (unchecked := samples - new_samples - existing_samples) and replace:
+                        # The replaced samples are new once their stored rows are deleted
+                        await self.db.delete_samples(self.experiment_result_id, unchecked, conn)
+                        new_samples |= unchecked
+                    elif unchecked:
+                        stored = await self.db.fetch_stored_sample_ids(self.experiment_result_id, unchecked, conn)
+                        existing_samples |= stored
+                        new_samples |= unchecked - stored
+                    append_only = samples.isdisjoint(existing_samples)
+
+                    if skip_zeros:
+                        # Zeros replacing stored counts become implicit as well
+                        zero_keys = [(e.gene_code, e.sample_id) for e in expressions if e.raw_count == 0]
+                        expressions = [e for e in expressions if e.raw_count != 0]
+                        if not append_only:
+                            await self.db.delete_gene_expressions(self.experiment_result_id, zero_keys, conn)
+                    if append_only:
+                        # No stored rows to merge with, the batch can be appended without conflict handling
+                        n_created += await self._append_or_update(expressions, conn)
+                    else:
+                        n_created += await self.db.create_or_update_gene_expressions(expressions, conn)
+                # Stored normalization runs no longer describe the normalized values that were overwritten
+                await self.db.delete_normalization_runs(
+                    self.experiment_result_id, self._overwritten_normalizations(count_type), conn
+                )
+                await self._record_ingestion(n_created, conn)
                 return n_created
             except TakuanDBException:
                 raise HTTPException(
@@ -73,6 +360,110 @@ class BaseIngestionHandler:
                     detail=f"Database error while ingesting data for experiment {self.experiment_result_id}, no data was ingested.",
                 )
 
+    async def _staged_load(
+        self, count_type: CountTypesEnum, skip_zeros: bool, bulk_load: bool, diff: bool, replace: bool
+    ) -> int:
+        """
+        Batches are copied in an unindexed and unlogged staging table, then merged with the stored expressions in a
+        single statement.
+        Bulk-load mode, for initial loads and large re-imports: if the load outweighs the stored rows, the secondary
+        indexes are built again afterwards instead of being maintained row by row, locking gene_expressions until
+        the data is attached. The planner statistics are updated once the load is committed.
+        Diff mode, for corrections: stored rows with identical counts are not written again.
+        """
+        try:
+            async with self.db.transaction_connection() as conn:
+                if skip_zeros:
+                    await self.db.mark_experiment_result_sparse(self.experiment_result_id, conn)
+                await self.db.create_gene_expressions_staging(conn)
+                n_staged = 0
+                staged_samples: set[str] = set()
+                for expressions in self.expression_batches(count_type):
+                    n_staged += await self.db.stage_gene_expressions(expressions, conn)
+                    staged_samples |= {e.sample_id for e in expressions}
+                if replace:
+                    await self.db.delete_samples(self.experiment_result_id, staged_samples, conn)
+                if diff:
+                    self.diff_stats = await self.db.diff_staged_gene_expressions(conn, skip_zeros)
+                    n_created = self.diff_stats.inserted + self.diff_stats.changed
+                    modified = n_created + self.diff_stats.deleted > 0
+                else:
+                    rebuild_indexes = n_staged > await self.db.estimate_gene_expressions_rows(conn)
+                    n_created = await self.db.merge_staged_gene_expressions(conn, skip_zeros, rebuild_indexes)
+                    modified = True
+                if modified:
+                    await self.db.delete_normalization_runs(
+                        self.experiment_result_id, self._overwritten_normalizations(count_type), conn
+                    )
+                await self._record_ingestion(n_created, conn)
+            if bulk_load:
+                await self.db.analyze_gene_expressions()
+            return n_created
+        except TakuanDBException:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Database error while ingesting data for experiment {self.experiment_result_id}, no data was ingested.",
+            )
+
+    async def _snapshot_load(self, count_type: CountTypesEnum, skip_zeros: bool) -> int:
+        """
+        Reloads the experiment as a new version of its gene expressions: each batch is written in its own
+        transaction, while queries keep reading the active version, then the new version is activated atomically.
+        The normalization runs of the previous version are discarded, and its rows can then be deleted with
+        Database.delete_inactive_gene_expressions. An aborted load deletes the rows of its version.
+        """
+        version = await self.db.next_gene_expressions_version(self.experiment_result_id)
+        self.snapshot_version = version
+        n_created = 0
+        try:
+            for expressions in self.expression_batches(count_type):
+                if skip_zeros:
+                    expressions = [e for e in expressions if e.raw_count != 0]
+                async with self.db.transaction_connection() as conn:
+                    n_created += await self.db.copy_or_update_gene_expressions(expressions, conn, version)
+            async with self.db.transaction_connection() as conn:
+                if skip_zeros:
+                    await self.db.mark_experiment_result_sparse(self.experiment_result_id, conn)
+                await self.db.activate_gene_expressions_version(self.experiment_result_id, version, conn)
+                await self._record_ingestion(n_created, conn)
+        except Exception as e:
+            await self.db.delete_inactive_gene_expressions(self.experiment_result_id, version)
+            if isinstance(e, TakuanDBException):
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Database error while ingesting data for experiment {self.experiment_result_id}, "
+                    + "the active version was left untouched.",
+                )
+            raise
+        self.logger.info(f"Loaded {n_created} gene expressions as version {version} of {self.experiment_result_id}.")
+        return n_created
+
+    async def _append_or_update(self, expressions: list[GeneExpression], conn: asyncpg.Connection) -> int:
+        """
+        Appends expressions of samples without stored rows with COPY.
+        Falls back to the regular upsert if the batch has duplicated keys, or was already partially written.
+        """
+        try:
+            # Savepoint, the transaction can go on if the COPY fails
+            async with conn.transaction():
+                return await self.db.append_gene_expressions(expressions, conn)
+        except TakuanDBException:
+            self.logger.info("Could not append the gene expressions, merging them with the stored ones instead.")
+            return await self.db.create_or_update_gene_expressions(expressions, conn)
+
+    def _written_count_types(self, count_type: CountTypesEnum) -> list[CountTypesEnum]:
+        """
+        Returns the count types written by the ingestion.
+        """
+        return [CountTypesEnum(count_type)]
+
+    def _overwritten_normalizations(self, count_type: CountTypesEnum) -> list[NormalizationMethodEnum]:
+        return [
+            NormalizationMethodEnum(c.value)
+            for c in self._written_count_types(count_type)
+            if c.value in NormalizationMethodEnum._value2member_map_
+        ]
+
     def _check_index_duplicates(self, index: pd.Index):
         duplicated = index.duplicated()
         if duplicated.any():
@@ -93,12 +484,12 @@ class RCMIngestionHandler(BaseIngestionHandler):
     CSV ingestion can be used for multi and single sample RCMs.
     """
 
-    def load_dataframe(self, data: bytes):
+    def load_dataframe(self, data: bytes | BinaryIO):
         """
         Reads the bytes of a CSV file into a dataframe.
+        Compressed files are decompressed while parsing.
         """
-        buffer = StringIO(data.decode("utf-8"))
-        buffer.seek(0)
+        buffer = _text_stream(data)
         try:
             # sep=None to infer separator (handle CSV and TSV)
             df = pd.read_csv(buffer, index_col=0, header=0, sep=None, engine="python")
@@ -135,6 +526,339 @@ class RCMIngestionHandler(BaseIngestionHandler):
         ]
 
 
+class MatrixMarketIngestionHandler(BaseIngestionHandler):
+    """
+    For Matrix Market (.mtx) coordinate matrices, as produced by 10x-style pipelines, where each
+    (row, column, value) triplet is the count of a feature (row) in a sample (column).
+    Feature and sample identifiers are read from separate files, one per line, the first column being used.
+
+    Every file can be compressed. Triplets are parsed and ingested in batches, the matrix is never densified,
+    and pairs without a triplet are not stored.
+    """
+
+    batch_size = 100_000
+
+    features: pd.Index
+    samples: pd.Index
+    matrix: TextIOWrapper
+    pattern: bool
+    n_entries: int
+
+    def load_matrix(self, matrix: BinaryIO, features: bytes, samples: bytes):
+        """
+        Reads the feature and sample identifiers, and the header of the Matrix Market file.
+        The triplets are read from the matrix file while ingesting.
+        """
+        self.features = self._read_identifiers(features, "features")
+        self.samples = self._read_identifiers(samples, "samples")
+
+        self.matrix = _text_stream(matrix)
+        banner = self.matrix.readline().lower().split()
+        if banner[:3] != ["%%matrixmarket", "matrix", "coordinate"] or banner[3:4] == ["complex"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only real, integer or pattern Matrix Market coordinate matrices are supported.",
+            )
+        self.pattern = banner[3:4] == ["pattern"]
+
+        line = self.matrix.readline()
+        while line.startswith("%") or not line.strip():
+            line = self.matrix.readline()
+        try:
+            n_rows, n_cols, self.n_entries = (int(v) for v in line.split())
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid Matrix Market size line: {line.strip()}",
+            )
+        if (n_rows, n_cols) != (len(self.features), len(self.samples)):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Matrix of {n_rows} x {n_cols} does not match the {len(self.features)} features "
+                + f"and {len(self.samples)} samples provided.",
+            )
+
+    def _read_identifiers(self, data: bytes, name: str) -> pd.Index:
+        df = pd.read_csv(_text_stream(data), sep="\t", header=None, usecols=[0], dtype=str)
+        identifiers = pd.Index(df[0], name=name)
+        self._check_index_duplicates(identifiers)
+        return identifiers
+
+    def expression_batches(self, count_type: CountTypesEnum) -> Iterator[list[GeneExpression]]:
+        columns = ["row", "col"] if self.pattern else ["row", "col", "count"]
+        try:
+            reader = pd.read_csv(
+                self.matrix, sep="\\s+", header=None, names=columns, comment="%", chunksize=self.batch_size
+            )
+            n_entries = 0
+            for triplets in reader:
+                n_entries += len(triplets)
+                rows = triplets["row"].to_numpy() - 1
+                cols = triplets["col"].to_numpy() - 1
+                if (
+                    rows.min() < 0
+                    or rows.max() >= len(self.features)
+                    or cols.min() < 0
+                    or cols.max() >= len(self.samples)
+                ):
+                    raise ValueError("matrix coordinates out of bounds")
+                # Pattern matrices only hold the coordinates of non-zero counts
+                counts = [1] * len(triplets) if self.pattern else triplets["count"].tolist()
+                yield [
+                    GeneExpression(
+                        gene_code=gene_code,
+                        sample_id=sample_id,
+                        experiment_result_id=self.experiment_result_id,
+                        **{f"{count_type.value}_count": count},
+                    )
+                    for gene_code, sample_id, count in zip(self.features[rows], self.samples[cols], counts)
+                ]
+        except pd.errors.ParserError as e:  # pragma: no cover
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Error parsing data: {e}",
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Value error in data: {e}",
+            )
+        if n_entries != self.n_entries:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Matrix declares {self.n_entries} entries, but {n_entries} were found.",
+            )
+
+
+class ColumnarIngestionHandler(BaseIngestionHandler):
+    """
+    For Raw-Count-Matrices (RCM) in a columnar format: Parquet, Arrow IPC file or Arrow IPC stream.
+    As with CSV RCMs, each row belongs to a feature, and each numeric column to a sample.
+    The feature identifiers are in the pandas index column if the table was written by pandas,
+    and in the first column otherwise.
+
+    Counts are read with their types, record batch by record batch (Parquet row groups are streamed),
+    without any text parsing. Requires the optional pyarrow package.
+    """
+
+    batch_size = 100_000
+
+    reader: "pa.RecordBatchReader"
+    feature_col: str
+    samples: list[str]
+
+    def load_table(self, file: BinaryIO):
+        """
+        Opens the Parquet or Arrow file, detected from its magic bytes, and validates its schema.
+        The record batches are read while ingesting.
+        """
+        if pa is None:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Parquet and Arrow ingestion requires the optional pyarrow package.",
+            )
+        magic = file.read(len(ARROW_FILE_MAGIC))
+        file.seek(0)
+        try:
+            if magic.startswith(PARQUET_MAGIC):
+                parquet_file = pq.ParquetFile(file)
+                schema = parquet_file.schema_arrow
+                batch_rows = self._batch_rows(schema)
+                self.reader = pa.RecordBatchReader.from_batches(
+                    schema, parquet_file.iter_batches(batch_size=batch_rows)
+                )
+            elif magic == ARROW_FILE_MAGIC:
+                ipc_file = pa.ipc.open_file(file)
+                schema = ipc_file.schema
+                self.reader = pa.RecordBatchReader.from_batches(
+                    schema, (ipc_file.get_batch(i) for i in range(ipc_file.num_record_batches))
+                )
+            else:
+                self.reader = pa.ipc.open_stream(file)
+                schema = self.reader.schema
+        except (pa.ArrowException, OSError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Error reading Parquet or Arrow data: {e}",
+            )
+
+        index_columns = (schema.pandas_metadata or {}).get("index_columns", [])
+        self.feature_col = index_columns[0] if len(index_columns) == 1 and isinstance(index_columns[0], str) else None
+        if self.feature_col is None:
+            self.feature_col = schema.names[0]
+        self.samples = [name for name in schema.names if name != self.feature_col]
+        self._check_index_duplicates(pd.Index(self.samples, name="SampleID"))
+
+        non_numeric = [
+            f.name
+            for f in schema
+            if f.name != self.feature_col and not pa.types.is_integer(f.type) and not pa.types.is_floating(f.type)
+        ]
+        if non_numeric:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Sample columns must be numeric: {', '.join(non_numeric)}",
+            )
+
+    def _batch_rows(self, schema: "pa.Schema") -> int:
+        return max(1, self.batch_size // max(len(schema.names) - 1, 1))
+
+    def expression_batches(self, count_type: CountTypesEnum) -> Iterator[list[GeneExpression]]:
+        seen_features = set()
+        batches = iter(self.reader)
+        while True:
+            try:
+                batch = next(batches)
+            except StopIteration:
+                return
+            except (pa.ArrowException, OSError) as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Error reading Parquet or Arrow data: {e}",
+                )
+            features = batch.column(self.feature_col).to_pylist()
+            # Validating for unique Gene IDs, within and across batches
+            self._check_index_duplicates(pd.Index(features, name="GeneID"))
+            duplicated = seen_features.intersection(features)
+            if duplicated:
+                err_msg = f"Found duplicated GeneID: {sorted(duplicated)}"
+                self.logger.debug(err_msg)
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=err_msg)
+            seen_features.update(features)
+
+            yield [
+                GeneExpression(
+                    gene_code=gene_code,
+                    sample_id=sample_id,
+                    experiment_result_id=self.experiment_result_id,
+                    # NaN counts are missing counts
+                    **{f"{count_type.value}_count": None if count != count else count},
+                )
+                for sample_id in self.samples
+                for gene_code, count in zip(features, batch.column(sample_id).to_pylist())
+            ]
+
+
+class AnnDataIngestionHandler(BaseIngestionHandler):
+    """
+    For AnnData (.h5ad) HDF5 files, where observations (obs) are samples and variables (var) are features.
+    The `X` matrix and the matrices under `layers` are mapped to count types, several layers being ingested
+    in a single pass. Matrices can be dense datasets, or CSR/CSC sparse groups.
+
+    Samples are read chunk by chunk, a chunk of each layer being densified at a time.
+    Requires the optional h5py package.
+    """
+
+    batch_size = 100_000
+
+    file: "h5py.File"
+    layers: dict[CountTypesEnum, "h5py.Dataset | h5py.Group"]
+    samples: list[str]
+    features: list[str]
+
+    def load_file(self, file: BinaryIO, layers: dict[CountTypesEnum, str]):
+        """
+        Opens the HDF5 file and validates its sample and feature names, and the layers mapped to count types.
+        `X` designates the main matrix, other names the matrices under `layers`.
+        """
+        if h5py is None:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="AnnData ingestion requires the optional h5py package.",
+            )
+        if not layers:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No layer mapped to a count type.")
+        try:
+            self.file = h5py.File(file, "r")
+            self.samples = self._read_names("obs")
+            self.features = self._read_names("var")
+        except (OSError, KeyError) as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid AnnData file: {e}")
+        self._check_index_duplicates(pd.Index(self.samples, name="SampleID"))
+        self._check_index_duplicates(pd.Index(self.features, name="GeneID"))
+
+        self.layers = {}
+        for count_type, name in layers.items():
+            path = "X" if name == "X" else f"layers/{name}"
+            if path not in self.file:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Layer not found: {name}")
+            layer = self.file[path]
+            if tuple(self._layer_shape(layer)) != (len(self.samples), len(self.features)):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Layer {name} does not match the {len(self.samples)} obs and {len(self.features)} var.",
+                )
+            self.layers[count_type] = layer
+
+    def _read_names(self, group_name: str) -> list[str]:
+        group = self.file[group_name]
+        index = group[group.attrs.get("_index", "_index")]
+        return [name.decode("utf-8") if isinstance(name, bytes) else str(name) for name in index[()]]
+
+    def _written_count_types(self, count_type: CountTypesEnum) -> list[CountTypesEnum]:
+        # AnnData ingestions write every mapped layer
+        return list(self.layers)
+
+    @staticmethod
+    def _sparse_format(layer: "h5py.Dataset | h5py.Group") -> str | None:
+        if isinstance(layer, h5py.Dataset):
+            return None
+        encoding = layer.attrs.get("encoding-type", layer.attrs.get("h5sparse_format", ""))
+        encoding = encoding.decode("utf-8") if isinstance(encoding, bytes) else str(encoding)
+        if encoding.startswith("csr"):
+            return "csr"
+        if encoding.startswith("csc"):
+            return "csc"
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported matrix encoding: {encoding}")
+
+    def _layer_shape(self, layer: "h5py.Dataset | h5py.Group") -> tuple[int, int]:
+        if self._sparse_format(layer) is None:
+            return layer.shape
+        return tuple(layer.attrs.get("shape", layer.attrs.get("h5sparse_shape")))
+
+    def _read_block(self, layer: "h5py.Dataset | h5py.Group", start: int, stop: int) -> np.ndarray:
+        """Reads the rows (samples) start to stop of a layer as a dense array."""
+        sparse_format = self._sparse_format(layer)
+        if sparse_format is None:
+            return np.asarray(layer[start:stop], dtype="float64")
+
+        block = np.zeros((stop - start, len(self.features)), dtype="float64")
+        indptr = layer["indptr"][()]
+        if sparse_format == "csr":
+            data = layer["data"][indptr[start] : indptr[stop]]
+            cols = layer["indices"][indptr[start] : indptr[stop]]
+            rows = np.repeat(np.arange(stop - start), np.diff(indptr[start : stop + 1]))
+        else:
+            # CSC matrices are indexed by feature: keep the entries of the block's samples
+            sample_indices = layer["indices"][()]
+            in_block = (sample_indices >= start) & (sample_indices < stop)
+            data = layer["data"][()][in_block]
+            rows = sample_indices[in_block] - start
+            cols = np.repeat(np.arange(len(self.features)), np.diff(indptr))[in_block]
+        block[rows, cols] = data
+        return block
+
+    def expression_batches(self, count_type: CountTypesEnum) -> Iterator[list[GeneExpression]]:
+        chunk_size = max(1, self.batch_size // max(len(self.features), 1))
+        for start in range(0, len(self.samples), chunk_size):
+            stop = min(start + chunk_size, len(self.samples))
+            blocks = {layer_type: self._read_block(layer, start, stop) for layer_type, layer in self.layers.items()}
+            yield [
+                GeneExpression(
+                    gene_code=gene_code,
+                    sample_id=self.samples[start + i],
+                    experiment_result_id=self.experiment_result_id,
+                    # NaN counts are missing counts
+                    **{
+                        f"{layer_type.value}_count": None if np.isnan(block[i, j]) else float(block[i, j])
+                        for layer_type, block in blocks.items()
+                    },
+                )
+                for i in range(stop - start)
+                for j, gene_code in enumerate(self.features)
+            ]
+
+
 class SampleIngestionHandler(BaseIngestionHandler):
     """
     TSV format ingestion is for single sample files ONLY.
@@ -171,6 +895,10 @@ class SampleIngestionHandler(BaseIngestionHandler):
         self.sample_id = sample_id
         super().__init__(experiment_result_id, db, logger)
 
+    def _written_count_types(self, count_type: CountTypesEnum) -> list[CountTypesEnum]:
+        # Single sample ingestions write every mapped count column
+        return [c for c in CountTypesEnum if getattr(self.mapper, f"{c.value}_count_col")]
+
     def _validate_mapper_field(self, df: pd.DataFrame, mapping: str | None) -> bool:
         """
         Returns True if the mapping is not present in the file's headers
@@ -179,12 +907,12 @@ class SampleIngestionHandler(BaseIngestionHandler):
 
     def load_dataframe(
         self,
-        data: bytes,
+        data: bytes | BinaryIO,
         file_type: Literal["csv", "tsv"],
         mapper: GeneExpressionMapper | None,
     ):
-        buffer = StringIO(data.decode("utf-8"))
-        buffer.seek(0)
+        # Compressed files are decompressed while parsing
+        buffer = _text_stream(data)
         try:
             # Configure kwargs for TSV/CSV handling of the data in Pandas.read_csv
             read_csv_kwargs: dict = {}
@@ -218,6 +946,9 @@ class SampleIngestionHandler(BaseIngestionHandler):
                 mapper.tmm_count_col,
                 mapper.getmm_count_col,
                 mapper.fpkm_count_col,
+                mapper.cpm_count_col,
+                mapper.uq_count_col,
+                mapper.deseq2_count_col,
             ]:
                 if self._validate_mapper_field(df, col_map):
                     invalid_mappings.append(col_map)
@@ -258,6 +989,9 @@ class SampleIngestionHandler(BaseIngestionHandler):
                     tmm_count=(row.loc[self.mapper.tmm_count_col] if self.mapper.tmm_count_col else None),
                     getmm_count=(row.loc[self.mapper.getmm_count_col] if self.mapper.getmm_count_col else None),
                     fpkm_count=(row.loc[self.mapper.fpkm_count_col] if self.mapper.fpkm_count_col else None),
+                    cpm_count=(row.loc[self.mapper.cpm_count_col] if self.mapper.cpm_count_col else None),
+                    uq_count=(row.loc[self.mapper.uq_count_col] if self.mapper.uq_count_col else None),
+                    deseq2_count=(row.loc[self.mapper.deseq2_count_col] if self.mapper.deseq2_count_col else None),
                 )
                 expressions.append(expr)
             except ValidationError as e:  # pragma: no cover
@@ -288,3 +1022,126 @@ class SampleIngestionHandler(BaseIngestionHandler):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Value error in data: {e}",
             )
+
+
+def _parse_sample_file(
+    experiment_result_id: str,
+    sample_id: str,
+    data: bytes,
+    file_type: Literal["csv", "tsv"],
+    mapper: GeneExpressionMapper,
+    logger: Logger,
+) -> tuple[list[GeneExpression] | None, str | list | None]:
+    """
+    Parses a single sample file in a worker process, returning its GeneExpressions or the parsing error.
+    """
+    handler = SampleIngestionHandler(experiment_result_id, sample_id, None, logger)
+    try:
+        handler.load_dataframe(data, file_type, mapper)
+        return handler.dataframe_to_expressions(CountTypesEnum.raw), None
+    except HTTPException as e:
+        return None, e.detail
+    except (OSError, EOFError, UnicodeDecodeError) as e:
+        # Corrupted compressed files
+        return None, f"Could not read file: {e}"
+
+
+class BatchSampleIngestionHandler(BaseIngestionHandler):
+    """
+    Ingestion of many single sample files sharing the same columns mapper.
+
+    Files are uploaded individually or in a tar/zip archive, the sample identifier
+    of a file is its name up to the first dot (S1.tsv.gz -> S1).
+    Archived files sharing the same name, like Salmon's 'quant.sf' outputs,
+    are identified by their parent directory instead (S1/quant.sf -> S1).
+
+    The files are parsed in parallel worker processes, and the samples parsed without errors
+    are written in a single bulk load. Samples with invalid files are reported and skipped.
+    """
+
+    mapper: GeneExpressionMapper
+    expressions: dict[str, list[GeneExpression]]
+    errors: dict[str, str | list]
+
+    def _written_count_types(self, count_type: CountTypesEnum) -> list[CountTypesEnum]:
+        # Like single sample ingestions, every mapped count column is written
+        return [c for c in CountTypesEnum if getattr(self.mapper, f"{c.value}_count_col")]
+
+    @staticmethod
+    def read_archive(file: BinaryIO) -> list[tuple[str, bytes]]:
+        """
+        Returns the paths and contents of the files in a tar (optionally compressed) or zip archive.
+        """
+        files = []
+        if zipfile.is_zipfile(file):
+            with zipfile.ZipFile(file) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        files.append((info.filename, archive.read(info)))
+        else:
+            file.seek(0)
+            try:
+                with tarfile.open(fileobj=file, mode="r:*") as archive:
+                    for member in archive:
+                        if member.isfile():
+                            files.append((member.name, archive.extractfile(member).read()))
+            except tarfile.TarError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="The archive could not be read, only tar (optionally compressed) and zip archives are supported.",
+                )
+        # Skip hidden files and archiver metadata (e.g. '._S1.tsv', '__MACOSX/')
+        return [
+            (path, data)
+            for path, data in files
+            if not any(part.startswith((".", "__MACOSX")) for part in PurePosixPath(path).parts)
+        ]
+
+    @staticmethod
+    def sample_ids(paths: list[str]) -> list[str]:
+        """
+        Returns the sample identifier of each file path.
+        """
+        names = [PurePosixPath(path).name.split(".")[0] for path in paths]
+        sample_ids = [
+            PurePosixPath(path).parent.name if names.count(name) > 1 and PurePosixPath(path).parent.name else name
+            for path, name in zip(paths, names)
+        ]
+        index = pd.Index(sample_ids, name="sample IDs")
+        duplicated = index.duplicated()
+        if duplicated.any() or "" in sample_ids:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Could not determine unique sample IDs from the file names, found: {list(index[duplicated])}",
+            )
+        return sample_ids
+
+    def load_files(
+        self,
+        files: list[tuple[str, bytes]],
+        file_type: Literal["csv", "tsv"],
+        mapper: GeneExpressionMapper,
+        n_jobs: int = -1,
+    ):
+        """
+        Parses the (path, content) sample files in parallel.
+        """
+        if not files:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No sample files were provided.")
+        sample_ids = self.sample_ids([path for path, _ in files])
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_parse_sample_file)(self.experiment_result_id, sample_id, data, file_type, mapper, self.logger)
+            for sample_id, (_, data) in zip(sample_ids, files)
+        )
+        self.mapper = mapper
+        self.expressions = {}
+        self.errors = {}
+        for sample_id, (expressions, error) in zip(sample_ids, results):
+            if error is not None:
+                self.logger.error(f"Could not parse sample {sample_id}: {error}")
+                self.errors[sample_id] = error
+            else:
+                self.expressions[sample_id] = expressions
+
+    def expression_batches(self, count_type: CountTypesEnum) -> Iterator[list[GeneExpression]]:
+        yield [e for expressions in self.expressions.values() for e in expressions]
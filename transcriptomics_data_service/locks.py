@@ -0,0 +1,56 @@
+from contextlib import asynccontextmanager
+from fastapi import Depends, HTTPException, status
+from typing import AsyncIterator, Sequence
+
+from .config import Config, ConfigDependency
+from .db import Database, DatabaseDependency
+from .exceptions import ExperimentLockedException
+from .write_queue import WriteQueueDependency
+
+__all__ = [
+    "lock_experiment",
+    "lock_experiment_unless_queued",
+    "with_experiment_lock",
+]
+
+
+@asynccontextmanager
+async def _experiment_lock(config: Config, db: Database, experiment_result_id: str) -> AsyncIterator[None]:
+    try:
+        async with db.experiment_lock(experiment_result_id, config.experiment_lock_timeout_s):
+            yield
+    except ExperimentLockedException:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Experiment {experiment_result_id} is being written by another request, retry later.",
+        )
+
+
+async def lock_experiment(config: ConfigDependency, db: DatabaseDependency, experiment_result_id: str):
+    """
+    Holds the lock of the request's experiment while the request writes to it, see Database.experiment_lock.
+    """
+    async with _experiment_lock(config, db, experiment_result_id):
+        yield
+
+
+async def lock_experiment_unless_queued(
+    config: ConfigDependency, db: DatabaseDependency, write_queue: WriteQueueDependency, experiment_result_id: str
+):
+    """
+    Holds the lock of the request's experiment, unless the write is queued: the coalesced write transactions lock
+    their experiments instead, so that queued requests to the same experiment are not serialized.
+    """
+    if write_queue is not None:
+        yield
+        return
+    async with _experiment_lock(config, db, experiment_result_id):
+        yield
+
+
+def with_experiment_lock(dependencies: Sequence[Depends] | None, unless_queued: bool = False) -> list[Depends]:
+    """
+    Returns the dependencies of a route writing to an experiment, with the experiment lock after the authz ones.
+    """
+    lock = lock_experiment_unless_queued if unless_queued else lock_experiment
+    return [*(dependencies or []), Depends(lock)]
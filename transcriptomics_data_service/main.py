@@ -8,6 +8,7 @@ from transcriptomics_data_service.models import ServiceInfo
 from transcriptomics_data_service.routers.experiment_results import experiment_router
 from transcriptomics_data_service.routers.normalization import normalization_router
 from transcriptomics_data_service.routers.expressions import expressions_router
+from transcriptomics_data_service.routers.gene_lengths import gene_lengths_router
 from transcriptomics_data_service.authz.plugin import authz_plugin
 from transcriptomics_data_service.service_info import ServiceInfoDependency
 
@@ -64,6 +65,7 @@ if config_for_setup.authz_enabled:
 app.include_router(experiment_router)
 app.include_router(normalization_router)
 app.include_router(expressions_router)
+app.include_router(gene_lengths_router)
 
 
 @app.get("/service-info")
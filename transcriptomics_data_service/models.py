@@ -9,6 +9,8 @@ __all__ = [
     "GeneExpressionData",
     "GeneExpressionResponse",
     "NormalizationMethodEnum",
+    "NormalizationFactor",
+    "NormalizationRun",
     "ExpressionQueryBody",
     "CountTypesEnum",
     "PaginatedRequest",
@@ -23,6 +25,9 @@ TMM = "tmm"
 GETMM = "getmm"
 RAW = "raw"
 FPKM = "fpkm"
+CPM = "cpm"
+UQ = "uq"
+DESEQ2 = "deseq2"
 
 
 class NormalizationMethodEnum(str, Enum):
@@ -30,6 +35,9 @@ class NormalizationMethodEnum(str, Enum):
     tmm = TMM
     getmm = GETMM
     fpkm = FPKM
+    cpm = CPM
+    uq = UQ
+    deseq2 = DESEQ2
 
 
 class CountTypesEnum(str, Enum):
@@ -39,6 +47,9 @@ class CountTypesEnum(str, Enum):
     tmm = TMM
     getmm = GETMM
     fpkm = FPKM
+    cpm = CPM
+    uq = UQ
+    deseq2 = DESEQ2
 
 
 #####################################
@@ -62,6 +73,8 @@ class ExperimentResult(BaseModel):
     assembly_id: str | None = Field(None, max_length=255)
     assembly_name: str | None = Field(None, max_length=255)
     extra_properties: dict | None = Field(None)
+    # Zero raw counts of sparse experiments are not stored, and are implicit in queries and normalizations
+    sparse: bool = Field(False)
 
 
 class SamplesResponse(PaginatedResponse):
@@ -84,6 +97,9 @@ class GeneExpression(BaseModel):
     tmm_count: float | None = Field(None, description="TMM normalized count")
     getmm_count: float | None = Field(None, description="GETMM normalized count")
     fpkm_count: float | None = Field(None, description="FPKM normalized count")
+    cpm_count: float | None = Field(None, description="CPM normalized count")
+    uq_count: float | None = Field(None, description="Upper-quartile normalized count")
+    deseq2_count: float | None = Field(None, description="DESeq2 median-of-ratios normalized count")
 
 
 class GeneExpressionData(BaseModel):
@@ -108,6 +124,42 @@ class GeneExpressionResponse(PaginatedResponse):
     expressions: List[GeneExpression] | List[GeneExpressionData] = Field(..., description="List of gene expressions")
 
 
+class Ingestion(BaseModel):
+    experiment_result_id: str = Field(..., min_length=1, max_length=255, description="ExperimentResult identifier")
+    content_hash: str = Field(..., description="Hash of the ingested files, format and ingestion parameters")
+    idempotency_key: str | None = Field(None, max_length=255, description="Idempotency key provided by the client")
+    n_created: int = Field(..., description="Number of GeneExpressions written by the ingestion")
+
+
+class IngestionStats(BaseModel):
+    inserted: int = Field(0, description="Number of new GeneExpressions")
+    changed: int = Field(0, description="Number of stored GeneExpressions with updated counts")
+    unchanged: int = Field(0, description="Number of stored GeneExpressions left untouched, with identical counts")
+    deleted: int = Field(0, description="Number of stored GeneExpressions deleted, replaced by implicit zero counts")
+
+
+#####################################
+# NORMALIZATION
+#####################################
+class NormalizationFactor(BaseModel):
+    sample_id: str = Field(..., min_length=1, max_length=255, description="Sample identifier")
+    library_size: float = Field(..., description="Library size of the sample, as seen by the normalization method")
+    norm_factor: float | None = Field(
+        None,
+        description="Normalization factor of the sample (TMM and GETMM factor, upper quartile, DESeq2 size factor)",
+    )
+    input_checksum: str | None = Field(None, description="Checksum of the sample's normalization inputs")
+
+
+class NormalizationRun(BaseModel):
+    experiment_result_id: str = Field(..., min_length=1, max_length=255, description="ExperimentResult identifier")
+    method: NormalizationMethodEnum = Field(..., description="Normalization method of the run")
+    reference_sample_id: str | None = Field(None, description="Reference sample selected by TMM and GETMM")
+    input_checksum: str = Field(..., description="Checksum of the normalization inputs (raw counts, gene lengths)")
+    library_scale: float | None = Field(None, description="Library size TMM, GETMM and UQ values are scaled to")
+    factors: List[NormalizationFactor] = Field([], description="Per-sample library sizes and normalization factors")
+
+
 class GeneExpressionMapper(BaseModel):
     """
     Mapping class for flexible handling of CSV/TSV files with different columns.
@@ -119,6 +171,9 @@ class GeneExpressionMapper(BaseModel):
     tmm_count_col: str | None = None
     getmm_count_col: str | None = None
     fpkm_count_col: str | None = None
+    cpm_count_col: str | None = None
+    uq_count_col: str | None = None
+    deseq2_count_col: str | None = None
 
 
 #####################################
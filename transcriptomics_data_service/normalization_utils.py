@@ -1,7 +1,21 @@
+import hashlib
 import pandas as pd
 import numpy as np
 from joblib import Parallel, delayed
 from pandas.core.indexes.base import Index
+from typing import NamedTuple
+
+
+class TMMFactors(NamedTuple):
+    """
+    Per-sample library sizes, TMM normalization factors and the reference sample they were computed against.
+    lib_scale is the mean library size normalized values are scaled to.
+    """
+
+    lib_sizes: pd.Series
+    norm_factors: pd.Series
+    ref_sample: str
+    lib_scale: float
 
 
 def filter_counts(counts_df: pd.DataFrame):
@@ -14,7 +28,7 @@ def filter_counts(counts_df: pd.DataFrame):
 def prepare_counts_and_lengths(counts_df: pd.DataFrame, gene_lengths: pd.Series, scale_length: float = None):
     """Align counts and gene_lengths, drop zeros, and optionally scale gene lengths."""
     counts_df = counts_df.loc[gene_lengths.index]
-    valid_lengths = gene_lengths.replace(0, pd.NA).dropna()
+    valid_lengths = gene_lengths.replace(0, np.nan).dropna()
     counts_df = counts_df.loc[valid_lengths.index]
     gene_lengths = valid_lengths
     if scale_length is not None:
@@ -49,13 +63,27 @@ def trim_values(log_ratio, log_mean, w, logratio_trim, sum_trim):
     return lr_t[final_idx], w_t[final_idx]
 
 
+def select_reference_sample(lib_sizes: pd.Series) -> str:
+    """Select the sample with the library size closest to the median as the TMM reference."""
+    median_lib = lib_sizes.median()
+    return (lib_sizes - median_lib).abs().idxmin()
+
+
 def compute_TMM_normalization_factors(
-    counts_df: pd.DataFrame, logratio_trim=0.3, sum_trim=0.05, weighting=True, n_jobs=-1
+    counts_df: pd.DataFrame,
+    logratio_trim=0.3,
+    sum_trim=0.05,
+    weighting=True,
+    n_jobs=-1,
+    ref_sample: str | None = None,
+    geometric_rescale=True,
 ):
-    """Compute TMM normalization factors for counts data."""
-    lib_sizes = counts_df.sum(axis=0)
-    median_lib = lib_sizes.median()
-    ref_sample = (lib_sizes - median_lib).abs().idxmin()
+    """
+    Compute TMM normalization factors for counts data.
+    Factors are rescaled to a geometric mean of 1, unless geometric_rescale is False (reference factor of 1).
+    """
+    if ref_sample is None:
+        ref_sample = select_reference_sample(counts_df.sum(axis=0))
 
     ref_counts = counts_df[ref_sample].values
     sample_names = counts_df.columns
@@ -98,19 +126,129 @@ def compute_TMM_normalization_factors(
     for sample, nf in results:
         norm_factors[sample] = nf
 
-    norm_factors = norm_factors / np.exp(np.mean(np.log(norm_factors)))
+    if geometric_rescale:
+        norm_factors = rescale_TMM_factors(norm_factors)
     return norm_factors
 
 
-def tmm_normalization(counts_df: pd.DataFrame, logratio_trim=0.3, sum_trim=0.05, weighting=True, n_jobs=-1):
-    """Perform TMM normalization on counts data."""
+def rescale_TMM_factors(norm_factors: pd.Series) -> pd.Series:
+    """Rescale TMM normalization factors to a geometric mean of 1."""
+    return norm_factors / np.exp(np.mean(np.log(norm_factors)))
+
+
+def compute_TMM_factors(
+    counts_df: pd.DataFrame, logratio_trim=0.3, sum_trim=0.05, weighting=True, n_jobs=-1
+) -> TMMFactors:
+    """Compute the library sizes, reference sample and TMM normalization factors of filtered counts data."""
+    lib_sizes = counts_df.sum(axis=0)
+    ref_sample = select_reference_sample(lib_sizes)
+    norm_factors = compute_TMM_normalization_factors(
+        counts_df, logratio_trim, sum_trim, weighting, n_jobs, ref_sample=ref_sample
+    )
+    return TMMFactors(lib_sizes, norm_factors, ref_sample, lib_sizes.mean())
+
+
+def extend_TMM_factors(
+    counts_df: pd.DataFrame,
+    previous: TMMFactors,
+    samples: list[str],
+    logratio_trim=0.3,
+    sum_trim=0.05,
+    weighting=True,
+    n_jobs=-1,
+) -> TMMFactors | None:
+    """
+    Extend previously computed TMM factors with the factors of new or changed samples, leaving the others untouched.
+    New factors are computed against the previous reference sample and brought to the previous factors' scale.
+    Returns None if the reference sample changes with the current library sizes, in which case
+    all factors must be recomputed.
+    """
     counts_df = filter_counts(counts_df)
-    norm_factors = compute_TMM_normalization_factors(counts_df, logratio_trim, sum_trim, weighting, n_jobs)
     lib_sizes = counts_df.sum(axis=0)
-    normalized_data = counts_df.div(lib_sizes, axis=1).div(norm_factors, axis=1) * lib_sizes.mean()
+    ref_sample = select_reference_sample(lib_sizes)
+    if ref_sample != previous.ref_sample or ref_sample in samples:
+        return None
+
+    samples = [s for s in samples if s in counts_df.columns]
+    new_factors = compute_TMM_normalization_factors(
+        counts_df[[ref_sample, *samples]],
+        logratio_trim,
+        sum_trim,
+        weighting,
+        n_jobs,
+        ref_sample=ref_sample,
+        geometric_rescale=False,
+    )
+    # The previous reference factor holds the inverse of the previous geometric mean rescaling
+    new_factors = new_factors.drop(ref_sample) * previous.norm_factors[ref_sample]
+
+    kept = previous.norm_factors.index.intersection(lib_sizes.index).difference(samples)
+    norm_factors = pd.concat([previous.norm_factors.loc[kept], new_factors])
+    return TMMFactors(lib_sizes.loc[norm_factors.index], norm_factors, ref_sample, previous.lib_scale)
+
+
+def apply_TMM_factors(counts_df: pd.DataFrame, factors: TMMFactors) -> pd.DataFrame:
+    """
+    Scale counts data with previously computed TMM factors.
+    counts_df may only hold a subset of the samples the factors were computed for.
+    """
+    samples = counts_df.columns
+    lib_sizes = factors.lib_sizes.loc[samples]
+    norm_factors = factors.norm_factors.loc[samples]
+    return counts_df.div(lib_sizes, axis=1).div(norm_factors, axis=1) * factors.lib_scale
+
+
+def tmm_normalization_with_factors(
+    counts_df: pd.DataFrame, logratio_trim=0.3, sum_trim=0.05, weighting=True, n_jobs=-1
+) -> tuple[pd.DataFrame, TMMFactors]:
+    """Perform TMM normalization on counts data, also returning the TMM factors used."""
+    counts_df = filter_counts(counts_df)
+    factors = compute_TMM_factors(counts_df, logratio_trim, sum_trim, weighting, n_jobs)
+    return apply_TMM_factors(counts_df, factors), factors
+
+
+def tmm_normalization(counts_df: pd.DataFrame, logratio_trim=0.3, sum_trim=0.05, weighting=True, n_jobs=-1):
+    """Perform TMM normalization on counts data."""
+    normalized_data, _ = tmm_normalization_with_factors(counts_df, logratio_trim, sum_trim, weighting, n_jobs)
     return normalized_data
 
 
+def compute_getmm_rpk(counts_df: pd.DataFrame, gene_lengths: pd.Series, scaling_factor=1e3) -> pd.DataFrame:
+    """Compute the length-corrected reads per kilobase used as GeTMM's TMM input."""
+    counts_df, gene_lengths = prepare_counts_and_lengths(counts_df, gene_lengths)
+    return counts_df.mul(scaling_factor).div(gene_lengths, axis=0)
+
+
+def length_normalize(counts_df: pd.DataFrame, gene_lengths: pd.Series, scaling_factor=1e3) -> pd.DataFrame:
+    """
+    Compute reads per kilobase of counts data, without filtering out genes or samples with zero total counts.
+    Only the genes with a positive length are kept.
+    """
+    valid_lengths = gene_lengths[gene_lengths > 0]
+    genes = counts_df.index.intersection(valid_lengths.index)
+    return counts_df.loc[genes].mul(scaling_factor).div(valid_lengths.loc[genes], axis=0)
+
+
+def tpm_from_rpk(rpk: pd.DataFrame, scale_library=1e6) -> pd.DataFrame:
+    """Convert reads per kilobase to TPM, each sample (column) being scaled independently."""
+    scaling_factors = rpk.sum(axis=0).replace(0, np.nan) / scale_library
+    return rpk.div(scaling_factors, axis=1)
+
+
+def getmm_normalization_with_factors(
+    counts_df: pd.DataFrame,
+    gene_lengths: pd.Series,
+    logratio_trim=0.3,
+    sum_trim=0.05,
+    scaling_factor=1e3,
+    weighting=True,
+    n_jobs=-1,
+) -> tuple[pd.DataFrame, TMMFactors]:
+    """Perform GeTMM normalization on counts data, also returning the TMM factors used."""
+    rpk = compute_getmm_rpk(counts_df, gene_lengths, scaling_factor)
+    return tmm_normalization_with_factors(rpk, logratio_trim, sum_trim, weighting, n_jobs)
+
+
 def getmm_normalization(
     counts_df: pd.DataFrame,
     gene_lengths: pd.Series,
@@ -121,9 +259,89 @@ def getmm_normalization(
     n_jobs=-1,
 ):
     """Perform GeTMM normalization on counts data."""
+    normalized_data, _ = getmm_normalization_with_factors(
+        counts_df, gene_lengths, logratio_trim, sum_trim, scaling_factor, weighting, n_jobs
+    )
+    return normalized_data
+
+
+def compute_cpm(counts_df: pd.DataFrame, scale_library=1e6) -> pd.DataFrame:
+    """Scale filtered counts data to counts per million, each sample (column) by its library size."""
+    values = counts_df.to_numpy(dtype="float64")
+    lib_sizes = np.nansum(values, axis=0)
+    return pd.DataFrame(values / lib_sizes * scale_library, index=counts_df.index, columns=counts_df.columns)
+
+
+def cpm_normalization(counts_df: pd.DataFrame, scale_library=1e6) -> pd.DataFrame:
+    """Convert raw read counts to counts per million."""
+    return compute_cpm(filter_counts(counts_df), scale_library)
+
+
+def fpkm_from_rpk(rpk: pd.DataFrame, lib_sizes: pd.Series, scale_library=1e6) -> pd.DataFrame:
+    """Convert reads per kilobase to FPKM, with the raw library sizes of the samples (columns)."""
+    scaling_factors = lib_sizes.loc[rpk.columns].to_numpy(dtype="float64") / scale_library
+    return pd.DataFrame(rpk.to_numpy(dtype="float64") / scaling_factors, index=rpk.index, columns=rpk.columns)
+
+
+def fpkm_normalization(counts_df: pd.DataFrame, gene_lengths: pd.Series, scale_library=1e6, scaling_factor=1e3):
+    """Convert raw read counts to FPKM, library sizes only counting the genes with a known length."""
     counts_df, gene_lengths = prepare_counts_and_lengths(counts_df, gene_lengths)
     rpk = counts_df.mul(scaling_factor).div(gene_lengths, axis=0)
-    return tmm_normalization(rpk, logratio_trim, sum_trim, weighting, n_jobs)
+    return fpkm_from_rpk(rpk, counts_df.sum(axis=0), scale_library)
+
+
+def apply_scaling_factors(counts_df: pd.DataFrame, factors: pd.Series, scale: float = 1.0) -> pd.DataFrame:
+    """
+    Divide counts data by per-sample scaling factors (upper quartiles, size factors), then multiply by a scale.
+    counts_df may only hold a subset of the samples the factors were computed for.
+    """
+    values = counts_df.to_numpy(dtype="float64")
+    divisors = factors.loc[counts_df.columns].to_numpy(dtype="float64") / scale
+    return pd.DataFrame(values / divisors, index=counts_df.index, columns=counts_df.columns)
+
+
+def upper_quartile_factors(counts_df: pd.DataFrame, quantile=0.75) -> pd.Series:
+    """
+    Compute the upper quartile of each sample (column) of filtered counts data.
+    Missing counts are ignored, samples with an upper quartile of zero get a NaN factor.
+    """
+    quartiles = np.nanquantile(counts_df.to_numpy(dtype="float64"), quantile, axis=0)
+    return pd.Series(quartiles, index=counts_df.columns, dtype="float64").replace(0, np.nan)
+
+
+def upper_quartile_normalization(counts_df: pd.DataFrame, quantile=0.75) -> pd.DataFrame:
+    """
+    Perform upper-quartile normalization on counts data (Bullard et al. 2010).
+    Counts are divided by the upper quartile of their sample, then scaled to the mean upper quartile.
+    """
+    counts_df = filter_counts(counts_df)
+    factors = upper_quartile_factors(counts_df, quantile)
+    return apply_scaling_factors(counts_df, factors, factors.mean())
+
+
+def deseq2_size_factors(counts_df: pd.DataFrame, log_geo_means: pd.Series | None = None) -> pd.Series:
+    """
+    Compute DESeq2 median-of-ratios size factors of filtered counts data.
+    The pseudo-reference is the geometric mean of the genes counted in every sample. It can be given
+    as log_geo_means when counts_df only holds a subset of the samples, genes with a NaN log mean being ignored.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_counts = np.log(counts_df.to_numpy(dtype="float64"))
+    if log_geo_means is None:
+        log_means = log_counts.mean(axis=1)
+    else:
+        log_means = log_geo_means.reindex(counts_df.index).to_numpy(dtype="float64")
+    reference = np.isfinite(log_means)
+    if not reference.any():
+        return pd.Series(np.nan, index=counts_df.columns, dtype="float64")
+    ratios = log_counts[reference] - log_means[reference, np.newaxis]
+    return pd.Series(np.exp(np.median(ratios, axis=0)), index=counts_df.columns, dtype="float64")
+
+
+def deseq2_normalization(counts_df: pd.DataFrame) -> pd.DataFrame:
+    """Perform DESeq2 median-of-ratios normalization on counts data."""
+    counts_df = filter_counts(counts_df)
+    return apply_scaling_factors(counts_df, deseq2_size_factors(counts_df))
 
 
 def compute_rpk(counts_df: pd.DataFrame, gene_lengths_scaled: pd.Series, n_jobs=-1):
@@ -151,3 +369,39 @@ def tpm_normalization(counts_df: pd.DataFrame, gene_lengths: pd.Series, scale_li
     tpm = parallel_apply(rpk.columns, tpm_col, n_jobs)
     tpm.columns = rpk.columns
     return tpm
+
+
+def checksum_counts(counts_df: pd.DataFrame, gene_lengths: pd.Series | None = None) -> str:
+    """Compute a stable checksum of the inputs of a normalization, used to detect unchanged data."""
+    return combine_checksums(checksum_samples(counts_df, gene_lengths))
+
+
+def checksum_samples(counts_df: pd.DataFrame, gene_lengths: pd.Series | None = None) -> pd.Series:
+    """
+    Compute a checksum of the normalization inputs of each sample, used to detect new and changed samples.
+    Only the lengths of the genes counted in a sample are part of its checksum, so that samples can be
+    checksummed block by block.
+    """
+    counts_df = counts_df.sort_index(axis=0)
+    checksums = {}
+    for sample in counts_df.columns:
+        counts = counts_df[sample].dropna()
+        digest = hashlib.sha256(pd.util.hash_pandas_object(counts, index=True).values.tobytes())
+        if gene_lengths is not None:
+            digest.update(pd.util.hash_pandas_object(gene_lengths.reindex(counts.index), index=True).values.tobytes())
+        checksums[sample] = digest.hexdigest()
+    return pd.Series(checksums, dtype="object")
+
+
+def combine_checksums(sample_checksums: pd.Series) -> str:
+    """Combine per-sample checksums into the checksum of a whole normalization input."""
+    digest = hashlib.sha256()
+    for sample, checksum in sample_checksums.sort_index().items():
+        digest.update(f"{sample}\x1f{checksum}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def sample_blocks(samples: list[str], n_genes: int, max_block_values: int) -> list[list[str]]:
+    """Split samples into blocks of at most max_block_values counts (genes x samples), of at least one sample."""
+    block_size = max(1, max_block_values // max(n_genes, 1))
+    return [samples[i : i + block_size] for i in range(0, len(samples), block_size)]
@@ -1,22 +1,35 @@
+from io import BytesIO
 from typing import Annotated, Literal
 from asyncpg import UniqueViolationError
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile, status, Path
+from fastapi import APIRouter, BackgroundTasks, File, Form, Header, HTTPException, UploadFile, status, Path, Query
 
+from transcriptomics_data_service.admission import AdmissionDependency, estimate_upload_memory
 from transcriptomics_data_service.authz.plugin import authz_plugin
+from transcriptomics_data_service.config import ConfigDependency
 from transcriptomics_data_service.db import DatabaseDependency
 from transcriptomics_data_service.ingestion import (
+    AnnDataIngestionHandler,
+    BaseIngestionHandler,
+    BatchSampleIngestionHandler,
+    ColumnarIngestionHandler,
+    MatrixMarketIngestionHandler,
     RCMIngestionHandler,
     SampleIngestionHandler,
+    open_ingestion_source,
 )
+from transcriptomics_data_service.locks import with_experiment_lock
 from transcriptomics_data_service.logger import LoggerDependency
 from transcriptomics_data_service.models import (
     CountTypesEnum,
     ExperimentResult,
     GeneExpressionMapper,
+    NormalizationMethodEnum,
+    NormalizationRun,
     PaginatedRequest,
     SamplesResponse,
     FeaturesResponse,
 )
+from transcriptomics_data_service.write_queue import WriteQueueDependency
 
 __all__ = ["experiment_router"]
 
@@ -24,6 +37,51 @@ experiment_router = APIRouter(prefix="/experiment", dependencies=authz_plugin.de
 
 DEFAULT_PAGINATION = PaginatedRequest(page=1, page_size=100)
 
+DiffQuery = Annotated[
+    bool,
+    Query(
+        description="Only write the new and changed counts, and report how many rows were inserted, changed and left untouched"
+    ),
+]
+
+ReplaceQuery = Annotated[
+    bool, Query(description="Atomically replace the ingested samples: their stored expressions are deleted first")
+]
+
+IdempotencyKeyHeader = Annotated[
+    str | None,
+    Header(description="Client key identifying the ingestion, retries with the same key are not ingested again"),
+]
+BulkLoadQuery = Annotated[
+    bool,
+    Query(
+        description="Bulk-load mode for initial loads and large re-imports: stages the data and merges it at once, "
+        + "rebuilding the indexes if the load outweighs the stored data (blocks other queries meanwhile)"
+    ),
+]
+
+
+SnapshotQuery = Annotated[
+    bool,
+    Query(
+        description="Reload the experiment as a new version of its data, activated atomically once written: "
+        + "queries keep reading the previous version meanwhile"
+    ),
+]
+
+
+def _ingestion_response(response: dict, handler: BaseIngestionHandler, background_tasks: BackgroundTasks) -> dict:
+    """
+    Adds the statistics of diff ingestions and the version written by snapshot ingestions to a response.
+    The versions replaced by a snapshot are deleted once the response is sent.
+    """
+    if handler.diff_stats is not None:
+        response["stats"] = handler.diff_stats
+    if handler.snapshot_version is not None:
+        response["version"] = handler.snapshot_version
+        background_tasks.add_task(handler.db.delete_inactive_gene_expressions, handler.experiment_result_id)
+    return response
+
 
 async def get_experiment_samples_handler(
     experiment_result_id: str,
@@ -151,19 +209,59 @@ async def post_experiment_features(
     return await get_experiment_features_handler(experiment_result_id, params, db, logger)
 
 
+@experiment_router.get(
+    "/{experiment_result_id}/normalization/{method}",
+    response_model=NormalizationRun,
+    dependencies=authz_plugin.dep_authz_get_experiment_result(),
+)
+async def get_experiment_normalization(
+    db: DatabaseDependency, experiment_result_id: str, method: NormalizationMethodEnum
+):
+    """
+    Returns the library sizes, reference sample and normalization factors of the last normalization run
+    of an experiment with the given method.
+    """
+    run = await db.read_normalization_run(experiment_result_id, method)
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No {method.upper()} normalization found for experiment '{experiment_result_id}'.",
+        )
+    return run
+
+
 @experiment_router.delete(
     "/{experiment_result_id}",
-    dependencies=authz_plugin.dep_authz_delete_experiment_result(),
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_delete_experiment_result()),
 )
 async def delete_experiment_result(db: DatabaseDependency, experiment_result_id: str):
     await db.delete_experiment_result(experiment_result_id)
 
 
+@experiment_router.delete(
+    "/{experiment_result_id}/samples",
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_delete_experiment_result()),
+    description="Delete the gene expressions of samples of an experiment",
+)
+async def delete_samples(
+    db: DatabaseDependency,
+    experiment_result_id: str,
+    sample_ids: Annotated[list[str], Query(description="IDs of the samples to delete")],
+):
+    if await db.read_experiment_result(experiment_result_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No experiment result found for provided ID",
+        )
+    n_deleted = await db.delete_samples(experiment_result_id, set(sample_ids))
+    return {"message": f"Deleted {n_deleted} GeneExpressions"}
+
+
 @experiment_router.post(
     "/{experiment_result_id}/ingest/single",
     status_code=status.HTTP_200_OK,
-    # Injects the plugin authz middleware dep_authorize_ingest function
-    dependencies=authz_plugin.dep_authz_ingest(),
+    # Injects the plugin authz middleware dep_authorize_ingest function, and locks the experiment
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_ingest(), unless_queued=True),
     # description="Ingest detailed counts for a single sample TSV or CSV file.",
     summary="Ingest detailed counts for a single sample TSV or CSV file.",
     description="Use this endpoint to ingest raw counts and/or pre-normalized gene expressions at the same time.",
@@ -171,8 +269,9 @@ async def delete_experiment_result(db: DatabaseDependency, experiment_result_id:
 async def ingest_single(
     db: DatabaseDependency,
     logger: LoggerDependency,
+    write_queue: WriteQueueDependency,
     experiment_result_id: Annotated[str, Path(description="ID of an existing `ExperimentResult` to ingest into")],
-    data: Annotated[bytes, File(description="TSV/CSV file bytes")],
+    data: Annotated[UploadFile, File(description="TSV/CSV file, optionally gzip, bzip2 or zstd compressed")],
     sample_id: Annotated[str, Form(description="Sample unique identifier")],
     file_type: Annotated[
         Literal["csv", "tsv"],
@@ -184,10 +283,16 @@ async def ingest_single(
     tmm_count_col: Annotated[str | None, Form(description="TMM count column mapper")] = "",
     getmm_count_col: Annotated[str | None, Form(description="GETMM count column mapper")] = "",
     fpkm_count_col: Annotated[str | None, Form(description="FPKM count column mapper")] = "",
+    cpm_count_col: Annotated[str | None, Form(description="CPM count column mapper")] = "",
+    uq_count_col: Annotated[str | None, Form(description="Upper-quartile count column mapper")] = "",
+    deseq2_count_col: Annotated[str | None, Form(description="DESeq2 count column mapper")] = "",
+    replace: ReplaceQuery = False,
+    idempotency_key: IdempotencyKeyHeader = None,
 ):
     """
     Ingests data for a single sample in an ExperimentResult.
     The sample_id must be provided in the request.
+    If the write queue is enabled, the write is coalesced with concurrent ingestions.
     """
     # Reading and converting uploaded RCM file to DataFrame
     handler = SampleIngestionHandler(experiment_result_id, sample_id, db, logger)
@@ -201,35 +306,349 @@ async def ingest_single(
         tmm_count_col=tmm_count_col,
         getmm_count_col=getmm_count_col,
         fpkm_count_col=fpkm_count_col,
+        cpm_count_col=cpm_count_col,
+        uq_count_col=uq_count_col,
+        deseq2_count_col=deseq2_count_col,
     )
-    handler.load_dataframe(data, file_type, data_mapper)
-    n_created = await handler.ingest()
+    if previous := await handler.previous_ingestion(
+        [data.file], idempotency_key, sample_id=sample_id, file_type=file_type, mapper=data_mapper.model_dump()
+    ):
+        n_created = previous.n_created
+    else:
+        handler.load_dataframe(data.file, file_type, data_mapper)
+        n_created = await handler.ingest(write_queue=write_queue, replace=replace)
     if not n_created:
         return {"message": "Completed with no errors but no new GeneExpression could be created, inspect input data."}
     return {"message": f"Ingested {n_created} GeneExpressions successfully"}
 
 
+@experiment_router.post(
+    "/{experiment_result_id}/ingest/batch",
+    status_code=status.HTTP_200_OK,
+    # Injects the plugin authz middleware dep_authorize_ingest function, and locks the experiment
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_ingest()),
+    summary="Ingest many single sample TSV or CSV files at once.",
+    description="Sample files are uploaded individually or in a tar/zip archive, and share the same column mappers.",
+)
+async def ingest_batch(
+    config: ConfigDependency,
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    admission: AdmissionDependency,
+    experiment_result_id: Annotated[str, Path(description="ID of an existing `ExperimentResult` to ingest into")],
+    files: Annotated[
+        list[UploadFile] | None,
+        File(description="Single sample TSV/CSV files, optionally gzip, bzip2 or zstd compressed"),
+    ] = None,
+    archive: Annotated[
+        UploadFile | None, File(description="tar (optionally compressed) or zip archive of single sample files")
+    ] = None,
+    file_type: Annotated[
+        Literal["csv", "tsv"],
+        Form(description="Specify file format for parsing, 'tsv' by default if not specified"),
+    ] = "tsv",
+    feature_col: Annotated[str, Form(description="Feature column mapper, defaults to 'gene_id'")] = "gene_id",
+    raw_count_col: Annotated[str | None, Form(description="Raw count column mapper")] = "",
+    tpm_count_col: Annotated[str | None, Form(description="TPM count column mapper")] = "",
+    tmm_count_col: Annotated[str | None, Form(description="TMM count column mapper")] = "",
+    getmm_count_col: Annotated[str | None, Form(description="GETMM count column mapper")] = "",
+    fpkm_count_col: Annotated[str | None, Form(description="FPKM count column mapper")] = "",
+    cpm_count_col: Annotated[str | None, Form(description="CPM count column mapper")] = "",
+    uq_count_col: Annotated[str | None, Form(description="Upper-quartile count column mapper")] = "",
+    deseq2_count_col: Annotated[str | None, Form(description="DESeq2 count column mapper")] = "",
+    replace: ReplaceQuery = False,
+):
+    """
+    Ingests data for many samples in an ExperimentResult, the sample IDs are taken from the file names.
+    Samples with invalid files are skipped, the status of each sample is reported in the response.
+    """
+    if (files is None) == (archive is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide either sample files or an archive of sample files.",
+        )
+    if archive is not None:
+        sample_files = BatchSampleIngestionHandler.read_archive(archive.file)
+    else:
+        sample_files = [(f.filename, await f.read()) for f in files]
+
+    data_mapper = GeneExpressionMapper(
+        feature_col=feature_col,
+        raw_count_col=raw_count_col,
+        tpm_count_col=tpm_count_col,
+        tmm_count_col=tmm_count_col,
+        getmm_count_col=getmm_count_col,
+        fpkm_count_col=fpkm_count_col,
+        cpm_count_col=cpm_count_col,
+        uq_count_col=uq_count_col,
+        deseq2_count_col=deseq2_count_col,
+    )
+    handler = BatchSampleIngestionHandler(experiment_result_id, db, logger)
+    memory = estimate_upload_memory([BytesIO(data) for _, data in sample_files])
+    async with admission.reserve(memory, f"ingestion of {experiment_result_id}"):
+        handler.load_files(sample_files, file_type, data_mapper, config.ingestion_n_jobs)
+        if not handler.expressions:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"message": "None of the sample files could be parsed.", "errors": handler.errors},
+            )
+        n_created = await handler.ingest(replace=replace)
+
+    samples = {
+        sample_id: {"status": "ingested", "gene_expressions": len(expressions)}
+        for sample_id, expressions in handler.expressions.items()
+    }
+    samples.update({sample_id: {"status": "failed", "detail": error} for sample_id, error in handler.errors.items()})
+    return {
+        "message": f"Ingested {n_created} GeneExpressions for {len(handler.expressions)} samples, "
+        + f"{len(handler.errors)} samples failed",
+        "samples": samples,
+    }
+
+
 @experiment_router.post(
     "/{experiment_result_id}/ingest",
     status_code=status.HTTP_200_OK,
-    # Injects the plugin authz middleware dep_authorize_ingest function
-    dependencies=authz_plugin.dep_authz_ingest(),
-    description="Ingest a raw counts matrix RCM into an existing experiment",
+    # Injects the plugin authz middleware dep_authorize_ingest function, and locks the experiment
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_ingest()),
+    description="Ingest a raw counts matrix RCM, optionally gzip, bzip2 or zstd compressed, into an existing experiment",
 )
 async def ingest(
     db: DatabaseDependency,
     logger: LoggerDependency,
+    background_tasks: BackgroundTasks,
+    admission: AdmissionDependency,
     experiment_result_id: str,
     rcm_file: UploadFile = File(...),
     count_type: CountTypesEnum | None = None,
+    skip_zeros: Annotated[
+        bool, Query(description="Do not store zero raw counts, and mark the experiment as sparse")
+    ] = False,
+    bulk_load: BulkLoadQuery = False,
+    diff: DiffQuery = False,
+    replace: ReplaceQuery = False,
+    snapshot: SnapshotQuery = False,
+    idempotency_key: IdempotencyKeyHeader = None,
 ):
     if count_type is None:
         count_type = CountTypesEnum.raw
 
-    # Reading and converting uploaded RCM file to DataFrame
-    file_bytes = rcm_file.file.read()
     handler = RCMIngestionHandler(experiment_result_id, db, logger)
-    handler.load_dataframe(file_bytes)
-    await handler.ingest(count_type)
+    if not await handler.previous_ingestion(
+        [rcm_file.file], idempotency_key, count_type=count_type, skip_zeros=skip_zeros, snapshot=snapshot
+    ):
+        async with admission.reserve(estimate_upload_memory([rcm_file.file]), f"ingestion of {experiment_result_id}"):
+            # Reading and converting uploaded RCM file to DataFrame, decompressing it while parsing
+            handler.load_dataframe(rcm_file.file)
+            await handler.ingest(
+                count_type, skip_zeros, bulk_load=bulk_load, diff=diff, replace=replace, snapshot=snapshot
+            )
 
-    return {"message": "Ingestion completed successfully"}
+    return _ingestion_response({"message": "Ingestion completed successfully"}, handler, background_tasks)
+
+
+@experiment_router.post(
+    "/{experiment_result_id}/ingest/mtx",
+    status_code=status.HTTP_200_OK,
+    # Injects the plugin authz middleware dep_authorize_ingest function, and locks the experiment
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_ingest()),
+    description="Ingest a Matrix Market (.mtx) sparse matrix, with its features and samples files, into an existing "
+    + "experiment. Each file can be gzip, bzip2 or zstd compressed.",
+)
+async def ingest_mtx(
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    background_tasks: BackgroundTasks,
+    experiment_result_id: str,
+    matrix_file: Annotated[UploadFile, File(description="Matrix Market coordinate matrix, features x samples")],
+    features_file: Annotated[UploadFile, File(description="Feature identifiers, one per matrix row")],
+    samples_file: Annotated[UploadFile, File(description="Sample identifiers (barcodes), one per matrix column")],
+    count_type: CountTypesEnum | None = None,
+    bulk_load: BulkLoadQuery = False,
+    diff: DiffQuery = False,
+    replace: ReplaceQuery = False,
+    snapshot: SnapshotQuery = False,
+    idempotency_key: IdempotencyKeyHeader = None,
+):
+    if count_type is None:
+        count_type = CountTypesEnum.raw
+
+    handler = MatrixMarketIngestionHandler(experiment_result_id, db, logger)
+    files = [matrix_file.file, features_file.file, samples_file.file]
+    if previous := await handler.previous_ingestion(files, idempotency_key, count_type=count_type, snapshot=snapshot):
+        n_created = previous.n_created
+    else:
+        handler.load_matrix(matrix_file.file, features_file.file.read(), samples_file.file.read())
+        # Pairs without a triplet are zero counts: raw count matrices are ingested as sparse experiments
+        skip_zeros = count_type is CountTypesEnum.raw
+        n_created = await handler.ingest(
+            count_type, skip_zeros=skip_zeros, bulk_load=bulk_load, diff=diff, replace=replace, snapshot=snapshot
+        )
+
+    return _ingestion_response(
+        {"message": f"Ingested {n_created} GeneExpressions successfully"}, handler, background_tasks
+    )
+
+
+@experiment_router.post(
+    "/{experiment_result_id}/ingest/columnar",
+    status_code=status.HTTP_200_OK,
+    # Injects the plugin authz middleware dep_authorize_ingest function, and locks the experiment
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_ingest()),
+    description="Ingest a raw counts matrix RCM in Parquet or Arrow IPC format into an existing experiment",
+)
+async def ingest_columnar(
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    background_tasks: BackgroundTasks,
+    experiment_result_id: str,
+    rcm_file: UploadFile = File(...),
+    count_type: CountTypesEnum | None = None,
+    skip_zeros: Annotated[
+        bool, Query(description="Do not store zero raw counts, and mark the experiment as sparse")
+    ] = False,
+    bulk_load: BulkLoadQuery = False,
+    diff: DiffQuery = False,
+    replace: ReplaceQuery = False,
+    snapshot: SnapshotQuery = False,
+    idempotency_key: IdempotencyKeyHeader = None,
+):
+    if count_type is None:
+        count_type = CountTypesEnum.raw
+
+    handler = ColumnarIngestionHandler(experiment_result_id, db, logger)
+    if previous := await handler.previous_ingestion(
+        [rcm_file.file], idempotency_key, count_type=count_type, skip_zeros=skip_zeros, snapshot=snapshot
+    ):
+        n_created = previous.n_created
+    else:
+        handler.load_table(rcm_file.file)
+        n_created = await handler.ingest(
+            count_type, skip_zeros, bulk_load=bulk_load, diff=diff, replace=replace, snapshot=snapshot
+        )
+
+    return _ingestion_response(
+        {"message": f"Ingested {n_created} GeneExpressions successfully"}, handler, background_tasks
+    )
+
+
+@experiment_router.post(
+    "/{experiment_result_id}/ingest/uri",
+    status_code=status.HTTP_200_OK,
+    # Injects the plugin authz middleware dep_authorize_ingest function, and locks the experiment
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_ingest()),
+    description="Ingest a raw counts matrix RCM stored server-side, without uploading it: a path under the "
+    + "allow-listed local root, or an s3://bucket/key URI of the configured object store",
+)
+async def ingest_uri(
+    config: ConfigDependency,
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    background_tasks: BackgroundTasks,
+    admission: AdmissionDependency,
+    experiment_result_id: str,
+    uri: Annotated[str, Query(description="Local path (or file:// URI), or s3://bucket/key URI of the RCM")],
+    file_format: Annotated[
+        Literal["rcm", "columnar"],
+        Query(description="RCM as CSV/TSV, optionally compressed (rcm), or in Parquet or Arrow IPC format (columnar)"),
+    ] = "rcm",
+    count_type: CountTypesEnum | None = None,
+    skip_zeros: Annotated[
+        bool, Query(description="Do not store zero raw counts, and mark the experiment as sparse")
+    ] = False,
+    bulk_load: BulkLoadQuery = False,
+    diff: DiffQuery = False,
+    replace: ReplaceQuery = False,
+    snapshot: SnapshotQuery = False,
+    idempotency_key: IdempotencyKeyHeader = None,
+):
+    if count_type is None:
+        count_type = CountTypesEnum.raw
+
+    if file_format == "rcm":
+        handler = RCMIngestionHandler(experiment_result_id, db, logger)
+    else:
+        handler = ColumnarIngestionHandler(experiment_result_id, db, logger)
+    with open_ingestion_source(uri, config.ingestion_local_root, config.object_store_endpoint_url) as file:
+        if previous := await handler.previous_ingestion(
+            [file], idempotency_key, count_type=count_type, skip_zeros=skip_zeros, snapshot=snapshot
+        ):
+            n_created = previous.n_created
+        else:
+            # Columnar record batches are streamed, their memory use does not depend on the file size
+            memory = estimate_upload_memory([file]) if file_format == "rcm" else 0
+            async with admission.reserve(memory, f"ingestion of {experiment_result_id}"):
+                if file_format == "rcm":
+                    handler.load_dataframe(file)
+                else:
+                    handler.load_table(file)
+                n_created = await handler.ingest(
+                    count_type, skip_zeros, bulk_load=bulk_load, diff=diff, replace=replace, snapshot=snapshot
+                )
+
+    return _ingestion_response(
+        {"message": f"Ingested {n_created} GeneExpressions successfully"}, handler, background_tasks
+    )
+
+
+@experiment_router.post(
+    "/{experiment_result_id}/ingest/h5ad",
+    status_code=status.HTTP_200_OK,
+    # Injects the plugin authz middleware dep_authorize_ingest function, and locks the experiment
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_ingest()),
+    summary="Ingest the layers of an AnnData (.h5ad) file.",
+    description="Use this endpoint to ingest raw counts and pre-normalized layers of an AnnData file in a single pass. "
+    + "`X` designates the main matrix, other names the matrices under `layers`.",
+)
+async def ingest_h5ad(
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    background_tasks: BackgroundTasks,
+    experiment_result_id: Annotated[str, Path(description="ID of an existing `ExperimentResult` to ingest into")],
+    h5ad_file: Annotated[UploadFile, File(description="AnnData file, with samples as obs and features as var")],
+    raw_count_layer: Annotated[str | None, Form(description="Raw count layer")] = "X",
+    tpm_count_layer: Annotated[str | None, Form(description="TPM count layer")] = "",
+    tmm_count_layer: Annotated[str | None, Form(description="TMM count layer")] = "",
+    getmm_count_layer: Annotated[str | None, Form(description="GETMM count layer")] = "",
+    fpkm_count_layer: Annotated[str | None, Form(description="FPKM count layer")] = "",
+    cpm_count_layer: Annotated[str | None, Form(description="CPM count layer")] = "",
+    uq_count_layer: Annotated[str | None, Form(description="Upper-quartile count layer")] = "",
+    deseq2_count_layer: Annotated[str | None, Form(description="DESeq2 count layer")] = "",
+    skip_zeros: Annotated[
+        bool, Query(description="Do not store zero raw counts, and mark the experiment as sparse")
+    ] = False,
+    bulk_load: BulkLoadQuery = False,
+    diff: DiffQuery = False,
+    replace: ReplaceQuery = False,
+    snapshot: SnapshotQuery = False,
+    idempotency_key: IdempotencyKeyHeader = None,
+):
+    layers = {
+        CountTypesEnum.raw: raw_count_layer,
+        CountTypesEnum.tpm: tpm_count_layer,
+        CountTypesEnum.tmm: tmm_count_layer,
+        CountTypesEnum.getmm: getmm_count_layer,
+        CountTypesEnum.fpkm: fpkm_count_layer,
+        CountTypesEnum.cpm: cpm_count_layer,
+        CountTypesEnum.uq: uq_count_layer,
+        CountTypesEnum.deseq2: deseq2_count_layer,
+    }
+    layers = {count_type: layer for count_type, layer in layers.items() if layer}
+    handler = AnnDataIngestionHandler(experiment_result_id, db, logger)
+    if previous := await handler.previous_ingestion(
+        [h5ad_file.file],
+        idempotency_key,
+        layers={c.value: layer for c, layer in layers.items()},
+        skip_zeros=skip_zeros,
+        snapshot=snapshot,
+    ):
+        n_created = previous.n_created
+    else:
+        handler.load_file(h5ad_file.file, layers)
+        n_created = await handler.ingest(
+            skip_zeros=skip_zeros, bulk_load=bulk_load, diff=diff, replace=replace, snapshot=snapshot
+        )
+
+    return _ingestion_response(
+        {"message": f"Ingested {n_created} GeneExpressions successfully"}, handler, background_tasks
+    )
@@ -0,0 +1,66 @@
+from io import StringIO
+from fastapi import APIRouter, File, HTTPException, UploadFile, status
+import pandas as pd
+
+from transcriptomics_data_service.authz.plugin import authz_plugin
+from transcriptomics_data_service.db import DatabaseDependency
+from transcriptomics_data_service.logger import LoggerDependency
+
+__all__ = [
+    "gene_lengths_router",
+    "load_gene_lengths",
+]
+
+gene_lengths_router = APIRouter(prefix="/gene-lengths", dependencies=authz_plugin.dep_gene_lengths_router())
+
+
+async def load_gene_lengths(gene_lengths_file: UploadFile) -> pd.Series:
+    """
+    Load gene lengths from the uploaded file.
+    """
+    content = await gene_lengths_file.read()
+    gene_lengths_df = pd.read_csv(StringIO(content.decode("utf-8")), index_col=0)
+    if gene_lengths_df.shape[1] != 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Gene lengths file should contain exactly one column of gene lengths.",
+        )
+    gene_lengths_series = gene_lengths_df.iloc[:, 0]
+    gene_lengths_series = gene_lengths_series.apply(pd.to_numeric, errors="raise").astype("float64")
+    return gene_lengths_series
+
+
+@gene_lengths_router.post(
+    "/{assembly_id}",
+    status_code=status.HTTP_200_OK,
+    dependencies=authz_plugin.dep_authz_ingest_gene_lengths(),
+    description="Register the gene lengths of an assembly, replacing any previously registered ones",
+)
+async def ingest_gene_lengths(
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    assembly_id: str,
+    gene_lengths_file: UploadFile = File(...),
+):
+    """
+    Registers the gene lengths of an assembly.
+    TPM and GETMM normalizations use them for experiments of the assembly when no gene lengths file is uploaded.
+    """
+    gene_lengths = await load_gene_lengths(gene_lengths_file)
+    duplicated = gene_lengths.index.duplicated()
+    if duplicated.any():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Found duplicated {gene_lengths.index.name}: {gene_lengths.index[duplicated].values}",
+        )
+    n_created = await db.replace_gene_lengths(assembly_id, gene_lengths.dropna().to_dict())
+    logger.info(f"Registered {n_created} gene lengths for assembly {assembly_id}")
+    return {"message": f"Registered {n_created} gene lengths for assembly {assembly_id}"}
+
+
+@gene_lengths_router.delete(
+    "/{assembly_id}",
+    dependencies=authz_plugin.dep_authz_delete_gene_lengths(),
+)
+async def delete_gene_lengths(db: DatabaseDependency, assembly_id: str):
+    await db.delete_gene_lengths(assembly_id)
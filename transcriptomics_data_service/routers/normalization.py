@@ -1,125 +1,387 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, status
+from typing import Annotated
+
+import asyncpg
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, UploadFile, File, status
 import pandas as pd
-from io import StringIO
 
+from transcriptomics_data_service.admission import AdmissionDependency, estimate_normalization_memory
 from transcriptomics_data_service.authz.plugin import authz_plugin
+from transcriptomics_data_service.config import Config, ConfigDependency
 from transcriptomics_data_service.db import DatabaseDependency
+from transcriptomics_data_service.locks import with_experiment_lock
 from transcriptomics_data_service.logger import LoggerDependency
+from transcriptomics_data_service.routers.gene_lengths import load_gene_lengths
 from transcriptomics_data_service.models import (
-    CountTypesEnum,
-    GeneExpression,
+    NormalizationFactor,
     NormalizationMethodEnum,
+    NormalizationRun,
 )
 from transcriptomics_data_service.normalization_utils import (
-    getmm_normalization,
-    tmm_normalization,
-    tpm_normalization,
+    TMMFactors,
+    apply_scaling_factors,
+    apply_TMM_factors,
+    checksum_counts,
+    checksum_samples,
+    combine_checksums,
+    compute_cpm,
+    compute_getmm_rpk,
+    compute_TMM_normalization_factors,
+    deseq2_size_factors,
+    extend_TMM_factors,
+    filter_counts,
+    fpkm_from_rpk,
+    length_normalize,
+    rescale_TMM_factors,
+    sample_blocks,
+    select_reference_sample,
+    tmm_normalization_with_factors,
+    tpm_from_rpk,
+    upper_quartile_factors,
 )
 
 
 __all__ = ["normalization_router"]
 
 
-REQUIRES_GENES_LENGHTS = [NormalizationMethodEnum.tpm, NormalizationMethodEnum.getmm]
+REQUIRES_GENES_LENGHTS = [NormalizationMethodEnum.tpm, NormalizationMethodEnum.getmm, NormalizationMethodEnum.fpkm]
+# Methods scaling each sample independently, that can be computed for a subset of the samples
+PER_SAMPLE_METHODS = [NormalizationMethodEnum.tpm, NormalizationMethodEnum.fpkm, NormalizationMethodEnum.cpm]
+TMM_METHODS = [NormalizationMethodEnum.tmm, NormalizationMethodEnum.getmm]
+IN_DATABASE_METHODS = [NormalizationMethodEnum.tpm, NormalizationMethodEnum.fpkm, NormalizationMethodEnum.cpm]
 
 normalization_router = APIRouter(prefix="/normalize")
 
 
 @normalization_router.post(
-    "/{experiment_result_id}/{method}", status_code=status.HTTP_200_OK, dependencies=authz_plugin.dep_authz_normalize()
+    "/{experiment_result_id}/{method}",
+    status_code=status.HTTP_200_OK,
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_normalize()),
 )
 async def normalize(
     db: DatabaseDependency,
     logger: LoggerDependency,
+    config: ConfigDependency,
+    admission: AdmissionDependency,
     experiment_result_id: str,
     method: NormalizationMethodEnum,
     gene_lengths_file: UploadFile = File(None),
+    incremental: bool = False,
+    blocked: bool = False,
+    in_database: bool = False,
 ):
     """
     Normalize gene expressions using the specified method for a given experiment_result_id.
+    TPM, GETMM and FPKM use the uploaded gene lengths file, or the gene lengths registered for the experiment's assembly.
+    With `incremental`, only the samples that are new or changed since the last run are normalized.
+    TMM and GETMM reuse the stored factors of the other samples, unless the reference sample changes.
+    With `blocked`, the raw counts are streamed in blocks of samples instead of being loaded at once,
+    for experiments that do not fit in memory.
+    With `in_database`, TPM, FPKM and CPM values are computed by the database, from the registered gene lengths,
+    without transferring the raw counts.
     """
+    memory = await _normalization_memory(db, config, admission, experiment_result_id, blocked, in_database)
+    async with admission.reserve(memory, f"normalization of {experiment_result_id}"):
+        messages = await _normalize_methods(
+            db, logger, config, experiment_result_id, [method], gene_lengths_file, incremental, blocked, in_database
+        )
+    return {"message": messages[method]}
 
-    # Load gene lengths if required
-    if method.lower() in [NormalizationMethodEnum.tpm, NormalizationMethodEnum.getmm]:
-        if gene_lengths_file is None:
+
+@normalization_router.post(
+    "/{experiment_result_id}",
+    status_code=status.HTTP_200_OK,
+    dependencies=with_experiment_lock(authz_plugin.dep_authz_normalize()),
+)
+async def normalize_multiple(
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    config: ConfigDependency,
+    admission: AdmissionDependency,
+    experiment_result_id: str,
+    methods: Annotated[list[NormalizationMethodEnum], Query(description="Normalization methods to compute")],
+    gene_lengths_file: UploadFile = File(None),
+    incremental: bool = False,
+    blocked: bool = False,
+    in_database: bool = False,
+):
+    """
+    Normalize gene expressions with several methods at once for a given experiment_result_id.
+    The raw counts are loaded once, shared intermediates (library sizes, RPK) are computed once,
+    and all the normalized values are written in a single bulk update.
+    """
+    memory = await _normalization_memory(db, config, admission, experiment_result_id, blocked, in_database)
+    async with admission.reserve(memory, f"normalization of {experiment_result_id}"):
+        messages = await _normalize_methods(
+            db, logger, config, experiment_result_id, methods, gene_lengths_file, incremental, blocked, in_database
+        )
+    return {"message": "Normalization completed successfully", "methods": messages}
+
+
+async def _normalization_memory(
+    db: DatabaseDependency,
+    config: Config,
+    admission: AdmissionDependency,
+    experiment_result_id: str,
+    blocked: bool,
+    in_database: bool,
+) -> int:
+    """
+    Estimates the peak memory of a normalization from the number of counts loaded at once.
+    In-database normalizations do not load the counts.
+    """
+    if not admission.enabled or in_database:
+        return 0
+    samples, n_genes = await db.fetch_raw_counts_shape(experiment_result_id)
+    n_counts = len(samples) * n_genes
+    if blocked:
+        n_counts = min(n_counts, config.normalization_max_block_values)
+    return estimate_normalization_memory(n_counts)
+
+
+async def _normalize_methods(
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    config: Config,
+    experiment_result_id: str,
+    methods: list[NormalizationMethodEnum],
+    gene_lengths_file: UploadFile | None,
+    incremental: bool,
+    blocked: bool,
+    in_database: bool,
+) -> dict[NormalizationMethodEnum, str]:
+    """
+    Normalize the raw counts of an experiment with each of the given methods.
+    Returns a message for each method.
+    """
+    methods = list(dict.fromkeys(methods))
+    if blocked and incremental:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incremental normalization cannot be combined with blocked normalization.",
+        )
+    if in_database:
+        if incremental or blocked or gene_lengths_file is not None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Gene lengths file is required for {method.upper()} normalization.",
+                detail="In-database normalization uses the registered gene lengths, and cannot be combined "
+                + "with a gene lengths file, incremental or blocked normalization.",
             )
-        gene_lengths = await _load_gene_lengths(gene_lengths_file)
-    else:
-        gene_lengths = None
+        if any(method not in IN_DATABASE_METHODS for method in methods):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="In-database normalization is only supported for "
+                + ", ".join(method.upper() for method in IN_DATABASE_METHODS),
+            )
+        return await _normalize_methods_in_database(db, logger, experiment_result_id, methods)
+
+    experiment = await db.read_experiment_result(experiment_result_id)
+    if experiment is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Experiment result not found.")
 
-    # Fetch raw counts from the database
-    raw_counts_df = await _fetch_raw_counts(db, experiment_result_id)
-
-    # Perform normalization
-    if method is NormalizationMethodEnum.tpm:
-        raw_counts_df, gene_lengths_series = _align_gene_lengths(raw_counts_df, gene_lengths)
-        normalized_df = tpm_normalization(raw_counts_df, gene_lengths_series)
-    elif method is NormalizationMethodEnum.tmm:
-        normalized_df = tmm_normalization(raw_counts_df)
-    elif method is NormalizationMethodEnum.getmm:
-        raw_counts_df, gene_lengths_series = _align_gene_lengths(raw_counts_df, gene_lengths)
-        normalized_df = getmm_normalization(raw_counts_df, gene_lengths_series)
-    elif method is NormalizationMethodEnum.fpkm:
-        err_msg = "FPKM normalization is not implemented yet, you can ingest FPKM normalised data instead."
-        logger.warning(err_msg)
-        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=err_msg)
+    # Load gene lengths if required
+    methods_with_lengths = [m for m in methods if m in REQUIRES_GENES_LENGHTS]
+    if not methods_with_lengths:
+        gene_lengths = None
+    elif gene_lengths_file is not None:
+        gene_lengths = await load_gene_lengths(gene_lengths_file)
     else:
-        err_msg = f"Normalization method '{method}' is not supported"
-        logger.warning(err_msg)
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=err_msg)
+        gene_lengths = await _fetch_registered_gene_lengths(db, experiment_result_id, methods_with_lengths[0])
+
+    if blocked:
+        return await _normalize_methods_blocked(
+            db, logger, config, experiment_result_id, methods, gene_lengths, experiment.sparse
+        )
+
+    # Fetch raw counts from the database, once for all methods
+    raw_counts_df = await _fetch_raw_counts(db, experiment_result_id, sparse=experiment.sparse)
+
+    aligned_counts_df = gene_lengths_series = rpk = None
+    if gene_lengths is not None:
+        aligned_counts_df, gene_lengths_series = _align_gene_lengths(raw_counts_df, gene_lengths)
+
+    # Checksums only depend on the counts and gene lengths, shared by the methods using the same inputs
+    checksums: dict[bool, tuple[str, pd.Series]] = {}
+
+    messages: dict[NormalizationMethodEnum, str] = {}
+    results: dict[NormalizationMethodEnum, pd.DataFrame] = {}
+    runs: list[NormalizationRun] = []
+    for method in methods:
+        with_lengths = method in REQUIRES_GENES_LENGHTS
+        counts_df = aligned_counts_df if with_lengths else raw_counts_df
+        lengths = gene_lengths_series if with_lengths else None
+        if with_lengths not in checksums:
+            checksums[with_lengths] = (checksum_counts(counts_df, lengths), checksum_samples(counts_df, lengths))
+        input_checksum, sample_checksums = checksums[with_lengths]
+
+        # Skip the normalization if its inputs did not change since the last run
+        previous_run = await db.read_normalization_run(experiment_result_id, method)
+        if previous_run is not None and previous_run.input_checksum == input_checksum:
+            logger.info(f"Inputs unchanged since last {method.upper()} run on {experiment_result_id}, skipping")
+            messages[method] = f"{method.upper()} normalization is already up to date"
+            continue
+
+        if with_lengths and rpk is None:
+            rpk = compute_getmm_rpk(aligned_counts_df, gene_lengths_series)
+
+        # Perform normalization
+        normalized = None
+        method_incremental = incremental and previous_run is not None
+        if method_incremental:
+            normalized = _normalize_incremental(counts_df, rpk, method, previous_run, sample_checksums)
+            if normalized is None:
+                logger.info(f"{method.upper()} factors changed on {experiment_result_id}, normalizing all samples")
+                method_incremental = False
+        if normalized is None:
+            normalized = _normalize_samples(counts_df, rpk, method)
+        normalized_df, factors = normalized
+
+        results[method] = normalized_df
+        runs.append(
+            _build_normalization_run(
+                experiment_result_id, method, input_checksum, counts_df.sum(axis=0), factors, sample_checksums
+            )
+        )
+        if method_incremental:
+            messages[method] = (
+                f"{method.upper()} normalization completed successfully for "
+                + f"{normalized_df.shape[1]} new or changed sample(s)"
+            )
+        else:
+            messages[method] = f"{method.upper()} normalization completed successfully"
+
+    # Update database with normalized values and the factors that produced them
+    if runs:
+        await _update_normalized_values(db, experiment_result_id, results, runs)
+    return messages
+
+
+def _normalize_samples(
+    counts_df: pd.DataFrame,
+    rpk: pd.DataFrame | None,
+    method: NormalizationMethodEnum,
+    samples: list[str] | None = None,
+) -> tuple[pd.DataFrame, TMMFactors | pd.Series | None]:
+    """
+    Normalize counts with a method, returning the normalized values and the factors that produced them.
+    Methods requiring gene lengths use the shared reads per kilobase of the aligned counts.
+    Per-sample methods can be restricted to some of the samples.
+    """
+    if method is NormalizationMethodEnum.tmm:
+        return tmm_normalization_with_factors(counts_df)
+    if method is NormalizationMethodEnum.getmm:
+        return tmm_normalization_with_factors(rpk)
 
-    # Update database with normalized values
-    await _update_normalized_values(db, normalized_df, experiment_result_id, method)
+    if method in REQUIRES_GENES_LENGHTS:
+        if samples is not None:
+            rpk = rpk[[s for s in samples if s in rpk.columns]]
+        if method is NormalizationMethodEnum.tpm:
+            return tpm_from_rpk(rpk), None
+        # FPKM library sizes only count the genes with a known length
+        return fpkm_from_rpk(rpk, counts_df.loc[rpk.index, rpk.columns].sum(axis=0)), None
 
-    return {"message": f"{method.upper()} normalization completed successfully"}
+    counts_df = filter_counts(counts_df)
+    if samples is not None:
+        counts_df = counts_df[[s for s in samples if s in counts_df.columns]]
+    if method is NormalizationMethodEnum.cpm:
+        return compute_cpm(counts_df), None
+    if method is NormalizationMethodEnum.uq:
+        factors = upper_quartile_factors(counts_df)
+        return apply_scaling_factors(counts_df, factors, factors.mean()), factors
+    if method is NormalizationMethodEnum.deseq2:
+        factors = deseq2_size_factors(counts_df)
+        return apply_scaling_factors(counts_df, factors), factors
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail=f"Normalization method '{method}' is not supported"
+    )
 
 
-async def _load_gene_lengths(gene_lengths_file: UploadFile) -> pd.Series:
+def _normalize_incremental(
+    counts_df: pd.DataFrame,
+    rpk: pd.DataFrame | None,
+    method: NormalizationMethodEnum,
+    previous_run: NormalizationRun,
+    sample_checksums: pd.Series,
+) -> tuple[pd.DataFrame, TMMFactors | None] | None:
+    """
+    Normalize the samples that are new or changed since the previous run.
+    Returns None if all the samples must be normalized again: the TMM reference sample changed,
+    or the method's factors depend on all the samples (upper quartile, DESeq2).
     """
-    Load gene lengths from the uploaded file.
+    stored_checksums = {f.sample_id: f.input_checksum for f in previous_run.factors}
+    samples = [s for s, checksum in sample_checksums.items() if stored_checksums.get(s) != checksum]
+
+    if method in PER_SAMPLE_METHODS:
+        return _normalize_samples(counts_df, rpk, method, samples)
+    if method not in TMM_METHODS:
+        return None
+
+    previous_factors = _tmm_factors_from_run(previous_run)
+    if previous_factors is None:
+        return None
+    if method is NormalizationMethodEnum.getmm:
+        counts_df = rpk
+    tmm_factors = extend_TMM_factors(counts_df, previous_factors, samples)
+    if tmm_factors is None:
+        return None
+    counts_df = filter_counts(counts_df)
+    return apply_TMM_factors(counts_df[[s for s in samples if s in counts_df.columns]], tmm_factors), tmm_factors
+
+
+def _tmm_factors_from_run(run: NormalizationRun) -> TMMFactors | None:
     """
-    content = await gene_lengths_file.read()
-    gene_lengths_df = pd.read_csv(StringIO(content.decode("utf-8")), index_col=0)
-    if gene_lengths_df.shape[1] != 1:
+    Rebuild the TMM factors of a stored TMM or GETMM run, if it holds all of them.
+    """
+    if run.reference_sample_id is None or run.library_scale is None:
+        return None
+    if any(f.norm_factor is None for f in run.factors):
+        return None
+    return TMMFactors(
+        lib_sizes=pd.Series({f.sample_id: f.library_size for f in run.factors}, dtype="float64"),
+        norm_factors=pd.Series({f.sample_id: f.norm_factor for f in run.factors}, dtype="float64"),
+        ref_sample=run.reference_sample_id,
+        lib_scale=run.library_scale,
+    )
+
+
+async def _fetch_registered_gene_lengths(
+    db: DatabaseDependency, experiment_result_id: str, method: NormalizationMethodEnum
+) -> pd.Series:
+    """
+    Fetch the gene lengths registered for the assembly of the experiment, aligned on its features.
+    """
+    gene_lengths = await db.fetch_experiment_gene_lengths(experiment_result_id)
+    if not gene_lengths:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Gene lengths file should contain exactly one column of gene lengths.",
+            detail=f"Gene lengths file is required for {method.upper()} normalization, "
+            + "unless gene lengths are registered for the experiment's assembly.",
         )
-    gene_lengths_series = gene_lengths_df.iloc[:, 0]
-    gene_lengths_series = gene_lengths_series.apply(pd.to_numeric, errors="raise")
-    return gene_lengths_series
+    return pd.Series(gene_lengths, dtype="float64")
 
 
-async def _fetch_raw_counts(db: DatabaseDependency, experiment_result_id: str) -> pd.DataFrame:
+async def _fetch_raw_counts(
+    db: DatabaseDependency,
+    experiment_result_id: str,
+    sample_ids: list[str] | None = None,
+    conn: asyncpg.Connection | None = None,
+    sparse: bool = False,
+) -> pd.DataFrame:
     """
-    Fetch raw counts from the database for the given experiment_result_id.
+    Fetch raw counts from the database for the given experiment_result_id, optionally for a block of samples.
     Returns a DataFrame with genes as rows and samples as columns.
+    Missing counts of sparse experiments are zeros.
     """
-    expressions, _ = await db.fetch_gene_expressions(
-        experiments=[experiment_result_id], method=CountTypesEnum.raw, pagination=None
-    )
-    if not expressions:
+    records = await db.fetch_raw_counts(experiment_result_id, sample_ids, conn)
+    if not records:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Experiment result not found.")
 
-    # TODO: this extra loop is not needed, Ill modify db.fetch_gene_expressions
-    # so we can pass a lambda mapper to convert directly from DB records,
-    # with no intermediate GeneExpression deserialization.
-    data = []
-    for expr in expressions:
-        data.append(
-            {
-                "GeneID": expr.gene_code,
-                "SampleID": expr.sample_id,
-                "RawCount": expr.raw_count,
-            }
-        )
-    df = pd.DataFrame(data)
+    df = pd.DataFrame.from_records(records, columns=["GeneID", "SampleID", "RawCount"])
     raw_counts_df = df.pivot(index="GeneID", columns="SampleID", values="RawCount")
 
     raw_counts_df = raw_counts_df.apply(pd.to_numeric, errors="raise")
+    if sparse:
+        raw_counts_df = raw_counts_df.fillna(0)
 
     return raw_counts_df
 
@@ -128,7 +390,7 @@ def _align_gene_lengths(raw_counts_df: pd.DataFrame, gene_lengths: pd.Series):
     """
     Align the gene lengths with the raw counts DataFrame based on GeneID.
     """
-    common_genes = raw_counts_df.index.intersection(gene_lengths.index)
+    common_genes = raw_counts_df.index.intersection(gene_lengths.index).rename(raw_counts_df.index.name)
     if common_genes.empty:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -139,50 +401,330 @@ def _align_gene_lengths(raw_counts_df: pd.DataFrame, gene_lengths: pd.Series):
     return raw_counts_df, gene_lengths_series
 
 
-async def _update_normalized_values(
-    db: DatabaseDependency,
-    normalized_df: pd.DataFrame,
+def _build_normalization_run(
     experiment_result_id: str,
     method: NormalizationMethodEnum,
-):
+    input_checksum: str,
+    raw_lib_sizes: pd.Series,
+    tmm_factors: TMMFactors | pd.Series | None,
+    sample_checksums: pd.Series,
+) -> NormalizationRun:
     """
-    Update the normalized values in the database.
+    Build the persisted record of a normalization run.
+    TMM and GETMM store their library sizes and factors, upper-quartile and DESeq2 the raw library sizes
+    and their per-sample factors, other methods only the raw library sizes.
     """
-    # Fetch existing expressions to get raw_count values
-    existing_expressions, _ = await db.fetch_gene_expressions(
-        experiments=[experiment_result_id], method=CountTypesEnum.raw, pagination=None
+    if not isinstance(tmm_factors, TMMFactors):
+        norm_factors = tmm_factors if tmm_factors is not None else pd.Series(dtype="float64")
+        factors = [
+            NormalizationFactor(
+                sample_id=sample_id,
+                library_size=lib_size,
+                norm_factor=None if pd.isna(norm_factors.get(sample_id)) else norm_factors[sample_id],
+                input_checksum=sample_checksums[sample_id],
+            )
+            for sample_id, lib_size in raw_lib_sizes.items()
+        ]
+        reference_sample_id = None
+        library_scale = norm_factors.mean() if method is NormalizationMethodEnum.uq else None
+    else:
+        factors = [
+            NormalizationFactor(
+                sample_id=sample_id,
+                library_size=lib_size,
+                norm_factor=tmm_factors.norm_factors[sample_id],
+                input_checksum=sample_checksums[sample_id],
+            )
+            for sample_id, lib_size in tmm_factors.lib_sizes.items()
+        ]
+        reference_sample_id = tmm_factors.ref_sample
+        library_scale = tmm_factors.lib_scale
+    return NormalizationRun(
+        experiment_result_id=experiment_result_id,
+        method=method,
+        reference_sample_id=reference_sample_id,
+        input_checksum=input_checksum,
+        library_scale=library_scale,
+        factors=factors,
     )
-    raw_count_dict = {(expr.gene_code, expr.sample_id): expr.raw_count for expr in existing_expressions}
 
-    normalized_df = (
-        normalized_df.reset_index()
-        .melt(id_vars="GeneID", var_name="SampleID", value_name="NormalizedValue")
-        .dropna(subset=["NormalizedValue"])
+
+def _normalized_records(
+    results: dict[NormalizationMethodEnum, pd.DataFrame],
+) -> tuple[list[NormalizationMethodEnum], list[tuple]]:
+    """
+    Combine the normalized values of several methods into (gene_code, sample_id, *values) records,
+    with a value for each of the returned methods.
+    """
+    methods = [method for method, df in results.items() if not df.empty]
+    if not methods:
+        return [], []
+    combined = pd.concat(
+        [
+            results[method].rename_axis(index="GeneID", columns="SampleID").stack().rename(method.value)
+            for method in methods
+        ],
+        axis=1,
+        join="outer",
     )
+    combined = combined.astype(object).where(combined.notna(), None)
+    return methods, [(gene, sample, *values) for (gene, sample), *values in combined.itertuples(name=None)]
 
-    expressions = []
-    for _, row in normalized_df.iterrows():
-        gene_code = row["GeneID"]
-        sample_id = row["SampleID"]
-        raw_count = raw_count_dict.get((gene_code, sample_id))
 
-        if raw_count is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Raw count not found for gene {gene_code}, sample {sample_id}",
-            )
+async def _update_normalized_values(
+    db: DatabaseDependency,
+    experiment_result_id: str,
+    results: dict[NormalizationMethodEnum, pd.DataFrame],
+    runs: list[NormalizationRun],
+):
+    """
+    Update the normalized values of all methods in the database with a single bulk update,
+    along with the normalization runs that produced them.
+    """
+    methods, records = _normalized_records(results)
+
+    conn: asyncpg.Connection
+    async with db.transaction_connection() as conn:
+        if records:
+            await db.update_normalized_values(experiment_result_id, methods, records, conn)
+        for run in runs:
+            await db.create_or_update_normalization_run(run, conn)
+
+
+async def _normalize_methods_blocked(
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    config: Config,
+    experiment_result_id: str,
+    methods: list[NormalizationMethodEnum],
+    gene_lengths: pd.Series | None,
+    sparse: bool = False,
+) -> dict[NormalizationMethodEnum, str]:
+    """
+    Normalize the raw counts of an experiment block by block, holding at most
+    `normalization_max_block_values` counts in memory at once.
+    A first pass computes the gene totals, library sizes and checksums, a second one the per-sample factors
+    (TMM factors against the reference sample, upper quartiles, DESeq2 size factors),
+    and a last one normalizes and writes back each block in a single transaction.
+    """
+    samples, n_genes = await db.fetch_raw_counts_shape(experiment_result_id)
+    if not samples:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Experiment result not found.")
+    blocks = sample_blocks(samples, n_genes, config.normalization_max_block_values)
+    logger.info(f"Normalizing {experiment_result_id} in {len(blocks)} block(s) of samples")
+
+    # First pass: gene totals, library sizes and checksums
+    inputs = {method in REQUIRES_GENES_LENGHTS for method in methods}
+    block_lib_sizes: dict[bool, list[pd.Series]] = {with_lengths: [] for with_lengths in inputs}
+    block_checksums: dict[bool, list[pd.Series]] = {with_lengths: [] for with_lengths in inputs}
+    block_rpk_sizes: list[pd.Series] = []
+    block_fpkm_sizes: list[pd.Series] = []
+    gene_totals = pd.Series(dtype="float64")
+    # DESeq2 pseudo-reference: sum of the log counts and number of positive counts of each gene
+    gene_log_sums = pd.Series(dtype="float64")
+    gene_positive_counts = pd.Series(dtype="float64")
+    for block in blocks:
+        raw_counts_df = await _fetch_raw_counts(db, experiment_result_id, block, sparse=sparse)
+        gene_totals = gene_totals.add(raw_counts_df.sum(axis=1), fill_value=0)
+        if NormalizationMethodEnum.deseq2 in methods:
+            counted = raw_counts_df.loc[:, raw_counts_df.sum(axis=0) > 0]
+            positive = counted.where(counted > 0)
+            gene_log_sums = gene_log_sums.add(np.log(positive).sum(axis=1), fill_value=0)
+            gene_positive_counts = gene_positive_counts.add(positive.count(axis=1), fill_value=0)
+        for with_lengths in inputs:
+            counts_df, lengths = raw_counts_df, None
+            if with_lengths:
+                genes = raw_counts_df.index.intersection(gene_lengths.index)
+                counts_df, lengths = raw_counts_df.loc[genes], gene_lengths.loc[genes]
+                block_rpk_sizes.append(length_normalize(counts_df, lengths).sum(axis=0))
+                block_fpkm_sizes.append(counts_df.loc[lengths > 0].sum(axis=0))
+            block_lib_sizes[with_lengths].append(counts_df.sum(axis=0))
+            block_checksums[with_lengths].append(checksum_samples(counts_df, lengths))
+
+    if gene_lengths is not None and gene_totals.index.intersection(gene_lengths.index).empty:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No common genes between counts and gene lengths.",
+        )
+    expressed_genes = gene_totals.index[gene_totals > 0]
+    lib_sizes = {with_lengths: pd.concat(sizes) for with_lengths, sizes in block_lib_sizes.items()}
+    sample_checksums = {with_lengths: pd.concat(checksums) for with_lengths, checksums in block_checksums.items()}
+    rpk_sizes = pd.concat(block_rpk_sizes) if block_rpk_sizes else None
+
+    messages: dict[NormalizationMethodEnum, str] = {}
+    normalized_methods: list[NormalizationMethodEnum] = []
+    tmm_factors: dict[NormalizationMethodEnum, TMMFactors] = {}
+    # Divisors of the per-sample methods, samples with a zero library size are not normalized
+    sample_divisors: dict[NormalizationMethodEnum, pd.Series] = {}
+    for method in methods:
+        with_lengths = method in REQUIRES_GENES_LENGHTS
+        input_checksum = combine_checksums(sample_checksums[with_lengths])
+        previous_run = await db.read_normalization_run(experiment_result_id, method)
+        if previous_run is not None and previous_run.input_checksum == input_checksum:
+            logger.info(f"Inputs unchanged since last {method.upper()} run on {experiment_result_id}, skipping")
+            messages[method] = f"{method.upper()} normalization is already up to date"
+            continue
+        normalized_methods.append(method)
+        if method in TMM_METHODS:
+            sizes = rpk_sizes if method is NormalizationMethodEnum.getmm else lib_sizes[False]
+            sizes = sizes[sizes > 0]
+            tmm_factors[method] = TMMFactors(sizes, None, select_reference_sample(sizes), sizes.mean())
+        elif method in PER_SAMPLE_METHODS:
+            sizes = {
+                NormalizationMethodEnum.tpm: rpk_sizes,
+                NormalizationMethodEnum.fpkm: pd.concat(block_fpkm_sizes) if block_fpkm_sizes else None,
+                NormalizationMethodEnum.cpm: lib_sizes.get(False),
+            }[method]
+            sample_divisors[method] = sizes[sizes > 0] / 1e6
+
+    counted_samples = lib_sizes[False].index[lib_sizes[False] > 0] if False in lib_sizes else pd.Index([])
+    log_geo_means = None
+    if NormalizationMethodEnum.deseq2 in normalized_methods:
+        reference_genes = gene_positive_counts == len(counted_samples)
+        log_geo_means = (gene_log_sums / len(counted_samples)).where(reference_genes)
 
-        # Create a GeneExpression object with the normalized value
-        gene_expression = GeneExpression(
-            gene_code=gene_code,
-            sample_id=sample_id,
-            experiment_result_id=experiment_result_id,
-            raw_count=raw_count,
-            tpm_count=row["NormalizedValue"] if method == NormalizationMethodEnum.tpm else None,
-            tmm_count=row["NormalizedValue"] if method == NormalizationMethodEnum.tmm else None,
-            getmm_count=row["NormalizedValue"] if method == NormalizationMethodEnum.getmm else None,
+    # Second pass: per-sample factors of each block
+    scaling_factors: dict[NormalizationMethodEnum, list[pd.Series]] = {
+        method: []
+        for method in normalized_methods
+        if method in (NormalizationMethodEnum.uq, NormalizationMethodEnum.deseq2)
+    }
+    if tmm_factors or scaling_factors:
+        ref_counts = {}
+        for method, factors in tmm_factors.items():
+            ref_df = await _fetch_raw_counts(db, experiment_result_id, [factors.ref_sample], sparse=sparse)
+            if sparse:
+                # Genes without counts in a block of a sparse experiment have implicit zero counts
+                ref_df = ref_df.reindex(expressed_genes, fill_value=0)
+            ref_counts[method] = _blocked_method_counts(ref_df, method, gene_lengths)[factors.ref_sample]
+
+        block_factors = {method: [pd.Series({factors.ref_sample: 1.0})] for method, factors in tmm_factors.items()}
+        for block in blocks:
+            raw_counts_df = await _fetch_raw_counts(db, experiment_result_id, block, sparse=sparse)
+            if sparse:
+                raw_counts_df = raw_counts_df.reindex(expressed_genes, fill_value=0)
+            for method, factors in tmm_factors.items():
+                counts_df = _blocked_method_counts(raw_counts_df, method, gene_lengths)
+                block_samples = [
+                    s for s in counts_df.columns if s in factors.lib_sizes.index and s != factors.ref_sample
+                ]
+                if not block_samples:
+                    continue
+                norm_factors = compute_TMM_normalization_factors(
+                    pd.concat([ref_counts[method], counts_df[block_samples]], axis=1),
+                    ref_sample=factors.ref_sample,
+                    geometric_rescale=False,
+                )
+                block_factors[method].append(norm_factors.drop(factors.ref_sample))
+
+            counts_df = raw_counts_df.loc[
+                raw_counts_df.index.intersection(expressed_genes), raw_counts_df.columns.intersection(counted_samples)
+            ]
+            if NormalizationMethodEnum.uq in scaling_factors:
+                scaling_factors[NormalizationMethodEnum.uq].append(upper_quartile_factors(counts_df))
+            if NormalizationMethodEnum.deseq2 in scaling_factors:
+                scaling_factors[NormalizationMethodEnum.deseq2].append(deseq2_size_factors(counts_df, log_geo_means))
+        for method, factors in tmm_factors.items():
+            norm_factors = rescale_TMM_factors(pd.concat(block_factors[method]))
+            tmm_factors[method] = factors._replace(norm_factors=norm_factors.loc[factors.lib_sizes.index])
+    scaling_factors = {method: pd.concat(factors) for method, factors in scaling_factors.items()}
+
+    runs = [
+        _build_normalization_run(
+            experiment_result_id,
+            method,
+            combine_checksums(sample_checksums[method in REQUIRES_GENES_LENGHTS]),
+            lib_sizes[method in REQUIRES_GENES_LENGHTS],
+            tmm_factors.get(method, scaling_factors.get(method)),
+            sample_checksums[method in REQUIRES_GENES_LENGHTS],
         )
-        expressions.append(gene_expression)
+        for method in normalized_methods
+    ]
+
+    # Last pass: normalize and write back each block, along with the runs, in a single transaction
+    if normalized_methods:
+        conn: asyncpg.Connection
+        async with db.transaction_connection() as conn:
+            for block in blocks:
+                raw_counts_df = await _fetch_raw_counts(db, experiment_result_id, block, conn, sparse)
+                raw_counts_df = raw_counts_df.loc[raw_counts_df.index.intersection(expressed_genes)]
+                results = {}
+                for method in normalized_methods:
+                    counts_df = _blocked_method_counts(raw_counts_df, method, gene_lengths)
+                    if method in tmm_factors:
+                        factors = tmm_factors[method]
+                        counts_df = counts_df[counts_df.columns.intersection(factors.lib_sizes.index)]
+                        results[method] = apply_TMM_factors(counts_df, factors)
+                    elif method in sample_divisors:
+                        counts_df = counts_df[counts_df.columns.intersection(sample_divisors[method].index)]
+                        results[method] = apply_scaling_factors(counts_df, sample_divisors[method])
+                    else:
+                        factors = scaling_factors[method]
+                        counts_df = counts_df[counts_df.columns.intersection(factors.index)]
+                        scale = factors.mean() if method is NormalizationMethodEnum.uq else 1.0
+                        results[method] = apply_scaling_factors(counts_df, factors, scale)
+                block_methods, records = _normalized_records(results)
+                if records:
+                    await db.update_normalized_values(experiment_result_id, block_methods, records, conn)
+            for run in runs:
+                await db.create_or_update_normalization_run(run, conn)
 
-    # Update expressions in the database
-    await db.update_normalized_expressions(expressions, method)
+    for method in normalized_methods:
+        messages[method] = f"{method.upper()} normalization completed successfully"
+    return {method: messages[method] for method in methods}
+
+
+async def _normalize_methods_in_database(
+    db: DatabaseDependency,
+    logger: LoggerDependency,
+    experiment_result_id: str,
+    methods: list[NormalizationMethodEnum],
+) -> dict[NormalizationMethodEnum, str]:
+    """
+    Normalize the raw counts of an experiment in the database, without transferring them.
+    The library sizes and checksums of the normalization runs are computed in the database as well.
+    """
+    messages: dict[NormalizationMethodEnum, str] = {}
+    for method in methods:
+        previous_run = await db.read_normalization_run(experiment_result_id, method)
+
+        conn: asyncpg.Connection
+        async with db.transaction_connection() as conn:
+            with_lengths = method in REQUIRES_GENES_LENGHTS
+            inputs = await db.fetch_normalization_inputs(experiment_result_id, with_lengths, conn)
+            if not inputs:
+                detail = f"In-database {method.upper()} normalization requires raw counts"
+                if with_lengths:
+                    detail += ", and gene lengths registered for the experiment's assembly"
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{detail}.")
+            sample_checksums = pd.Series({r["sample_id"]: r["input_checksum"] for r in inputs}, dtype="object")
+            lib_sizes = pd.Series({r["sample_id"]: r["library_size"] for r in inputs}, dtype="float64")
+
+            # Skip the normalization if its inputs did not change since the last run
+            input_checksum = combine_checksums(sample_checksums)
+            if previous_run is not None and previous_run.input_checksum == input_checksum:
+                logger.info(f"Inputs unchanged since last {method.upper()} run on {experiment_result_id}, skipping")
+                messages[method] = f"{method.upper()} normalization is already up to date"
+                continue
+
+            await db.normalize_in_database(experiment_result_id, method, conn)
+            await db.create_or_update_normalization_run(
+                _build_normalization_run(
+                    experiment_result_id, method, input_checksum, lib_sizes, None, sample_checksums
+                ),
+                conn,
+            )
+        messages[method] = f"{method.upper()} normalization completed successfully"
+    return messages
+
+
+def _blocked_method_counts(
+    raw_counts_df: pd.DataFrame, method: NormalizationMethodEnum, gene_lengths: pd.Series | None
+) -> pd.DataFrame:
+    """
+    Returns the counts a method normalizes in a block: reads per kilobase for the methods requiring gene lengths,
+    raw counts otherwise.
+    """
+    if method in REQUIRES_GENES_LENGHTS:
+        return length_normalize(raw_counts_df, gene_lengths)
+    return raw_counts_df
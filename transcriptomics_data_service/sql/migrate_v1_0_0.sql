@@ -1,3 +1,6 @@
+-- Views cannot depend on migrated columns, they are created again by the last migration
+DROP VIEW IF EXISTS active_gene_expressions;
+
 -- Change gene_expressions.raw_count from INTEGER to FLOAT and allow NULL
 ALTER TABLE gene_expressions ALTER COLUMN raw_count DROP NOT NULL;
 ALTER TABLE gene_expressions ALTER COLUMN raw_count TYPE FLOAT;
@@ -0,0 +1,78 @@
+-- Add incremental normalization columns to normalization_runs and normalization_factors
+ALTER TABLE normalization_runs ADD COLUMN IF NOT EXISTS library_scale FLOAT;
+ALTER TABLE normalization_factors ADD COLUMN IF NOT EXISTS input_checksum VARCHAR(64);
+
+-- Add CPM, upper-quartile and DESeq2 columns to gene_expressions
+ALTER TABLE gene_expressions ADD COLUMN IF NOT EXISTS cpm_count FLOAT;
+ALTER TABLE gene_expressions ADD COLUMN IF NOT EXISTS uq_count FLOAT;
+ALTER TABLE gene_expressions ADD COLUMN IF NOT EXISTS deseq2_count FLOAT;
+
+-- Add the sparse flag to experiment_results: zero raw counts of sparse experiments are not stored
+ALTER TABLE experiment_results ADD COLUMN IF NOT EXISTS sparse BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- Add snapshot versions: gene expressions are stored per version of their experiment, readers only see the active one
+ALTER TABLE experiment_results ADD COLUMN IF NOT EXISTS active_version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE gene_expressions ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = 'gene_expressions'::regclass AND i.indisprimary AND a.attname = 'version'
+    ) THEN
+        ALTER TABLE gene_expressions
+            DROP CONSTRAINT gene_expressions_pkey,
+            ADD PRIMARY KEY (gene_code, sample_id, experiment_result_id, version);
+    END IF;
+END $$;
+
+-- Store the normalized values computed by normalizations in a narrow table: normalizing inserts or updates small
+-- rows there, instead of rewriting every gene_expressions row and its index entries
+CREATE TABLE IF NOT EXISTS normalized_expressions (
+    experiment_result_id VARCHAR(255) NOT NULL,
+    version INTEGER NOT NULL,
+    gene_code VARCHAR(255) NOT NULL,
+    sample_id VARCHAR(255) NOT NULL,
+    method VARCHAR(32) NOT NULL,
+    value FLOAT NOT NULL,
+    PRIMARY KEY (experiment_result_id, version, gene_code, sample_id, method),
+    FOREIGN KEY (gene_code, sample_id, experiment_result_id, version)
+        REFERENCES gene_expressions (gene_code, sample_id, experiment_result_id, version) ON DELETE CASCADE
+);
+
+-- Computed normalized values take precedence over the ingested ones, the joins are skipped by the planner
+-- when no normalized value is selected
+CREATE OR REPLACE VIEW active_gene_expressions AS
+    SELECT
+        ge.gene_code, ge.sample_id, ge.experiment_result_id, ge.raw_count,
+        COALESCE(tpm.value, ge.tpm_count) AS tpm_count,
+        COALESCE(tmm.value, ge.tmm_count) AS tmm_count,
+        COALESCE(getmm.value, ge.getmm_count) AS getmm_count,
+        COALESCE(fpkm.value, ge.fpkm_count) AS fpkm_count,
+        COALESCE(cpm.value, ge.cpm_count) AS cpm_count,
+        COALESCE(uq.value, ge.uq_count) AS uq_count,
+        COALESCE(deseq2.value, ge.deseq2_count) AS deseq2_count
+    FROM gene_expressions ge
+    JOIN experiment_results er ON er.experiment_result_id = ge.experiment_result_id
+    LEFT JOIN normalized_expressions tpm ON tpm.experiment_result_id = ge.experiment_result_id
+        AND tpm.version = ge.version AND tpm.gene_code = ge.gene_code AND tpm.sample_id = ge.sample_id
+        AND tpm.method = 'tpm'
+    LEFT JOIN normalized_expressions tmm ON tmm.experiment_result_id = ge.experiment_result_id
+        AND tmm.version = ge.version AND tmm.gene_code = ge.gene_code AND tmm.sample_id = ge.sample_id
+        AND tmm.method = 'tmm'
+    LEFT JOIN normalized_expressions getmm ON getmm.experiment_result_id = ge.experiment_result_id
+        AND getmm.version = ge.version AND getmm.gene_code = ge.gene_code AND getmm.sample_id = ge.sample_id
+        AND getmm.method = 'getmm'
+    LEFT JOIN normalized_expressions fpkm ON fpkm.experiment_result_id = ge.experiment_result_id
+        AND fpkm.version = ge.version AND fpkm.gene_code = ge.gene_code AND fpkm.sample_id = ge.sample_id
+        AND fpkm.method = 'fpkm'
+    LEFT JOIN normalized_expressions cpm ON cpm.experiment_result_id = ge.experiment_result_id
+        AND cpm.version = ge.version AND cpm.gene_code = ge.gene_code AND cpm.sample_id = ge.sample_id
+        AND cpm.method = 'cpm'
+    LEFT JOIN normalized_expressions uq ON uq.experiment_result_id = ge.experiment_result_id
+        AND uq.version = ge.version AND uq.gene_code = ge.gene_code AND uq.sample_id = ge.sample_id
+        AND uq.method = 'uq'
+    LEFT JOIN normalized_expressions deseq2 ON deseq2.experiment_result_id = ge.experiment_result_id
+        AND deseq2.version = ge.version AND deseq2.gene_code = ge.gene_code AND deseq2.sample_id = ge.sample_id
+        AND deseq2.method = 'deseq2'
+    WHERE ge.version = er.active_version;
@@ -19,3 +19,41 @@ CREATE TABLE IF NOT EXISTS gene_expressions (
 CREATE INDEX IF NOT EXISTS idx_gene_code ON gene_expressions(gene_code);
 CREATE INDEX IF NOT EXISTS idx_sample_id ON gene_expressions(sample_id);
 CREATE INDEX IF NOT EXISTS idx_experiment_result_id ON gene_expressions(experiment_result_id);
+CREATE INDEX IF NOT EXISTS idx_experiment_sample_id ON gene_expressions(experiment_result_id, sample_id);
+
+CREATE TABLE IF NOT EXISTS normalization_runs (
+    experiment_result_id VARCHAR(255) NOT NULL REFERENCES experiment_results ON DELETE CASCADE,
+    method VARCHAR(32) NOT NULL,
+    reference_sample_id VARCHAR(255),
+    input_checksum VARCHAR(64) NOT NULL,
+    library_scale FLOAT,
+    PRIMARY KEY (experiment_result_id, method)
+);
+
+CREATE TABLE IF NOT EXISTS normalization_factors (
+    experiment_result_id VARCHAR(255) NOT NULL,
+    method VARCHAR(32) NOT NULL,
+    sample_id VARCHAR(255) NOT NULL,
+    library_size FLOAT NOT NULL,
+    norm_factor FLOAT,
+    input_checksum VARCHAR(64),
+    PRIMARY KEY (experiment_result_id, method, sample_id),
+    FOREIGN KEY (experiment_result_id, method) REFERENCES normalization_runs ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS gene_lengths (
+    assembly_id VARCHAR(255) NOT NULL,
+    gene_code VARCHAR(255) NOT NULL,
+    gene_length FLOAT NOT NULL,
+    PRIMARY KEY (assembly_id, gene_code)
+);
+
+CREATE TABLE IF NOT EXISTS ingestions (
+    ingestion_id BIGSERIAL PRIMARY KEY,
+    experiment_result_id VARCHAR(255) NOT NULL REFERENCES experiment_results ON DELETE CASCADE,
+    content_hash VARCHAR(64) NOT NULL,
+    idempotency_key VARCHAR(255),
+    n_created INTEGER NOT NULL,
+    UNIQUE (experiment_result_id, idempotency_key)
+);
+CREATE INDEX IF NOT EXISTS idx_ingestions_experiment_result_id ON ingestions(experiment_result_id);
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from fastapi import Depends
+from functools import lru_cache
+from typing import Annotated, NamedTuple
+
+from .config import ConfigDependency
+from .db import Database, DatabaseDependency
+from .logger import LoggerDependency
+from .models import GeneExpression, NormalizationMethodEnum
+
+__all__ = [
+    "GeneExpressionWriteQueue",
+    "get_write_queue",
+    "WriteQueueDependency",
+]
+
+
+class PendingWrite(NamedTuple):
+    experiment_result_id: str
+    expressions: list[GeneExpression]
+    # Normalization runs made stale by the write
+    normalizations: list[NormalizationMethodEnum]
+    future: asyncio.Future
+
+
+class GeneExpressionWriteQueue:
+    """
+    Coalesces concurrent small ingestions into bulk COPY transactions.
+
+    Submitted writes are buffered until max_rows expressions are pending, or flush_latency seconds
+    after the first pending write, then written in a single transaction.
+    Each submission is acknowledged individually: if a coalesced transaction fails, its writes are
+    retried one by one so that an invalid write does not fail the others.
+    """
+
+    def __init__(self, db: Database, logger: logging.Logger, max_rows: int, flush_latency: float):
+        self.db = db
+        self.logger = logger
+        self.max_rows = max_rows
+        self.flush_latency = flush_latency
+        self._pending: list[PendingWrite] = []
+        self._n_pending_rows = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # Keeps references to the running flushes, and serializes them to preserve the writes order
+        self._flushes: set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+
+    async def submit(
+        self,
+        experiment_result_id: str,
+        expressions: list[GeneExpression],
+        normalizations: list[NormalizationMethodEnum],
+    ) -> int:
+        """
+        Queues GeneExpressions for writing, returns the number of rows written once committed.
+        Raises a TakuanDBException if the write failed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(PendingWrite(experiment_result_id, expressions, normalizations, future))
+        self._n_pending_rows += len(expressions)
+        if self._n_pending_rows >= self.max_rows:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_latency, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._n_pending_rows = self._pending, [], 0
+        task = asyncio.create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list[PendingWrite]):
+        async with self._lock:
+            try:
+                await self._write(batch)
+                results = [(w, len(w.expressions)) for w in batch]
+            except Exception as e:
+                if len(batch) == 1:
+                    results = [(batch[0], e)]
+                else:
+                    self.logger.warning(f"Coalesced write of {len(batch)} ingestions failed, writing them one by one.")
+                    results = []
+                    for w in batch:
+                        try:
+                            await self._write([w])
+                            results.append((w, len(w.expressions)))
+                        except Exception as write_error:
+                            results.append((w, write_error))
+
+        for w, result in results:
+            if w.future.done():
+                # Cancelled by the submitter, e.g. on client disconnection
+                continue
+            if isinstance(result, Exception):
+                w.future.set_exception(result)
+            else:
+                w.future.set_result(result)
+
+    async def _write(self, batch: list[PendingWrite]):
+        expressions = merge_expressions([e for w in batch for e in w.expressions])
+        async with self.db.transaction_connection() as conn:
+            # Waits for the jobs holding the locks of the written experiments
+            await self.db.lock_experiments([w.experiment_result_id for w in batch], conn)
+            await self.db.copy_or_update_gene_expressions(expressions, conn)
+            for w in batch:
+                await self.db.delete_normalization_runs(w.experiment_result_id, w.normalizations, conn)
+        self.logger.info(f"Wrote {len(expressions)} gene expressions from {len(batch)} coalesced ingestions.")
+
+
+def merge_expressions(expressions: list[GeneExpression]) -> list[GeneExpression]:
+    """
+    Merges the GeneExpressions sharing the same key, later counts override earlier ones unless missing,
+    as if they were written one after the other.
+    """
+    merged: dict[tuple[str, str, str], GeneExpression] = {}
+    for expr in expressions:
+        key = (expr.experiment_result_id, expr.sample_id, expr.gene_code)
+        if key in merged:
+            expr = merged[key].model_copy(update=expr.model_dump(exclude_none=True))
+        merged[key] = expr
+    return list(merged.values())
+
+
+@lru_cache()
+def get_write_queue(
+    config: ConfigDependency, db: DatabaseDependency, logger: LoggerDependency
+) -> GeneExpressionWriteQueue | None:
+    if not config.ingestion_write_queue_enabled:
+        return None
+    return GeneExpressionWriteQueue(
+        db,
+        logger,
+        max_rows=config.ingestion_write_queue_max_rows,
+        flush_latency=config.ingestion_write_queue_flush_ms / 1000,
+    )
+
+
+WriteQueueDependency = Annotated[GeneExpressionWriteQueue | None, Depends(get_write_queue)]